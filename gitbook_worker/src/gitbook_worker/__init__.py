@@ -4,13 +4,9 @@ import re
 import subprocess
 import sys
 
-try:
-    import yaml
-except ImportError:  # pragma: no cover - optional dep
-    yaml = None
-
 __version__ = "2.1.1"
 
+from .metadata import load_metadata, yaml
 from .utils import (
     run,
     parse_summary,
@@ -75,19 +71,17 @@ def validate_metadata(md_files):
     if not yaml:
         logging.warning("PyYAML not installed; skipping metadata validation.")
         return issues
-    for md in md_files:
-        try:
-            with open(md, encoding="utf-8") as f:
-                content = f.read()
-            if content.startswith("---"):
-                parts = content.split("---", 2)
-                if len(parts) >= 2:
-                    meta = yaml.safe_load(parts[1])
-                    for field in ("title", "author", "date"):
-                        if field not in meta:
-                            issues.append((md, f"Missing metadata field: {field}"))
-        except Exception as e:
-            issues.append((md, f"Metadata parse error: {e}"))
+    for md, (meta, error) in load_metadata(md_files).items():
+        if error:
+            issues.append((md, f"Metadata parse error: {error}"))
+        elif meta is None:
+            continue
+        elif not isinstance(meta, dict):
+            issues.append((md, "Metadata parse error: frontmatter is not a mapping"))
+        else:
+            for field in ("title", "author", "date"):
+                if field not in meta:
+                    issues.append((md, f"Missing metadata field: {field}"))
     return issues
 
 
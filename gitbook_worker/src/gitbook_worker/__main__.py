@@ -3,17 +3,23 @@ import argparse
 import io
 import os
 import logging
+import shutil
+import time
 from datetime import datetime
 from .utils import (
     run,
     parse_summary,
-    readability_report,
+    combine_markdown,
+    split_combined_markdown,
+    strip_chapter_markers,
     wrap_wide_tables,
     validate_table_columns,
     download_remote_images,
     _write_pandoc_header,
     get_pandoc_version,
     emoji_report,
+    emoji_chapter_report,
+    _emoji_chapter_counts,
 )
 from .linkcheck import (
     check_links,
@@ -26,12 +32,86 @@ from .source_extract import extract_sources
 from .ai_tools import (
     proof_and_repair_internal_references,
     proof_and_repair_external_references,
+    AI_BATCH_SIZE,
+    AI_MAX_CONCURRENCY,
+)
+from .ai_cache import (
+    AI_CACHE_FILE,
+    AI_CACHE_MAX_AGE_DAYS,
+    AIResponseCache,
+    default_ai_cache_file,
+)
+from .rate_limit import configure_rate_limit
+from .fragments import (
+    MASTER_VARIABLES,
+    build_chapter_fragments,
+    write_highlighting_macros,
+    write_master_markdown,
+)
+from .latex_format import (
+    DOCKER_FORMAT_DIR,
+    FORMAT_VARIABLES,
+    ensure_latex_format,
+    format_engine_opt,
+)
+from .cache import hash_text, load_json, save_json
+from .repo import (
+    CLONE_STRATEGIES,
+    clone_or_update_repo,
+    default_mirror_dir,
+    has_local_changes,
+    local_head,
+)
+from .branches import branch_slug, build_branches
+from .docker_pool import WorkerContainer
+from .readability import readability_scores
+from .font_coverage import check_font_coverage, format_coverage_report
+from .emoji_images import (
+    EMOJI_VARIABLES,
+    EmojiImageCache,
+    find_emoji_font,
+    write_emoji_image_markdown,
+)
+from .draft import (
+    compare_with_full_build,
+    record_build_time,
+    run_single_tex_pass,
+    split_engine_opts,
+    write_proxy_markdown,
+)
+from .docker_tools import ensure_docker_image, ensure_docker_desktop, ensure_tex_cache
+from .pandoc_utils import (
+    DOCKER_TEMP_DIR,
+    FORMAT_EXTENSIONS,
+    PDF_ENGINES,
+    build_docker_pandoc_cmd,
+    docker_pandoc_run_args,
+    build_pandoc_cmd,
+    output_path_for_format,
+    pandoc_ast_path,
+    run_pandoc,
+    run_pandoc_formats,
+    select_pdf_engine,
 )
-from .repo import clone_or_update_repo
-from .docker_tools import ensure_docker_image, ensure_docker_desktop
-from .pandoc_utils import build_docker_pandoc_cmd, build_pandoc_cmd, run_pandoc
 from . import lint_markdown, validate_metadata, spellcheck
 
+# Options that work on the combined markdown after the build.
+CHECK_OPTIONS = (
+    "export_sources",
+    "check_links",
+    "markdownlint",
+    "check_images",
+    "readability",
+    "metadata",
+    "duplicate_headings",
+    "citations",
+    "todos",
+    "spellcheck",
+    "emoji_report",
+    "fix_internal_links",
+    "fix_external_references",
+)
+
 
 def main():
 
@@ -50,12 +130,103 @@ def main():
         action="store_true",
         help="Execute the PDF-build in a docker container.",
     )
+    parser.add_argument(
+        "--docker-pool",
+        action="store_true",
+        help="Keep a warm pandoc container running and dispatch builds to it "
+        "with docker exec instead of starting a new container each time.",
+    )
+    parser.add_argument(
+        "--docker-idle-timeout",
+        type=int,
+        default=900,
+        help="Seconds without builds after which the warm container stops.",
+    )
+    parser.add_argument(
+        "--pdf-engine",
+        choices=list(PDF_ENGINES) + ["auto"],
+        default="lualatex",
+        help="LaTeX engine for the PDF. 'auto' uses pdflatex when the book has "
+        "no emoji or other characters outside pdflatex's input encoding.",
+    )
+    parser.add_argument(
+        "--draft",
+        nargs="?",
+        const="pdf",
+        choices=["pdf", "html"],
+        default=None,
+        help="Fast preview instead of the full build: a PDF without TOC from a "
+        "single TeX pass with low-resolution images, or an HTML preview "
+        "(--draft html). Local builds only.",
+    )
+    parser.add_argument(
+        "--draft-no-emoji",
+        action="store_true",
+        help="Skip the emoji font fallback in --draft PDFs.",
+    )
+    parser.add_argument(
+        "--emoji-images",
+        action="store_true",
+        help="Replace emoji by cached pre-rendered images instead of the slow "
+        "emoji font fallback (PDF only, requires Pillow).",
+    )
+    parser.add_argument(
+        "--emoji-font-file",
+        type=str,
+        default="",
+        help="Emoji font rendered by --emoji-images (default: installed OpenMoji, "
+        "Noto Color Emoji or Segoe UI Emoji).",
+    )
+    parser.add_argument(
+        "--font-precheck",
+        nargs="?",
+        const="error",
+        choices=["warn", "error"],
+        default=None,
+        help="Check before running pandoc that the configured fonts cover all "
+        "characters of the book; 'error' (default) stops the build on gaps.",
+    )
+    parser.add_argument(
+        "--pandoc-timeout",
+        type=float,
+        default=None,
+        help="Kill a pandoc/LaTeX run after this many seconds (default: no limit).",
+    )
+    parser.add_argument(
+        "--pandoc-log-tail",
+        type=int,
+        default=64,
+        help="Kilobytes of pandoc output kept in memory for the error log.",
+    )
+    parser.add_argument(
+        "--pandoc-verbose",
+        action="store_true",
+        help="Run pandoc with --verbose to stream LaTeX runs and page progress.",
+    )
+    parser.add_argument(
+        "--no-tex-cache",
+        action="store_true",
+        help="Do not keep the TeX/luaotfload font caches between Docker builds.",
+    )
+    parser.add_argument(
+        "--tex-cache-dir",
+        type=str,
+        default="",
+        help="Host directory for the Docker TeX caches instead of a managed volume.",
+    )
     parser.add_argument(
         "--pdf",
         type=str,
         default="",
         help="Export a pdf. (Path File) name for the output PDF.",
     )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        default="pdf",
+        help="Comma separated output formats built from --pdf (pdf, html, epub). "
+        "Several formats share one cached pandoc parse and are written in parallel.",
+    )
     parser.add_argument(
         "-o",
         "--out-dir",
@@ -75,6 +246,53 @@ def main():
         action="store_true",
         help="Overwrite existing clone directory without prompting.",
     )
+    parser.add_argument(
+        "--mirror",
+        action="store_true",
+        help="Fetch the branch into a shared local bare mirror first and let the "
+        "clone borrow its objects, so they are downloaded once per host.",
+    )
+    parser.add_argument(
+        "--mirror-dir",
+        type=str,
+        default="",
+        help="Directory of the bare mirrors used by --mirror "
+        "(default: ~/.cache/gitbook-worker/mirrors).",
+    )
+    parser.add_argument(
+        "--branches",
+        type=str,
+        default="",
+        help="Comma separated branches to build concurrently, each in its own "
+        "git worktree of the clone with outputs in <out-dir>/<branch>. The "
+        "cache directory is shared by all branch builds.",
+    )
+    parser.add_argument(
+        "--branch-jobs",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent branch builds (default: all).",
+    )
+    parser.add_argument(
+        "--use-existing-clone",
+        action="store_true",
+        help="Build the checkout in --clone-dir as is without cloning or "
+        "updating it.",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Skip the build if the branch has not moved since the last "
+        "successful build with the same options and its outputs still exist.",
+    )
+    parser.add_argument(
+        "--clone-strategy",
+        choices=CLONE_STRATEGIES,
+        default="full",
+        help="How much of the repository to clone: full history, shallow (tip "
+        "only), partial (blobs on demand) or sparse (only SUMMARY.md, its "
+        "chapters and their image directories).",
+    )
     parser.add_argument(
         "-q",
         "--temp-dir",
@@ -82,6 +300,24 @@ def main():
         default="temp",
         help="Directory to place all temp results into.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default="",
+        help="Directory for build caches kept between runs (default: <temp-dir>/cache).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Convert each chapter to a cached LaTeX fragment and assemble the PDF "
+        "from them, so only changed chapters go through pandoc (local PDF builds).",
+    )
+    parser.add_argument(
+        "--precompile-preamble",
+        action="store_true",
+        help="Dump the LaTeX preamble (template and header packages) into a "
+        "cached precompiled format and reuse it on later builds.",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -142,6 +378,11 @@ def main():
     parser.add_argument(
         "-r", "--readability", action="store_true", help="Generate readability report."
     )
+    parser.add_argument(
+        "--readability-sections",
+        action="store_true",
+        help="Also score every section of a chapter with --readability.",
+    )
     parser.add_argument(
         "-d", "--metadata", action="store_true", help="Validate YAML metadata."
     )
@@ -200,6 +441,54 @@ def main():
         action="store_true",
         help="Proof and repair external references using AI.",
     )
+    parser.add_argument(
+        "--ai-max-concurrency",
+        type=int,
+        default=AI_MAX_CONCURRENCY,
+        help="Maximum number of AI requests in flight at the same time "
+        f"(default: {AI_MAX_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--no-ai-triage",
+        action="store_true",
+        help="Send every reference to the AI service instead of checking lone "
+        "links, DOIs and ISBNs locally first.",
+    )
+    parser.add_argument(
+        "--ai-batch-size",
+        type=int,
+        default=AI_BATCH_SIZE,
+        help="Number of references checked with one AI request; references "
+        "missing in a batch answer are asked for one by one "
+        f"(default: {AI_BATCH_SIZE}).",
+    )
+    parser.add_argument(
+        "--ai-requests-per-minute",
+        type=float,
+        default=0,
+        help="Requests per minute allowed by the AI provider; all concurrent "
+        "requests share this limit (default: 0, unlimited).",
+    )
+    parser.add_argument(
+        "--ai-tokens-per-minute",
+        type=float,
+        default=0,
+        help="Estimated prompt tokens per minute allowed by the AI provider "
+        "(default: 0, unlimited).",
+    )
+    parser.add_argument(
+        "--ai-cache-days",
+        type=float,
+        default=AI_CACHE_MAX_AGE_DAYS,
+        help="Days for which AI answers to unchanged references are reused "
+        f"(default: {AI_CACHE_MAX_AGE_DAYS}, 0 disables the cache).",
+    )
+    parser.add_argument(
+        "--refresh-ai",
+        action="store_true",
+        help="Ask the AI service again for every reference and update the "
+        "cached answers.",
+    )
 
     try:
         args = parser.parse_args()
@@ -251,16 +540,70 @@ def main():
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
     temp_dir = os.path.abspath(temp_dir)
+    cache_dir = os.path.abspath(args.cache_dir or os.path.join(temp_dir, "cache"))
+    os.makedirs(cache_dir, exist_ok=True)
 
     # Clone or update repository
     clone_dir = args.clone_dir  # resolve path
     clone_dir = os.path.abspath(clone_dir)
-    clone_or_update_repo(
-        args.repo_url,
-        clone_dir,
-        branch_name=args.branch,
-        force=args.force,
+    if args.use_existing_clone:
+        # The build key below only contains the commit, so a checkout with
+        # local edits always counts as changed.
+        repo_state = {
+            "head": local_head(clone_dir),
+            "changed": has_local_changes(clone_dir),
+        }
+    else:
+        repo_state = clone_or_update_repo(
+            args.repo_url,
+            clone_dir,
+            branch_name=args.branch,
+            force=args.force,
+            strategy=args.clone_strategy,
+            mirror_dir=(
+                (args.mirror_dir or default_mirror_dir()) if args.mirror else None
+            ),
+        )
+
+    if args.branches:
+        branches = [b.strip() for b in args.branches.split(",") if b.strip()]
+        codes = build_branches(
+            sys.argv[1:],
+            branches,
+            clone_dir,
+            temp_dir,
+            out_dir,
+            cache_dir,
+            max_workers=args.branch_jobs,
+            shallow=args.clone_strategy == "shallow",
+            sparse=args.clone_strategy == "sparse",
+        )
+        sys.exit(1 if any(codes.values()) else 0)
+
+    # Builds are keyed by the checked out commit and the options used.
+    # One file per branch, as branch builds share the cache directory.
+    last_build_file = os.path.join(
+        cache_dir, f"last_build_{branch_slug(args.branch)}.json"
     )
+    build_key = hash_text(repo_state["head"], sorted(vars(args).items()))
+    previous_outputs = []
+    if args.skip_unchanged and not repo_state["changed"] and repo_state["head"]:
+        last_build = load_json(last_build_file, {})
+        if last_build.get("key") == build_key and all(
+            os.path.isfile(p) for p in last_build.get("outputs", [])
+        ):
+            previous_outputs = last_build["outputs"]
+    if (
+        args.pdf
+        and previous_outputs
+        and not any(getattr(args, o) for o in CHECK_OPTIONS)
+    ):
+        # Nothing to do: skip combining, image downloads and validation.
+        logging.info(
+            "Nothing changed since the last build, keeping %s",
+            ", ".join(previous_outputs),
+        )
+        return
 
     # Parse SUMMARY.md
     summary_path = os.path.join(clone_dir, "SUMMARY.md")
@@ -276,14 +619,7 @@ def main():
     combined_md = os.path.join(temp_dir, f"combined_{run_timestamp}.md")
     logging.info(f"combining gitbook markdowns into one file: %s ...", combined_md)
     try:
-        with open(combined_md, "w", encoding="utf-8") as out:
-            for md in md_files:
-                if os.path.isfile(md):
-                    with open(md, encoding="utf-8") as mdf:
-                        out.write(mdf.read())
-                        out.write("\n\n")
-                else:
-                    logging.warning("Skipping missing file: %s", md)
+        combine_markdown(md_files, combined_md, clone_dir)
     except Exception as e:
         logging.error("Failed to write combined markdown: %s", e)
         sys.exit(1)
@@ -291,7 +627,9 @@ def main():
 
     logging.info("Fetching remote images referenced in markdown...")
     img_dir = os.path.join(temp_dir, "images")
-    downloaded = download_remote_images(combined_md, img_dir)
+    downloaded = download_remote_images(
+        combined_md, img_dir, cache_dir=os.path.join(cache_dir, "remote_images")
+    )
     logging.info("Downloaded %s remote images", downloaded)
 
     # Validate table column consistency before further processing
@@ -307,13 +645,99 @@ def main():
     logging.info("All markdown files processed successfully.")
 
     # Build PDF
-    if args.pdf:
+    if args.pdf and previous_outputs:
+        logging.info(
+            "Nothing changed since the last build, keeping %s",
+            ", ".join(previous_outputs),
+        )
+    elif args.pdf:
         pdf_output = args.pdf
         # Remove .pdf extension if present
         if pdf_output.endswith(".pdf"):
             pdf_output = pdf_output[:-4]
         # Add timestamp to output filename
         pdf_output = f"{pdf_output}_{run_timestamp}.pdf"
+        formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+        unknown = [f for f in formats if f not in FORMAT_EXTENSIONS or f == "json"]
+        if not formats or unknown:
+            logging.error("Unsupported output format(s): %s", ", ".join(unknown))
+            sys.exit(2)
+        source_md = combined_md
+        pdf_engine = select_pdf_engine(args.pdf_engine, combined_md)
+        logging.info("Using PDF engine: %s", pdf_engine)
+        draft = args.draft
+        if draft and args.use_docker:
+            logging.warning("--draft is not supported with --use-docker")
+            draft = None
+        skip_emoji = draft == "pdf" and args.draft_no_emoji
+        build_start = time.perf_counter()
+        emoji_extra = []
+        if args.emoji_images and (formats != ["pdf"] or draft == "html"):
+            logging.warning("--emoji-images only applies to single PDF builds")
+        elif args.emoji_images:
+            font_file = args.emoji_font_file or find_emoji_font()
+            try:
+                if not font_file:
+                    raise RuntimeError("no emoji font found")
+                emoji_md = os.path.join(temp_dir, f"emoji_{run_timestamp}.md")
+                container_dir = None
+                if args.use_docker:
+                    container_dir = f"{DOCKER_TEMP_DIR}/emoji"
+                replaced, missing = write_emoji_image_markdown(
+                    combined_md,
+                    emoji_md,
+                    EmojiImageCache(font_file),
+                    os.path.join(temp_dir, "emoji"),
+                    container_dir=container_dir,
+                )
+            except Exception as e:
+                logging.warning("Emoji images disabled: %s", e)
+            else:
+                source_md = emoji_md
+                emoji_extra = EMOJI_VARIABLES
+                # No font fallback needed once every emoji is an image; keep
+                # it for emoji whose image could not be rendered.
+                skip_emoji = (replaced > 0 and not missing) or skip_emoji
+        if args.font_precheck and "pdf" in formats and draft != "html":
+            if args.use_docker or pdf_engine == "pdflatex":
+                # The fonts live in the image or are not selected by family.
+                logging.warning("--font-precheck only applies to local Unicode engines")
+            else:
+                # Only lualatex gets the emoji font as a real font fallback
+                # (mainfontfallback or the luaotfload header).
+                fallback = []
+                if pdf_engine == "lualatex" and not skip_emoji:
+                    fallback = ["Segoe UI Emoji"]
+                issues, missing_fonts = check_font_coverage(
+                    source_md,
+                    [args.main_font, args.sans_font],
+                    [args.mono_font],
+                    fallback,
+                )
+                for font in missing_fonts:
+                    logging.warning("Font precheck: font not found: %s", font)
+                # A missing fallback font is optional (\IfFontExistsTF).
+                missing_required = [f for f in missing_fonts if f not in fallback]
+                report_file = os.path.join(out_dir, f"font_coverage_{run_timestamp}.md")
+                with open(report_file, "w", encoding="utf-8") as rf:
+                    rf.write(format_coverage_report(issues, missing_fonts))
+                for issue in issues:
+                    chapter, line = issue["locations"][0]
+                    logging.warning(
+                        "Font precheck: %s (%s %s) not in %s, first at %s:%s",
+                        issue["char"],
+                        issue["codepoint"],
+                        issue["name"],
+                        issue["fonts"],
+                        chapter,
+                        line,
+                    )
+                if issues:
+                    logging.warning(
+                        "%s uncovered characters, see %s", len(issues), report_file
+                    )
+                if args.font_precheck == "error" and (issues or missing_required):
+                    sys.exit(1)
         # Build PDF with Pandoc
         if args.use_docker:
             # Docker-Workflow
@@ -323,9 +747,22 @@ def main():
                 os.path.dirname(__file__),
                 "Dockerfile",
             )
-            ensure_docker_image("erda-pandoc", dockerfile_path)
+            image_id = ensure_docker_image("erda-pandoc", dockerfile_path)
+            if args.incremental:
+                logging.warning("--incremental is not supported with --use-docker")
+            tex_cache = None
+            if not args.no_tex_cache:
+                try:
+                    tex_cache = ensure_tex_cache(
+                        "erda-pandoc", args.tex_cache_dir, image_id=image_id
+                    )
+                    logging.info("Using TeX cache: %s", tex_cache)
+                except Exception as e:
+                    logging.warning("TeX cache disabled: %s", e)
             logging.info("Preparing pandoc header tex file...")
             emoji_font = "OpenMoji Color" if args.emoji_color else "OpenMoji Black"
+            if skip_emoji:
+                emoji_font = ""
             try:
                 header_file = _write_pandoc_header(
                     temp_dir,
@@ -335,8 +772,10 @@ def main():
                     args.main_font,
                     args.wrap_wide_tables,
                     args.table_threshold,
-                    combined_md,
+                    source_md,
                     disable_longtable=args.disable_longtable,
+                    precompile_marker=args.precompile_preamble,
+                    pdf_engine=pdf_engine,
                 )
             except Exception as e:
                 logging.error("Failed to write pandoc header tex file: %s", e)
@@ -344,7 +783,7 @@ def main():
             wide_tables = False
             if args.wrap_wide_tables:
                 try:
-                    with open(combined_md, encoding="utf-8") as cf:
+                    with open(source_md, encoding="utf-8") as cf:
                         if "::: {.landscape" in cf.read():
                             logging.info("Wide tables detected in markdown")
                             wide_tables = True
@@ -361,17 +800,60 @@ def main():
                 )
             if wide_tables and args.wrap_wide_tables:
                 logging.info("Converting tables to ltablex via landscape.lua")
-            docker_cmd = build_docker_pandoc_cmd(
-                out_dir,
-                temp_dir,
-                clone_dir,
-                combined_md,
-                pdf_output,
-                header_file,
-                filter_paths,
-            )
-            logging.info("Docker command: %s", docker_cmd)
-            out, err, code = run_pandoc(docker_cmd)
+            docker_extra = list(emoji_extra)
+            docker_volumes = []
+            if args.precompile_preamble:
+                fmt_file = ensure_latex_format(
+                    header_file,
+                    cache_dir,
+                    engine=pdf_engine,
+                    extra_args=FORMAT_VARIABLES,
+                    docker_image="erda-pandoc",
+                )
+                if fmt_file:
+                    docker_extra += MASTER_VARIABLES + [
+                        format_engine_opt(fmt_file, docker=True)
+                    ]
+                    docker_volumes = [(os.path.dirname(fmt_file), DOCKER_FORMAT_DIR)]
+            container = None
+            if args.docker_pool:
+                container = WorkerContainer(
+                    "erda-pandoc",
+                    docker_pandoc_run_args(
+                        out_dir,
+                        temp_dir,
+                        clone_dir,
+                        filter_paths,
+                        docker_volumes,
+                        tex_cache,
+                    ),
+                    idle_timeout=args.docker_idle_timeout,
+                    image_id=image_id,
+                )
+                try:
+                    container.start()
+                except Exception as e:
+                    logging.warning("Warm container unavailable, using docker run: %s", e)
+                    container = None
+
+            def make_cmd(source, output, fmt, filters=True):
+                docker_cmd = build_docker_pandoc_cmd(
+                    out_dir,
+                    temp_dir,
+                    clone_dir,
+                    source,
+                    output,
+                    header_file,
+                    filter_paths if filters else None,
+                    output_format=fmt,
+                    extra_args=docker_extra if fmt == "pdf" else None,
+                    volumes=docker_volumes,
+                    tex_cache=tex_cache,
+                    container=container.ensure() if container else None,
+                    pdf_engine=pdf_engine,
+                )
+                logging.info("Docker command: %s", docker_cmd)
+                return docker_cmd
         else:
             # Non-Docker workflow
             logging.info("Building PDF with Pandoc...")
@@ -398,45 +880,51 @@ def main():
                         args.main_font,
                         args.wrap_wide_tables,
                         args.table_threshold,
-                        combined_md,
+                        source_md,
                         write_mainfont=False,
                         disable_longtable=args.disable_longtable,
+                        precompile_marker=args.precompile_preamble,
+                        pdf_engine=pdf_engine,
                     )
                 except Exception as e:
                     logging.error("Failed to write pandoc header tex file: %s", e)
                     sys.exit(1)
-                extra = [
-                    "-V",
-                    "mainfontfallback=Segoe UI Emoji:mode=harf",
-                    "-V",
-                    f"mainfont={args.main_font}",
-                    "-V",
-                    f"sansfont={args.sans_font}",
-                    "-V",
-                    f"monofont={args.mono_font}",
-                ]
+                extra = list(emoji_extra)
+                if pdf_engine == "lualatex" and not skip_emoji:
+                    extra += ["-V", "mainfontfallback=Segoe UI Emoji:mode=harf"]
+                if pdf_engine != "pdflatex":
+                    extra += [
+                        "-V",
+                        f"mainfont={args.main_font}",
+                        "-V",
+                        f"sansfont={args.sans_font}",
+                        "-V",
+                        f"monofont={args.mono_font}",
+                    ]
             else:
                 logging.info("Using manual Segoe UI Emoji fallback")
                 try:
                     header_file = _write_pandoc_header(
                         temp_dir,
-                        "Segoe UI Emoji",
+                        "" if skip_emoji else "Segoe UI Emoji",
                         args.sans_font,
                         args.mono_font,
                         args.main_font,
                         args.wrap_wide_tables,
                         args.table_threshold,
-                        combined_md,
+                        source_md,
                         disable_longtable=args.disable_longtable,
+                        precompile_marker=args.precompile_preamble,
+                        pdf_engine=pdf_engine,
                     )
                 except Exception as e:
                     logging.error("Failed to write pandoc header tex file: %s", e)
                     sys.exit(1)
-                extra = []
+                extra = list(emoji_extra)
             wide_tables = False
             if args.wrap_wide_tables:
                 try:
-                    with open(combined_md, encoding="utf-8") as cf:
+                    with open(source_md, encoding="utf-8") as cf:
                         if "::: {.landscape" in cf.read():
                             logging.info("Wide tables detected in markdown")
                             wide_tables = True
@@ -444,27 +932,202 @@ def main():
                     logging.error("Failed to inspect markdown for wide tables: %s", e)
             if wide_tables and args.wrap_wide_tables:
                 logging.info("Converting tables to ltablex via landscape.lua")
-            pandoc_cmd = build_pandoc_cmd(
-                combined_md,
-                pdf_output,
+            if args.incremental and formats == ["pdf"] and not draft:
+                logging.info("Converting chapters to cached LaTeX fragments...")
+                fragments, fragment_errors = build_chapter_fragments(
+                    split_combined_markdown(source_md),
+                    cache_dir,
+                    clone_dir,
+                    filter_paths,
+                    pandoc_version=version,
+                )
+                if fragment_errors:
+                    for err in fragment_errors:
+                        logging.error(err)
+                    logging.error("Chapter fragment conversion failed.")
+                    sys.exit(1)
+                source_md = write_master_markdown(
+                    fragments, os.path.join(temp_dir, f"master_{run_timestamp}.md")
+                )
+                extra = extra + MASTER_VARIABLES
+                extra += ["-H", write_highlighting_macros(cache_dir, version)]
+                logging.info("Assembling PDF from %s fragments", len(fragments))
+            elif args.incremental:
+                logging.warning("--incremental only applies to single PDF builds")
+            if args.precompile_preamble:
+                fmt_file = ensure_latex_format(
+                    header_file,
+                    cache_dir,
+                    engine=pdf_engine,
+                    extra_args=FORMAT_VARIABLES + extra,
+                )
+                if fmt_file:
+                    extra = extra + MASTER_VARIABLES + [format_engine_opt(fmt_file)]
+
+            def make_cmd(source, output, fmt, filters=True):
+                # The variables and engine options in ``extra`` are LaTeX only.
+                return build_pandoc_cmd(
+                    source,
+                    output,
+                    clone_dir,
+                    header_file,
+                    filter_paths if filters else None,
+                    extra if fmt == "pdf" else None,
+                    output_format=fmt,
+                    pdf_engine=pdf_engine,
+                )
+
+        if not draft and any(fmt != "pdf" for fmt in formats):
+            # HTML and EPUB keep raw HTML comments, so the chapter markers
+            # would end up in the published book.
+            source_md = strip_chapter_markers(
+                source_md, os.path.join(temp_dir, f"published_{run_timestamp}.md")
+            )
+        outputs = {fmt: output_path_for_format(pdf_output, fmt) for fmt in formats}
+        if args.pandoc_verbose:
+            build_cmd = make_cmd
+
+            def make_cmd(source, output, fmt, filters=True):
+                return build_cmd(source, output, fmt, filters) + ["--verbose"]
+
+        run_opts = {
+            "timeout": args.pandoc_timeout,
+            "tail_bytes": args.pandoc_log_tail * 1024,
+        }
+        if draft:
+            # Preview build: proxies for the images, no TOC and for PDFs a
+            # single TeX run instead of pandoc's multi-pass PDF build.
+            draft_dir = os.path.join(temp_dir, "draft")
+            os.makedirs(draft_dir, exist_ok=True)
+            draft_md = os.path.join(draft_dir, f"draft_{run_timestamp}.md")
+            write_proxy_markdown(
+                source_md,
+                draft_md,
                 clone_dir,
-                header_file,
-                filter_paths,
-                extra,
+                os.path.join(cache_dir, "image_proxies"),
             )
-            out, err, code = run_pandoc(pandoc_cmd)
-        if out:
-            logging.info("Pandoc stdout:\n%s", out)
-        if err:
-            logging.warning("Pandoc stderr:\n%s", err)
-        if code != 0:
-            logging.error("Pandoc failed with exit code %s", code)
-            log_file = os.path.join(out_dir, f"pandoc_error_{run_timestamp}.log")
-            with open(log_file, "w", encoding="utf-8") as lf:
-                lf.write(err)
-            logging.error("Pandoc errors logged to %s", log_file)
-            sys.exit(code)
-        logging.info("PDF generated: %s", pdf_output)
+            formats = [draft]
+            outputs = {draft: output_path_for_format(pdf_output, draft)}
+            if draft == "html":
+                results = {
+                    "html": run_pandoc(
+                        build_pandoc_cmd(
+                            draft_md,
+                            outputs["html"],
+                            clone_dir,
+                            header_file,
+                            filter_paths,
+                            output_format="html",
+                            toc=False,
+                        ),
+                        **run_opts,
+                    )
+                }
+            else:
+                pandoc_args, engine_opts = split_engine_opts(extra)
+                tex_file = os.path.join(draft_dir, f"draft_{run_timestamp}.tex")
+                media_dir = os.path.join(draft_dir, "media")
+                results = {
+                    "tex": run_pandoc(
+                        build_pandoc_cmd(
+                            draft_md,
+                            tex_file,
+                            clone_dir,
+                            header_file,
+                            filter_paths,
+                            pandoc_args
+                            + ["--standalone", f"--extract-media={media_dir}"],
+                            pdf_engine=pdf_engine,
+                            toc=False,
+                        ),
+                        **run_opts,
+                    )
+                }
+                if results["tex"][2] == 0:
+                    results = {
+                        "pdf": run_single_tex_pass(
+                            tex_file, pdf_engine, engine_opts, **run_opts
+                        )
+                    }
+                    draft_pdf = os.path.splitext(tex_file)[0] + ".pdf"
+                    if os.path.isfile(draft_pdf):
+                        shutil.move(draft_pdf, outputs["pdf"])
+                        if results["pdf"][2] != 0:
+                            # nonstopmode skipped over TeX errors; the
+                            # preview is still worth looking at.
+                            logging.warning("Draft PDF has TeX errors, see log")
+                            results["pdf"] = results["pdf"][:2] + (0,)
+        elif len(formats) == 1:
+            fmt = formats[0]
+            results = {
+                fmt: run_pandoc(make_cmd(source_md, outputs[fmt], fmt), **run_opts)
+            }
+        else:
+            # Parse the markdown once into pandoc's JSON AST and run the Lua
+            # filters once on a copy for the PDF writer; they are LaTeX
+            # specific, so HTML and EPUB are written from the plain AST. The
+            # writers run without filters. The ASTs live in the temp dir and
+            # are keyed by content and filters, so unchanged books skip the
+            # parse entirely.
+            ast_file = pandoc_ast_path(source_md, temp_dir)
+            sources = {fmt: ast_file for fmt in formats}
+            steps = [(source_md, ast_file, False)]
+            if filter_paths and "pdf" in formats:
+                sources["pdf"] = pandoc_ast_path(
+                    source_md, temp_dir, filter_paths=filter_paths
+                )
+                steps.append((ast_file, sources["pdf"], True))
+            results = {}
+            for source, ast, filters in steps:
+                if os.path.isfile(ast):
+                    logging.info("Reusing cached pandoc AST: %s", ast)
+                    continue
+                logging.info("Writing pandoc AST: %s", ast)
+                results = {
+                    "json": run_pandoc(
+                        make_cmd(source, ast, "json", filters), **run_opts
+                    )
+                }
+                if results["json"][2] != 0:
+                    if os.path.exists(ast):
+                        os.remove(ast)
+                    break
+            if all(os.path.isfile(ast) for ast in sources.values()):
+                results = run_pandoc_formats(
+                    {
+                        fmt: make_cmd(sources[fmt], outputs[fmt], fmt, False)
+                        for fmt in formats
+                    },
+                    **run_opts,
+                )
+        # The output was already streamed into the log by run_pandoc; only
+        # the kept tail is written to the error file.
+        for fmt, (out, err, code) in results.items():
+            if code != 0:
+                logging.error("Pandoc failed with exit code %s", code)
+                suffix = "" if len(results) == 1 else f"_{fmt}"
+                log_file = os.path.join(
+                    out_dir, f"pandoc_error{suffix}_{run_timestamp}.log"
+                )
+                with open(log_file, "w", encoding="utf-8") as lf:
+                    if out:
+                        lf.write(out)
+                        lf.write("\n")
+                    lf.write(err)
+                logging.error("Pandoc errors logged to %s", log_file)
+                sys.exit(code)
+        for fmt in formats:
+            logging.info("%s generated: %s", fmt.upper(), outputs[fmt])
+        build_seconds = time.perf_counter() - build_start
+        if draft:
+            logging.info(
+                compare_with_full_build(cache_dir, f"draft {draft}", build_seconds)
+            )
+        elif "pdf" in formats:
+            record_build_time(cache_dir, "full", build_seconds)
+        if not draft and repo_state["head"]:
+            paths = [os.path.abspath(p) for p in outputs.values()]
+            save_json(last_build_file, {"key": build_key, "outputs": paths})
 
     # Run quality checks based on flags
     if args.export_sources:
@@ -478,10 +1141,11 @@ def main():
         except Exception as e:
             logging.error("export-sources failed: %s", e)
             logger.error("Error exporting sources: %s", e)
+    link_status = None
     if args.check_links:
         logging.info("check-links started")
         try:
-            check_links(
+            link_status = check_links(
                 md_files,
                 os.path.join(current_dir, f"report_check_links_{run_timestamp}.csv"),
             )
@@ -511,9 +1175,21 @@ def main():
     if args.readability:
         logging.info("readability started")
         try:
-            scores = readability_report(md_files)
-            for sc in scores:
-                logger.info("Readability: %s", sc)
+            scores = readability_scores(
+                md_files, cache_dir=cache_dir, sections=args.readability_sections
+            )
+            for md, result in scores.items():
+                logger.info("Readability: %s", (md, result["fre"], result["fk"]))
+                for section in result.get("sections", []):
+                    logger.info(
+                        "Readability: %s:%s %s (%s words): %s / %s",
+                        md,
+                        section["line"],
+                        section["heading"] or "-",
+                        section["words"],
+                        section["fre"],
+                        section["fk"],
+                    )
             logging.info("readability done")
         except Exception as e:
             logging.error("readability failed: %s", e)
@@ -570,13 +1246,18 @@ def main():
     if args.emoji_report:
         logging.info("emoji-report started")
         try:
-            counts, table_md = emoji_report(combined_md)
+            # Scan the file once; the totals are summed from the chapters.
+            chapters = _emoji_chapter_counts(combined_md)
+            counts, table_md = emoji_report(combined_md, chapters)
             for name, count in counts.items():
                 logger.info("Emoji %s: %s", name, count)
+            _, chapter_table_md = emoji_chapter_report(combined_md, chapters)
             report_filename = os.path.join(out_dir, f"emoji_report_{run_timestamp}.md")
             with open(report_filename, "w", encoding="utf-8") as rf:
                 rf.write("# Emoji Report\n\n")
                 rf.write(table_md + "\n")
+                rf.write("\n## Per Chapter\n\n")
+                rf.write(chapter_table_md + "\n")
             logger.info("Emoji report written to %s", report_filename)
             logging.info("emoji-report done")
         except Exception as e:
@@ -624,6 +1305,18 @@ def main():
             logger.error("Error fixing internal links: %s", e)
     if args.fix_external_references:
         logging.info("fix-external-references started")
+        configure_rate_limit(
+            args.ai_provider, args.ai_requests_per_minute, args.ai_tokens_per_minute
+        )
+        ai_cache = None
+        if args.ai_cache_days > 0:
+            ai_cache = AIResponseCache(
+                os.path.join(args.cache_dir, AI_CACHE_FILE)
+                if args.cache_dir
+                else default_ai_cache_file(),
+                max_age_days=args.ai_cache_days,
+                refresh=args.refresh_ai,
+            )
         try:
             report = proof_and_repair_external_references(
                 md_files,
@@ -631,6 +1324,11 @@ def main():
                 ai_url=args.ai_url,
                 ai_api_key=args.ai_api_key,
                 ai_provider=args.ai_provider,
+                max_concurrency=args.ai_max_concurrency,
+                cache=ai_cache,
+                batch_size=args.ai_batch_size,
+                triage=not args.no_ai_triage,
+                link_status=link_status,
             )
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             report_filename = os.path.join(
@@ -640,6 +1338,11 @@ def main():
                 rf.write(
                     f"# External Reference Proof and Repair Report\nGenerated: {datetime.now().isoformat()}\n\n"
                 )
+                checked_locally = sum(e.get("checked_by") == "local" for e in report)
+                rf.write(
+                    f"AI requests avoided by local triage: {checked_locally} of "
+                    f"{len(report)} references\n\n"
+                )
                 for e in report:
                     rf.write(f"- Action: {e['action']}\n")
                     rf.write(f"  - File: {e['file']}\n")
@@ -650,6 +1353,8 @@ def main():
                         rf.write(f"  - Error: {e['error']}\n")
                     if "new" in e:
                         rf.write(f"  - New: {e['new']}\n")
+                    if "checked_by" in e:
+                        rf.write(f"  - Checked By: {e['checked_by']}\n")
                     rf.write("\n")
             logger.info("Report generated: %s", report_filename)
             logging.info(
@@ -0,0 +1,114 @@
+"""On-disk cache of AI answers to citation checks.
+
+Checking a reference costs an AI request. The parsed answer is stored under a
+key of provider, model, prompt template and reference line, so rerunning
+``--fix-external-references`` only asks for new or changed references and
+for answers older than the expiry age."""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from .cache import hash_text, load_json, save_json
+from .structured_output import validate_json
+from .toolchain import default_cache_file
+
+# Days after which a cached answer is asked again
+AI_CACHE_MAX_AGE_DAYS = 30
+
+AI_CACHE_FILE = "ai_responses.json"
+
+# Bump when the stored entries change so old answers are not reused.
+# 2: answers are validated against the JSON schema of the request.
+AI_CACHE_VERSION = 2
+
+
+def default_ai_cache_file() -> str:
+    """Return the per-user file of cached AI answers."""
+    return os.path.join(os.path.dirname(default_cache_file()), AI_CACHE_FILE)
+
+
+def ai_cache_key(
+    provider: str, model: str, prompt_template: str, reference_line: str
+) -> str:
+    """Return the cache key of one reference check."""
+    return hash_text(
+        AI_CACHE_VERSION,
+        provider.lower(),
+        model,
+        hash_text(prompt_template),
+        reference_line,
+    )
+
+
+class AIResponseCache:
+    """Parsed AI answers stored in the JSON file ``path``.
+
+    Entries older than ``max_age_days`` are treated as missing. With
+    ``refresh`` every lookup misses, but new answers are still stored. The
+    cache is safe to use from several threads; call ``save`` to write it."""
+
+    def __init__(
+        self,
+        path: str,
+        max_age_days: float = AI_CACHE_MAX_AGE_DAYS,
+        refresh: bool = False,
+    ):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.refresh = refresh
+        self._entries: Dict[str, Dict[str, Any]] = load_json(path, {})
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("stored", 0) <= self.max_age
+
+    def get(
+        self, key: str, schema: Dict[str, Any] | None = None
+    ) -> Dict[str, Any] | None:
+        """Return the cached answer of ``key`` or ``None``.
+
+        With ``schema`` an answer violating it is dropped and treated as
+        missing, just like an invalid answer of the AI service."""
+        if self.refresh:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or not self._fresh(entry):
+                return None
+            errors = validate_json(entry.get("result"), schema) if schema else []
+            if errors:
+                logging.warning(
+                    "Ignoring invalid cached AI answer: %s", "; ".join(errors)
+                )
+                del self._entries[key]
+                self._dirty = True
+                return None
+            self.hits += 1
+            return entry["result"]
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Store the parsed answer ``result`` of ``key``."""
+        with self._lock:
+            self._entries[key] = {
+                "result": result,
+                "validation_date": result.get("validation_date"),
+                "stored": time.time(),
+            }
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write new answers and drop expired ones."""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {k: v for k, v in self._entries.items() if self._fresh(v)}
+            try:
+                save_json(self.path, entries)
+                self._dirty = False
+            except OSError as e:
+                logging.warning("Could not write AI cache %s: %s", self.path, e)
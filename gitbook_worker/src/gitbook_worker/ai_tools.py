@@ -2,16 +2,106 @@ import ast
 import json
 import logging
 import os
-import random
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Dict, List, Tuple
 
 import tqdm
 
 import requests
 
+from .ai_cache import AIResponseCache, ai_cache_key
+from .rate_limit import estimate_tokens, log_stats, rate_limiter, retry_after_seconds, retry_delay
+from .reference_triage import triage_reference
 from .source_extract import extract_sources_of_a_md_file_to_dict
+from .structured_output import gemini_schema, openai_response_format, parse_json_answer, validate_json
+
+# Default number of AI requests in flight at the same time
+AI_MAX_CONCURRENCY = 4
+
+# Retries of rate limited or failed AI requests
+AI_MAX_RETRIES = 3
+
+# Seconds to wait for an AI answer
+AI_REQUEST_TIMEOUT = 120
+
+# Default number of references sent in one AI request
+AI_BATCH_SIZE = 1
+
+# Result format requested for every reference
+REFERENCE_JSON_HINT = """
+    {
+        "success": true|false,
+        "org": "<Originalquelle>",
+        "new": "<neue Zitationszeile oder null>",
+        "error": "<Fehlermeldung oder null>",
+        "hint": "<Hinweis oder null>",
+        "validation_date": "YYYY-MM-DD",
+        "type": "internal reference" | "external url" | "external reference" | "?"
+    }
+    """
+
+# Schema of the result of one reference check, sent to providers with
+# structured output and used to validate every answer
+REFERENCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "success": {
+            "type": "boolean",
+            "description": "Ob die Zitation erfolgreich validiert und ggf. korrigiert wurde",
+        },
+        "org": {
+            "type": "string",
+            "description": "Die original eingegebene (ungeprüfte) Quellenangabe",
+        },
+        "new": {
+            "type": ["string", "null"],
+            "description": "Die neue, wissenschaftlich korrekte Zitationszeile im gewünschten Format (optional)",
+        },
+        "error": {
+            "type": ["string", "null"],
+            "description": "Fehlermeldung, falls die Zitation nicht erstellt werden konnte (optional)",
+        },
+        "hint": {
+            "type": ["string", "null"],
+            "description": "Hilfestellung zur Verbesserung oder Vervollständigung der Quelle (optional)",
+        },
+        "validation_date": {
+            "type": "string",
+            "description": "Das Datum der Prüfung und ggf. der URL-Validierung (today, YYYY-MM-DD)",
+        },
+        "type": {
+            "type": "string",
+            "description": "Kategorisierung der Quelle: 'internal reference', 'external url', 'external reference' oder '?'",
+            "enum": ["internal reference", "external url", "external reference", "?"],
+        },
+    },
+    "required": ["success", "org", "validation_date", "type"],
+}
+
+# Schema of a batch answer: the results of several references with their ids
+REFERENCE_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                **REFERENCE_SCHEMA,
+                "properties": {"id": {"type": "string"}, **REFERENCE_SCHEMA["properties"]},
+                "required": ["id", *REFERENCE_SCHEMA["required"]],
+            },
+        }
+    },
+    "required": ["results"],
+}
+
+# Repeated requests for answers that do not match the schema
+AI_INVALID_RETRIES = 1
+
+# Model used for the OpenAI chat API; GenAI selects the model in the URL.
+# It must support json_schema structured output (see structured_output).
+OPENAI_MODEL = "gpt-4o"
 
 
 def extract_json_from_ai_output(generated_text: str) -> Tuple[bool, Any]:
@@ -34,37 +124,119 @@ def extract_json_from_ai_output(generated_text: str) -> Tuple[bool, Any]:
     return False, generated_text
 
 
-def ask_ai(prompt: str, ai_url: str, ai_api_key: str, ai_provider: str, retry_count: int = 0, max_retries: int = 3) -> Tuple[bool, str]:
-    headers = {"Authorization": f"Bearer {ai_api_key}", "Content-Type": "application/json"}
-    if ai_provider.lower() == "openai":
-        payload = {"model": "gpt-4", "messages": [{"role": "user", "content": prompt}], "temperature": 0.7}
-        try:
-            response = requests.post(ai_url, headers=headers, json=payload)
-            response.raise_for_status()
-            result = response.json()
-            return True, result["choices"][0]["message"]["content"].strip()
-        except Exception as e:
-            return False, f"[OpenAI] Fehler: {e}"
-    elif ai_provider.lower() == "genai":
+def _is_transient(error: requests.exceptions.RequestException) -> bool:
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    status = getattr(error.response, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def _parse_answer(text: str, schema: Dict[str, Any]) -> Tuple[bool, Any]:
+    ok, data = parse_json_answer(text)
+    if not ok:
+        # Models without structured output may still wrap or quote the JSON.
+        ok, data = extract_json_from_ai_output(text)
+        if not ok:
+            return False, "no JSON"
+    errors = validate_json(data, schema)
+    if errors:
+        return False, "; ".join(errors[:3])
+    return True, data
+
+
+def ask_ai(
+    prompt: str,
+    ai_url: str,
+    ai_api_key: str,
+    ai_provider: str,
+    max_retries: int = AI_MAX_RETRIES,
+    schema: Dict[str, Any] | None = None,
+) -> Tuple[bool, Any]:
+    """Send ``prompt`` to the AI service and return ``(success, answer)``.
+
+    Requests wait for the provider's shared rate limiter (see
+    ``configure_rate_limit``). Rate limit answers (429), server errors and
+    connection problems are retried up to ``max_retries`` times with
+    exponential backoff and jitter, honouring ``Retry-After``.
+
+    With a JSON ``schema`` the provider is asked for structured output where
+    it supports it, and the answer is the parsed JSON validated against the
+    schema. An answer that does not match is asked for again
+    ``AI_INVALID_RETRIES`` times."""
+    provider = ai_provider.lower()
+    if provider == "openai":
+        label = "OpenAI"
+        url = ai_url
+        headers = {"Authorization": f"Bearer {ai_api_key}", "Content-Type": "application/json"}
+        payload = {"model": OPENAI_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.7}
+        response_format = schema and openai_response_format(OPENAI_MODEL, schema, "result")
+        if response_format:
+            payload["response_format"] = response_format
+    elif provider == "genai":
+        label = "GenAI"
+        url = ai_url
+        # The key goes in a header so it never shows up in logged errors.
+        headers = {"x-goog-api-key": ai_api_key, "Content-Type": "application/json"}
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        url_with_key = f"{ai_url}?key={ai_api_key}"
+        if schema:
+            payload["generationConfig"] = {
+                "responseMimeType": "application/json",
+                "responseSchema": gemini_schema(schema),
+            }
+    else:
+        return False, f"Unbekannter AI-Provider: '{ai_provider}'"
+
+    limiter = rate_limiter(provider)
+    tokens = estimate_tokens(prompt)
+    start = time.monotonic()
+    attempt = 0
+    invalid = 0
+    while True:
+        limiter.acquire(tokens)
         try:
-            response = requests.post(url_with_key, headers={"Content-Type": "application/json"}, json=payload)
+            response = requests.post(url, headers=headers, json=payload, timeout=AI_REQUEST_TIMEOUT)
             response.raise_for_status()
             result = response.json()
-            generated_text = result["candidates"][0]["content"]["parts"][0]["text"].strip()
-            return extract_json_from_ai_output(generated_text)
+            if provider == "openai":
+                generated_text = result["choices"][0]["message"]["content"].strip()
+            else:
+                generated_text = result["candidates"][0]["content"]["parts"][0]["text"].strip()
+            if schema is None:
+                answer = (True, generated_text) if provider == "openai" else extract_json_from_ai_output(generated_text)
+            else:
+                answer = _parse_answer(generated_text, schema)
+                if not answer[0]:
+                    if invalid < AI_INVALID_RETRIES and attempt < max_retries:
+                        invalid += 1
+                        attempt += 1
+                        logging.warning("[%s] Ungültige Antwort (%s); neuer Versuch", label, answer[1])
+                        continue
+                    answer = False, f"[{label}] Ungültige Antwort: {answer[1]}"
         except requests.exceptions.RequestException as e:
-            if getattr(e.response, 'status_code', None) == 429 and retry_count < max_retries:
-                wait_time = random.randint(1, 8)
-                logging.warning("[GenAI] Zu viele Anfragen. Warte %s Sekunden", wait_time)
-                time.sleep(wait_time)
-                return ask_ai(prompt, ai_url, ai_api_key, ai_provider, retry_count + 1)
-            return False, f"[GenAI] Fehler: {e}"
+            if attempt < max_retries and _is_transient(e):
+                headers_of_error = getattr(e.response, "headers", None) or {}
+                delay = retry_delay(attempt, retry_after_seconds(headers_of_error.get("Retry-After")))
+                attempt += 1
+                logging.warning(
+                    "[%s] %s; Versuch %s/%s in %.1f Sekunden", label, e, attempt, max_retries, delay
+                )
+                time.sleep(delay)
+                continue
+            answer = False, f"[{label}] Fehler: {e}"
         except Exception as e:
-            return False, f"[GenAI] Fehler: {e}"
-    else:
-        return False, f"Unbekannter AI-Provider: '{ai_provider}'"
+            answer = False, f"[{label}] Fehler: {e}"
+        seconds = time.monotonic() - start
+        limiter.stats.record(seconds, attempt, answer[0])
+        logging.debug("[%s] Anfrage nach %.2f Sekunden mit %s Wiederholungen beendet", label, seconds, attempt)
+        return answer
+
+
+def ai_model(ai_provider: str, ai_url: str) -> str:
+    """Return the model answering requests to ``ai_url``."""
+    if ai_provider.lower() == "openai":
+        return OPENAI_MODEL
+    match = re.search(r"/models/([^/:?]+)", ai_url)
+    return match.group(1) if match else ai_url
 
 
 def proof_and_repair_internal_references(md_files: List[str], summary_md: str) -> List[Dict[str, Any]]:
@@ -103,208 +275,344 @@ def proof_and_repair_external_reference(
     ai_url: str,
     ai_api_key: str,
     ai_provider: str,
+    cache: AIResponseCache | None = None,
 ) -> Tuple[bool, str]:
     """Send a prompt for a single reference to the chosen AI service.
 
     The AI should validate and, if necessary, correct the citation.  The
-    response is expected to be a JSON string matching ``json_hint`` below.
+    response is requested and validated as ``REFERENCE_SCHEMA``.
+    Parsed answers are looked up in and stored to ``cache``.
     """
 
-    structured_schema = """
-    {
-  "$schema": "http://json-schema.org/draft-07/schema#",
-  "title": "Zitationspr\u00fcfungsergebnis",
-  "type": "object",
-  "properties": {
-    "success": {
-      "type": "boolean",
-      "description": "Ob die Zitation erfolgreich validiert und ggf. korrigiert wurde"
-    },
-    "org": {
-      "type": "string",
-      "description": "Die original eingegebene (ungepr\u00fcfte) Quellenangabe"
-    },
-    "new": {
-      "type": "string",
-      "description": "Die neue, wissenschaftlich korrekte Zitationszeile im gew\u00fcnschten Format (optional)",
-      "nullable": true
-    },
-    "error": {
-      "type": "string",
-      "description": "Fehlermeldung, falls die Zitation nicht erstellt werden konnte (optional)",
-      "nullable": true
-    },
-    "hint": {
-      "type": "string",
-      "description": "Hilfestellung zur Verbesserung oder Vervollst\u00e4ndigung der Quelle (optional)",
-      "nullable": true
-    },
-    "validation_date": {
-      "type": "string",
-      "format": "date",
-      "description": "Das Datum der Pr\u00fcfung und ggf. der URL-Validierung (today)"
-    },
-    "type": {
-      "type": "string",
-      "description": "Kategorisierung der Quelle: 'internal reference', 'external url', 'external reference' oder '?'",
-      "enum": ["internal reference", "external url", "external reference", "?"]
+    full_prompt = (
+        f"{prompt}\n\nQuelle [{footnote_index}]: {reference_as_line}\n\n\n\n"
+        f"Generate a structured JSON according:\n{REFERENCE_JSON_HINT}"
+    )
+
+    key = None
+    if cache is not None:
+        key = _reference_cache_key(
+            prompt, footnote_index, reference_as_line, ai_url, ai_provider
+        )
+        cached = cache.get(key, REFERENCE_SCHEMA)
+        if cached is not None:
+            return True, cached
+
+    success, result = ask_ai(full_prompt, ai_url, ai_api_key, ai_provider, schema=REFERENCE_SCHEMA)
+    if key is not None and success and isinstance(result, dict):
+        cache.put(key, result)
+    return success, result
+
+
+def _reference_cache_key(
+    prompt: str, footnote_index: int, reference_as_line: str, ai_url: str, ai_provider: str
+) -> str:
+    return ai_cache_key(
+        ai_provider,
+        ai_model(ai_provider, ai_url),
+        prompt + REFERENCE_JSON_HINT,
+        f"[{footnote_index}] {reference_as_line}",
+    )
+
+
+def _batch_results(answer: Any) -> Dict[str, Dict[str, Any]]:
+    """Return the results of a batch answer keyed by their ``id``."""
+    if isinstance(answer, str):
+        ok, answer = extract_json_from_ai_output(answer)
+        if not ok:
+            return {}
+    if isinstance(answer, dict):
+        # Either a single result or the array wrapped in an object
+        lists = [v for v in answer.values() if isinstance(v, list)]
+        answer = lists[0] if "id" not in answer and lists else [answer]
+    if not isinstance(answer, list):
+        return {}
+    return {
+        str(item["id"]): {k: v for k, v in item.items() if k != "id"}
+        for item in answer
+        if isinstance(item, dict) and "id" in item
     }
-  },
-  "required": ["success", "org", "validation_date", "type"]
-}
+
+
+def proof_and_repair_external_reference_batch(
+    references: List[Tuple[int, str]],
+    prompt: str,
+    ai_url: str,
+    ai_api_key: str,
+    ai_provider: str,
+    cache: AIResponseCache | None = None,
+) -> List[Tuple[bool, Any]]:
+    """Check several ``(footnote_index, reference_as_line)`` with one request.
+
+    The references are sent as a JSON array of objects with a stable ``id``
+    and the answer is expected as ``REFERENCE_BATCH_SCHEMA``, an array of
+    results carrying the same ``id``. References without a result in the
+    answer, or all of them if it cannot be parsed, are checked one by one
+    with ``proof_and_repair_external_reference``. Returns the results in the
+    order of ``references``.
     """
 
-    json_hint = """
-    {
-        "success": true|false,
-        "org": "<Originalquelle>",
-        "new": "<neue Zitationszeile oder null>",
-        "error": "<Fehlermeldung oder null>",
-        "hint": "<Hinweis oder null>",
-        "validation_date": "YYYY-MM-DD",
-        "type": "internal reference" | "external url" | "external reference" | "?"
+    results: List[Tuple[bool, Any] | None] = [None] * len(references)
+    keys: List[str | None] = [None] * len(references)
+    if cache is not None:
+        for i, (footnote_index, line) in enumerate(references):
+            keys[i] = _reference_cache_key(prompt, footnote_index, line, ai_url, ai_provider)
+            cached = cache.get(keys[i], REFERENCE_SCHEMA)
+            if cached is not None:
+                results[i] = (True, cached)
+
+    todo = [i for i, result in enumerate(results) if result is None]
+    if len(todo) > 1:
+        items = [
+            {"id": f"ref-{i + 1}", "index": references[i][0], "reference": references[i][1]}
+            for i in todo
+        ]
+        full_prompt = (
+            f"{prompt}\n\nQuellen:\n{json.dumps(items, ensure_ascii=False, indent=2)}\n\n\n\n"
+            "Generate a structured JSON object with a \"results\" array holding one object "
+            "per source. Each object contains the \"id\" of its source and the fields "
+            f"according:\n{REFERENCE_JSON_HINT}"
+        )
+        success, answer = ask_ai(
+            full_prompt, ai_url, ai_api_key, ai_provider, schema=REFERENCE_BATCH_SCHEMA
+        )
+        by_id = _batch_results(answer) if success else {}
+        missing = [i for i in todo if f"ref-{i + 1}" not in by_id]
+        if missing:
+            logging.warning(
+                "AI batch answer lacks %s of %s references, checking them one by one",
+                len(missing),
+                len(todo),
+            )
+        for i in todo:
+            result = by_id.get(f"ref-{i + 1}")
+            if result is not None:
+                results[i] = (True, result)
+                if keys[i] is not None:
+                    cache.put(keys[i], result)
+
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = proof_and_repair_external_reference(
+                reference_as_line=references[i][1],
+                footnote_index=references[i][0],
+                prompt=prompt,
+                ai_url=ai_url,
+                ai_api_key=ai_api_key,
+                ai_provider=ai_provider,
+                cache=cache,
+            )
+    return results
+
+
+def _footnote_index(numbering: str | None) -> int:
+    numbering = (numbering or "").strip()
+    if numbering.isdigit():
+        return int(numbering)
+    match = re.match(r"(\d+)", numbering)
+    return int(match.group(1)) if match else -1
+
+
+def _collect_references(file: str) -> List[Dict[str, Any]]:
+    """Return the non-empty source references of ``file`` in document order."""
+    references = []
+    for _, entries in extract_sources_of_a_md_file_to_dict(file).items():
+        for entry in entries or []:
+            for _, reference in entry.items():
+                if reference:
+                    references.append(reference)
+    return references
+
+
+def _repaired_reference(
+    reference: Dict[str, Any], success: bool, result: Any, checked_by: str = "ai"
+) -> Dict[str, Any]:
+    has_json = isinstance(result, dict)
+    return {
+        "checked_by": checked_by,
+        "line": reference.get("line"),
+        "lineno": reference.get("lineno"),
+        "success": success and has_json and result.get("success"),
+        "new": result.get("new") if has_json else None,
+        "error": result.get("error") if has_json else f"ai response data error: {result}",
+        "hint": result.get("hint") if has_json else "repair prompt, details in error",
+        "validation_date": result.get("validation_date") if has_json else None,
+        "type": result.get("type") if has_json else None,
     }
-    """
 
-    full_prompt = (
-        f"{prompt}\n\nQuelle [{footnote_index}]: {reference_as_line}\n\n\n\n"
-        f"Generate a structured JSON according:\n{json_hint}"
-    )
 
-    return ask_ai(full_prompt, ai_url, ai_api_key, ai_provider)
+def _apply_repaired_references(file: str, repaired_references: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Write the repairs of ``file`` and return its report entries."""
+    report = []
+    with open(file, encoding="utf-8") as rf:
+        lines = rf.readlines()
+
+    for repaired_reference in repaired_references:
+        if repaired_reference["success"] and repaired_reference["new"]:
+            lineno = repaired_reference["lineno"]
+            lines[lineno - 1] = (
+                lines[lineno - 1].replace(
+                    repaired_reference["line"], repaired_reference["new"]
+                )
+                + "\n"
+            )
+            report.append(
+                {
+                    "action": "link_repaired",
+                    "file": file,
+                    "lineno": repaired_reference["lineno"],
+                    "orig": repaired_reference["line"],
+                    "new": repaired_reference["new"],
+                    "validation_date": repaired_reference["validation_date"],
+                    "type": repaired_reference["type"],
+                    "hint": repaired_reference["hint"],
+                    "checked_by": repaired_reference["checked_by"],
+                }
+            )
+            logging.info(
+                "Repaired reference: %s -> %s, file: %s",
+                repaired_reference["line"],
+                repaired_reference["new"],
+                file,
+            )
+        elif repaired_reference["success"]:
+            report.append(
+                {
+                    "action": "link_check_succeeded",
+                    "file": file,
+                    "lineno": repaired_reference["lineno"],
+                    "orig": repaired_reference["line"],
+                    "validation_date": repaired_reference["validation_date"],
+                    "type": repaired_reference["type"],
+                    "hint": repaired_reference["hint"],
+                    "checked_by": repaired_reference["checked_by"],
+                }
+            )
+            logging.info(
+                "Reference already ok: %s, file: %s",
+                repaired_reference["line"],
+                file,
+            )
+        else:
+            report.append(
+                {
+                    "action": "link_repair_failed",
+                    "file": file,
+                    "lineno": repaired_reference["lineno"],
+                    "orig": repaired_reference["line"],
+                    "error": repaired_reference["error"],
+                    "validation_date": repaired_reference["validation_date"],
+                    "type": repaired_reference["type"],
+                    "hint": repaired_reference["hint"],
+                    "checked_by": repaired_reference["checked_by"],
+                }
+            )
+            logging.warning(
+                "Failed to repair reference: %s, file: %s, error: %s",
+                repaired_reference["line"],
+                file,
+                repaired_reference["error"],
+            )
+
+    with open(file, "w", encoding="utf-8") as wf:
+        wf.writelines(lines)
+    return report
 
 
 def proof_and_repair_external_references(
-    md_files: List[str], prompt: str, ai_url: str, ai_api_key: str, ai_provider: str
+    md_files: List[str],
+    prompt: str,
+    ai_url: str,
+    ai_api_key: str,
+    ai_provider: str,
+    max_concurrency: int = AI_MAX_CONCURRENCY,
+    cache: AIResponseCache | None = None,
+    batch_size: int = AI_BATCH_SIZE,
+    triage: bool = False,
+    link_status: Dict[str, bool] | None = None,
 ) -> List[Dict[str, Any]]:
-    """Proof and repair external references in markdown files."""
+    """Proof and repair external references in markdown files.
+
+    The references of all files are sent to the AI service concurrently,
+    with at most ``max_concurrency`` requests in flight. References answered
+    by ``cache`` are not sent again. With a ``batch_size`` above one, that
+    many references share a request. With ``triage`` lone links, DOIs and
+    ISBNs are checked locally first (see ``triage_reference``, links by
+    ``link_status`` where known) and only the others are sent to the AI.
+    Once all answers are in, the repairs are applied and reported per file
+    in the original order of files and references; ``checked_by`` tells
+    whether a reference was checked ``local`` or by the ``ai``."""
+
+    references = {file: _collect_references(file) for file in md_files}
+
+    def check(batch: List[Tuple[str, int]]) -> List[Tuple[bool, Any]]:
+        items = [
+            (_footnote_index(reference.get("numbering")), reference.get("line"))
+            for reference in (references[file][i] for file, i in batch)
+        ]
+        try:
+            if len(items) > 1:
+                return proof_and_repair_external_reference_batch(
+                    items, prompt, ai_url, ai_api_key, ai_provider, cache=cache
+                )
+            return [
+                proof_and_repair_external_reference(
+                    reference_as_line=items[0][1],
+                    footnote_index=items[0][0],
+                    prompt=prompt,
+                    ai_url=ai_url,
+                    ai_api_key=ai_api_key,
+                    ai_provider=ai_provider,
+                    cache=cache,
+                )
+            ]
+        except Exception as e:
+            return [(False, f"AI request failed: {e}")] * len(items)
+
+    jobs = [(file, i) for file, refs in references.items() for i in range(len(refs))]
+    results: Dict[Tuple[str, int], Tuple[bool, Any]] = {}
+    checked_by = {job: "ai" for job in jobs}
+    if triage:
+
+        def check_locally(job: Tuple[str, int]) -> Dict[str, Any] | None:
+            file, i = job
+            return triage_reference(references[file][i].get("line") or "", link_status)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            for job, result in zip(jobs, pool.map(check_locally, jobs)):
+                if result is not None:
+                    results[job] = (True, result)
+                    checked_by[job] = "local"
+        logging.info(
+            "Local triage checked %s of %s references, %s remain for the AI",
+            len(results),
+            len(jobs),
+            len(jobs) - len(results),
+        )
+        jobs = [job for job in jobs if job not in results]
+
+    step = max(1, batch_size)
+    batches = [jobs[i : i + step] for i in range(0, len(jobs), step)]
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool, tqdm.tqdm(
+        total=len(jobs), desc="\uf709 References", unit=" Ref"
+    ) as progress:
+        futures = {pool.submit(check, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            results.update(zip(batch, future.result()))
+            progress.update(len(batch))
+    if cache is not None:
+        logging.info("Answered %s of %s references from the AI cache", cache.hits, len(jobs))
+        cache.save()
+    log_stats()
 
     report = []
-    block_start = None
-    block_end = None
-    block_level = None
-
-    for file in tqdm.tqdm(md_files, desc="\uf709 Files", unit=" File"):
-        existing_sources = extract_sources_of_a_md_file_to_dict(file)
-        repaired_references = []
-
-        if existing_sources:
-            for _, entries in existing_sources.items():
-                if not entries:
-                    continue
-                for entry in entries:
-                    for name, reference in entry.items():
-                        if not reference:
-                            continue
-
-                        block_start = (
-                            min(block_start, reference.get("lineno")) if block_start else reference.get("lineno")
-                        )
-                        block_end = (
-                            max(block_end, reference.get("lineno")) if block_end else reference.get("lineno")
-                        )
-                        block_level = reference.get("level")
-
-                        try:
-                            numbering = reference.get("numbering", "").strip()
-                            if numbering.isdigit():
-                                footnote_index = int(numbering)
-                            else:
-                                match = re.match(r"(\d+)", numbering)
-                                footnote_index = int(match.group(1)) if match else -1
-                        except Exception:
-                            footnote_index = -1
-
-                        success, result = proof_and_repair_external_reference(
-                            reference_as_line=reference.get("line"),
-                            footnote_index=footnote_index,
-                            prompt=prompt,
-                            ai_url=ai_url,
-                            ai_api_key=ai_api_key,
-                            ai_provider=ai_provider,
-                        )
-
-                        has_json = isinstance(result, dict)
-                        repaired_references.append(
-                            {
-                                "line": reference.get("line"),
-                                "lineno": reference.get("lineno"),
-                                "success": success and has_json and result.get("success"),
-                                "new": result.get("new") if has_json else None,
-                                "error": result.get("error") if has_json else f"ai response data error: {result}",
-                                "hint": result.get("hint") if has_json else "repair prompt, details in error",
-                                "validation_date": result.get("validation_date") if has_json else None,
-                                "type": result.get("type") if has_json else None,
-                            }
-                        )
-
-            with open(file, encoding="utf-8") as rf:
-                lines = rf.readlines()
-
-            for repaired_reference in repaired_references:
-                if repaired_reference["success"] and repaired_reference["new"]:
-                    lineno = repaired_reference["lineno"]
-                    lines[lineno - 1] = (
-                        lines[lineno - 1].replace(
-                            repaired_reference["line"], repaired_reference["new"]
-                        )
-                        + "\n"
-                    )
-                    report.append(
-                        {
-                            "action": "link_repaired",
-                            "file": file,
-                            "lineno": repaired_reference["lineno"],
-                            "orig": repaired_reference["line"],
-                            "new": repaired_reference["new"],
-                            "validation_date": repaired_reference["validation_date"],
-                            "type": repaired_reference["type"],
-                            "hint": repaired_reference["hint"],
-                        }
-                    )
-                    logging.info(
-                        "Repaired reference: %s -> %s, file: %s",
-                        repaired_reference["line"],
-                        repaired_reference["new"],
-                        file,
-                    )
-                elif repaired_reference["success"]:
-                    report.append(
-                        {
-                            "action": "link_check_succeeded",
-                            "file": file,
-                            "lineno": repaired_reference["lineno"],
-                            "orig": repaired_reference["line"],
-                            "validation_date": repaired_reference["validation_date"],
-                            "type": repaired_reference["type"],
-                            "hint": repaired_reference["hint"],
-                        }
-                    )
-                    logging.info(
-                        "Reference already ok: %s, file: %s",
-                        repaired_reference["line"],
-                        file,
-                    )
-                else:
-                    report.append(
-                        {
-                            "action": "link_repair_failed",
-                            "file": file,
-                            "lineno": repaired_reference["lineno"],
-                            "orig": repaired_reference["line"],
-                            "error": repaired_reference["error"],
-                            "validation_date": repaired_reference["validation_date"],
-                            "type": repaired_reference["type"],
-                            "hint": repaired_reference["hint"],
-                        }
-                    )
-                    logging.warning(
-                        "Failed to repair reference: %s, file: %s, error: %s",
-                        repaired_reference["line"],
-                        file,
-                        repaired_reference["error"],
-                    )
-
-            with open(file, "w", encoding="utf-8") as wf:
-                wf.writelines(lines)
+    for file, refs in references.items():
+        if not refs:
+            continue
+        repaired_references = [
+            _repaired_reference(reference, *results[(file, i)], checked_by[(file, i)])
+            for i, reference in enumerate(refs)
+        ]
+        report.extend(_apply_repaired_references(file, repaired_references))
     return report
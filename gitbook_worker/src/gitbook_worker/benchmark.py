@@ -0,0 +1,312 @@
+"""Small benchmarks for the pandoc build steps of gitbook-worker."""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from .pandoc_utils import (
+    MARKDOWN_FORMAT,
+    PDF_ENGINES,
+    build_pandoc_cmd,
+    needs_unicode_engine,
+)
+from .repo import CLONE_STRATEGIES, clone_or_update_repo, remove_tree
+from .utils import _write_pandoc_header, combine_markdown, parse_summary, run
+
+LANDSCAPE_FILTER = os.path.join(os.path.dirname(__file__), "landscape.lua")
+
+
+def write_wide_table_book(
+    md_file: str, tables: int, cols: int = 8, rows: int = 12
+) -> None:
+    """Write a synthetic book with ``tables`` wrapped wide tables to ``md_file``."""
+    header = "|" + "|".join(f"Spalte {c}" for c in range(cols)) + "|\n"
+    sep = "|" + "|".join(["---"] * cols) + "|\n"
+    body = "".join(
+        "|" + "|".join(f"Wert {r}.{c} mit *Text*" for c in range(cols)) + "|\n"
+        for r in range(rows)
+    )
+    with open(md_file, "w", encoding="utf-8") as f:
+        for i in range(tables):
+            f.write(f"## Tabelle {i}\n\nEinleitender Absatz.\n\n")
+            f.write(f"::: {{.landscape cols={cols}}}\n")
+            f.write(header + sep + body)
+            f.write(":::\n\n")
+
+
+def time_pandoc_latex(md_file: str, filter_path: str | None, out_file: str) -> float:
+    """Return the wall-clock seconds pandoc needs to write ``md_file`` as LaTeX."""
+    cmd = ["pandoc", md_file, "-f", MARKDOWN_FORMAT, "-t", "latex", "-o", out_file]
+    if filter_path:
+        cmd.append(f"--lua-filter={filter_path}")
+    start = time.perf_counter()
+    _, err, code = run(cmd, capture_output=True)
+    elapsed = time.perf_counter() - start
+    if code != 0:
+        raise RuntimeError(f"pandoc failed ({code}): {err}")
+    return elapsed
+
+
+def benchmark_landscape_filter(
+    counts: tuple[int, ...] = (10, 100, 1000),
+    filter_paths: List[str] | None = None,
+    repeat: int = 1,
+    work_dir: str | None = None,
+) -> List[Dict[str, object]]:
+    """Time wide-table filters on synthetic books of different sizes.
+
+    Each book is converted without a filter first. ``filter_seconds`` is the
+    additional time a filter costs over this baseline, so the numbers of two
+    filter versions (e.g. an older ``landscape.lua`` from git history) can be
+    compared directly. The best of ``repeat`` runs is reported."""
+    filter_paths = filter_paths or [LANDSCAPE_FILTER]
+    results: List[Dict[str, object]] = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        out_file = os.path.join(tmp, "out.tex")
+        for count in counts:
+            md_file = os.path.join(tmp, f"book_{count}.md")
+            write_wide_table_book(md_file, count)
+            baseline = min(
+                time_pandoc_latex(md_file, None, out_file) for _ in range(repeat)
+            )
+            results.append(
+                {
+                    "tables": count,
+                    "filter": "(none)",
+                    "seconds": baseline,
+                    "filter_seconds": 0.0,
+                }
+            )
+            for filter_path in filter_paths:
+                seconds = min(
+                    time_pandoc_latex(md_file, filter_path, out_file)
+                    for _ in range(repeat)
+                )
+                results.append(
+                    {
+                        "tables": count,
+                        "filter": os.path.basename(filter_path),
+                        "seconds": seconds,
+                        "filter_seconds": max(seconds - baseline, 0.0),
+                    }
+                )
+                logging.info(
+                    "%s tables with %s: %.2fs", count, filter_path, seconds
+                )
+    return results
+
+
+def prepare_book(book: str, work_dir: str) -> str:
+    """Return a single markdown file for ``book``.
+
+    ``book`` is either a markdown file or a GitBook directory, whose chapters
+    are combined in ``SUMMARY.md`` order."""
+    if os.path.isfile(book):
+        return book
+    combined = os.path.join(work_dir, "book.md")
+    combine_markdown(parse_summary(os.path.join(book, "SUMMARY.md")), combined, book)
+    return combined
+
+
+def benchmark_pdf_engines(
+    book: str,
+    engines: List[str] | None = None,
+    resource_path: str | None = None,
+    repeat: int = 1,
+    fonts: tuple[str, str, str] = ("DejaVu Serif", "DejaVu Serif", "DejaVu Serif"),
+    work_dir: str | None = None,
+) -> List[Dict[str, object]]:
+    """Time a full PDF build of ``book`` with every available LaTeX engine.
+
+    Each engine gets the header ``_write_pandoc_header`` writes for it;
+    ``fonts`` are the main, sans and mono font. Engines that are not
+    installed or fail on the book are reported with their status instead of
+    a time. The best of ``repeat`` runs is reported."""
+    engines = engines or list(PDF_ENGINES)
+    results: List[Dict[str, object]] = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        md_file = prepare_book(book, tmp)
+        if resource_path is None:
+            resource_path = book if os.path.isdir(book) else os.path.dirname(book)
+        if needs_unicode_engine(md_file):
+            logging.info("Book contains characters pdflatex cannot typeset")
+        for engine in engines:
+            row: Dict[str, object] = {"engine": engine, "seconds": "", "status": "ok"}
+            results.append(row)
+            if shutil.which(engine) is None:
+                row["status"] = "not installed"
+                continue
+            engine_dir = os.path.join(tmp, engine)
+            os.makedirs(engine_dir)
+            main_font, sans_font, mono_font = fonts
+            header = _write_pandoc_header(
+                engine_dir,
+                "",
+                sans_font,
+                mono_font,
+                main_font,
+                False,
+                0,
+                md_file,
+                pdf_engine=engine,
+            )
+            cmd = build_pandoc_cmd(
+                md_file,
+                os.path.join(engine_dir, "book.pdf"),
+                resource_path,
+                header,
+                None,
+                pdf_engine=engine,
+            )
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _, err, code = run(cmd, capture_output=True)
+                if code != 0:
+                    row["status"] = f"failed ({code})"
+                    logging.warning("%s failed:\n%s", engine, err[-2000:])
+                    break
+                times.append(time.perf_counter() - start)
+            if times:
+                row["seconds"] = min(times)
+                logging.info("%s: %.2fs", engine, row["seconds"])
+    return results
+
+
+def benchmark_clone_strategies(
+    repo_url: str,
+    branch: str | None = None,
+    strategies: List[str] | None = None,
+    work_dir: str | None = None,
+) -> List[Dict[str, object]]:
+    """Clone ``repo_url`` once with each of ``CLONE_STRATEGIES``.
+
+    Reports the seconds and the megabytes of ``.git`` and of the worktree
+    per strategy; strategies whose clone fails are reported as failed."""
+    results: List[Dict[str, object]] = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        for strategy in strategies or list(CLONE_STRATEGIES):
+            clone_dir = os.path.join(tmp, strategy)
+            row: Dict[str, object] = {"strategy": strategy, "status": "ok"}
+            results.append(row)
+            try:
+                stats = clone_or_update_repo(
+                    repo_url, clone_dir, branch, force=True, strategy=strategy
+                )
+            except SystemExit as e:
+                row["status"] = f"failed ({e.code})"
+                continue
+            finally:
+                if os.path.isdir(clone_dir):
+                    remove_tree(clone_dir)
+            row["seconds"] = stats["seconds"]
+            row["git_mb"] = stats["git_bytes"] / 1e6
+            row["worktree_mb"] = stats["worktree_bytes"] / 1e6
+    return results
+
+
+def format_results(results: List[Dict[str, object]], columns: List[str]) -> str:
+    """Return benchmark ``results`` as a markdown table."""
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for row in results:
+        cells = []
+        for col in columns:
+            value = row.get(col, "")
+            cells.append(f"{value:.2f}" if isinstance(value, float) else str(value))
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for the gitbook-worker pandoc pipeline"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    landscape = sub.add_parser(
+        "landscape", help="Time landscape.lua on synthetic books with wide tables."
+    )
+    landscape.add_argument(
+        "--tables",
+        type=str,
+        default="10,100,1000",
+        help="Comma separated numbers of wide tables per synthetic book.",
+    )
+    landscape.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Lua filter to time (repeatable). Defaults to the shipped landscape.lua.",
+    )
+    landscape.add_argument("--repeat", type=int, default=1, help="Runs per measurement.")
+    engines = sub.add_parser(
+        "engines", help="Time a PDF build of a book with each available LaTeX engine."
+    )
+    engines.add_argument(
+        "book", help="Markdown file or GitBook directory containing SUMMARY.md."
+    )
+    engines.add_argument(
+        "--engine",
+        action="append",
+        dest="engines",
+        choices=PDF_ENGINES,
+        help="Engine to time (repeatable). Defaults to all supported engines.",
+    )
+    engines.add_argument(
+        "--resource-path", type=str, default=None, help="Pandoc resource path."
+    )
+    engines.add_argument("--main-font", type=str, default="DejaVu Serif")
+    engines.add_argument("--sans-font", type=str, default="DejaVu Serif")
+    engines.add_argument("--mono-font", type=str, default="DejaVu Serif")
+    engines.add_argument("--repeat", type=int, default=1, help="Runs per measurement.")
+    clones = sub.add_parser(
+        "clones", help="Compare time and disk usage of the clone strategies."
+    )
+    clones.add_argument("repo_url", help="URL of the GitBook repository.")
+    clones.add_argument("--branch", type=str, default=None, help="Branch to clone.")
+    clones.add_argument(
+        "--strategy",
+        action="append",
+        dest="strategies",
+        choices=CLONE_STRATEGIES,
+        help="Strategy to time (repeatable). Defaults to all strategies.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "landscape":
+        counts = tuple(int(c) for c in args.tables.split(",") if c.strip())
+        results = benchmark_landscape_filter(counts, args.filters, args.repeat)
+        print(
+            format_results(results, ["tables", "filter", "seconds", "filter_seconds"])
+        )
+    elif args.command == "engines":
+        results = benchmark_pdf_engines(
+            args.book,
+            args.engines,
+            args.resource_path,
+            args.repeat,
+            fonts=(args.main_font, args.sans_font, args.mono_font),
+        )
+        print(format_results(results, ["engine", "seconds", "status"]))
+    elif args.command == "clones":
+        results = benchmark_clone_strategies(
+            args.repo_url, args.branch, args.strategies
+        )
+        print(
+            format_results(
+                results, ["strategy", "seconds", "git_mb", "worktree_mb", "status"]
+            )
+        )
+
+
+if __name__ == "__main__":  # pragma: no cover - manual invocation
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Build several branches of one book concurrently from git worktrees.
+
+All branches share the object store of a single clone. Every branch gets its
+own worktree, temp and output directory and is built by a separate
+gitbook-worker process; the cache directory is shared, so downloaded images,
+readability scores and the per-user toolchain probes are reused."""
+
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .repo import update_sparse_checkout
+from .utils import run, run_streaming
+
+# Options the parent rewrites for every branch build
+BRANCH_OPTIONS = (
+    "--branches",
+    "--branch-jobs",
+    "--branch",
+    "--clone-dir",
+    "--temp-dir",
+    "--out-dir",
+    "--cache-dir",
+    "--clone-strategy",
+    "--mirror",
+    "--mirror-dir",
+)
+
+# Options of BRANCH_OPTIONS that take no value
+_FLAGS = {"--mirror"}
+
+
+def branch_slug(branch: str) -> str:
+    """Return a directory name for ``branch``."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", branch)
+
+
+def worktree_path(clone_dir: str, branch: str) -> str:
+    """Return the worktree directory of ``branch`` next to ``clone_dir``."""
+    return os.path.join(f"{clone_dir}-worktrees", branch_slug(branch))
+
+
+def ensure_worktree(
+    clone_dir: str, branch: str, shallow: bool = False, sparse: bool = False
+) -> str:
+    """Fetch ``branch`` into ``clone_dir`` and check it out in its worktree.
+
+    The worktree is created on first use and reset to the fetched commit
+    afterwards (detached, so one branch can be checked out several times).
+    With ``sparse`` only the book of the branch is checked out, see
+    ``update_sparse_checkout``. Returns the worktree directory."""
+    path = worktree_path(clone_dir, branch)
+    fetch = ["git", "-C", clone_dir, "fetch", "--quiet"]
+    if shallow:
+        fetch += ["--depth", "1"]
+    run(fetch + ["origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}"])
+    target = f"origin/{branch}"
+    if os.path.exists(os.path.join(path, ".git")):
+        run(["git", "-C", path, "reset", "--quiet", "--hard", target])
+    else:
+        run(["git", "-C", clone_dir, "worktree", "prune"])
+        run(
+            ["git", "-C", clone_dir, "worktree", "add", "--force", "--detach"]
+            + [path, target]
+        )
+    if sparse:
+        update_sparse_checkout(path)
+    return path
+
+
+def strip_options(argv: List[str], names=BRANCH_OPTIONS) -> List[str]:
+    """Return ``argv`` without the options ``names`` and their values."""
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in names:
+            skip = "=" not in arg and name not in _FLAGS
+            continue
+        result.append(arg)
+    return result
+
+
+def branch_command(
+    argv: List[str],
+    branch: str,
+    worktree: str,
+    temp_dir: str,
+    out_dir: str,
+    cache_dir: str,
+) -> List[str]:
+    """Return the gitbook-worker command building ``branch`` in ``worktree``."""
+    package = __name__.rsplit(".", 1)[0]
+    return (
+        [sys.executable, "-m", package]
+        + strip_options(argv)
+        + [
+            "--branch",
+            branch,
+            "--use-existing-clone",
+            "--clone-dir",
+            worktree,
+            "--temp-dir",
+            os.path.join(temp_dir, branch_slug(branch)),
+            "--out-dir",
+            os.path.join(out_dir, branch_slug(branch)),
+            "--cache-dir",
+            cache_dir,
+        ]
+    )
+
+
+def build_branches(
+    argv: List[str],
+    branches: List[str],
+    clone_dir: str,
+    temp_dir: str,
+    out_dir: str,
+    cache_dir: str,
+    max_workers: int | None = None,
+    shallow: bool = False,
+    sparse: bool = False,
+) -> Dict[str, int]:
+    """Build ``branches`` concurrently and return their exit codes.
+
+    ``argv`` are the command line arguments of this run; the per-branch
+    directories replace the ones given there. The outputs of a branch are
+    written to ``<out_dir>/<branch>``."""
+    worktrees = {
+        b: ensure_worktree(clone_dir, b, shallow, sparse) for b in branches
+    }
+
+    def build(branch: str) -> int:
+        cmd = branch_command(
+            argv, branch, worktrees[branch], temp_dir, out_dir, cache_dir
+        )
+        _, err, code = run_streaming(cmd, log_prefix=f"[{branch}] ")
+        if code != 0:
+            logging.error("Build of branch %s failed (%s):\n%s", branch, code, err)
+        return code
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(branches)) as pool:
+        codes = dict(zip(branches, pool.map(build, branches)))
+    for branch, code in codes.items():
+        logging.info(
+            "Branch %s: %s",
+            branch,
+            "ok" if code == 0 else f"failed ({code})",
+        )
+    return codes
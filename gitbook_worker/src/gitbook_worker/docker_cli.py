@@ -1,38 +1,88 @@
 from __future__ import annotations
 
+import argparse
 import os
 import subprocess
 import sys
 from pathlib import Path
 
-from .docker_tools import ensure_docker_image, ensure_docker_desktop
+from .docker_pool import WorkerContainer
+from .docker_tools import (
+    ensure_docker_image,
+    ensure_docker_desktop,
+    ensure_tex_cache,
+    warm_tex_cache,
+)
 
 
 IMAGE_NAME = "gitbook-worker"
+POOL_FLAG = "--docker-pool"
+PANDOC_IMAGE_NAME = "erda-pandoc"
 
 
 def main(args: list[str] | None = None) -> None:
-    """Run gitbook-worker inside its Docker container."""
+    """Run gitbook-worker inside its Docker container.
+
+    With ``--docker-pool`` as one of ``args`` the worker container is kept
+    alive and reused by later calls from the same directory (``docker exec``).
+    It stops after ``GITBOOK_WORKER_IDLE_TIMEOUT`` seconds (default 900)
+    without jobs."""
     ensure_docker_desktop()
     root_dir = Path(__file__).resolve().parents[2]
     dockerfile = root_dir / "Dockerfile"
-    ensure_docker_image(IMAGE_NAME, str(dockerfile))
+    image_id = ensure_docker_image(IMAGE_NAME, str(dockerfile))
 
     if args is None:
         args = sys.argv[1:]
+    args = list(args)
 
-    cmd = [
-        "docker",
-        "run",
-        "--rm",
-        "-v",
-        f"{os.getcwd()}:/data",
-        "-w",
-        "/data",
-        IMAGE_NAME,
-    ] + list(args)
+    if POOL_FLAG in args:
+        args.remove(POOL_FLAG)
+        container = WorkerContainer(
+            IMAGE_NAME,
+            ["-v", f"{os.getcwd()}:/data", "-w", "/data"],
+            idle_timeout=int(os.environ.get("GITBOOK_WORKER_IDLE_TIMEOUT", "900")),
+            image_id=image_id,
+        )
+        container.ensure()
+        cmd = container.exec_cmd(["gitbook-worker"] + args, workdir="/data")
+    else:
+        cmd = [
+            "docker",
+            "run",
+            "--rm",
+            "-v",
+            f"{os.getcwd()}:/data",
+            "-w",
+            "/data",
+            IMAGE_NAME,
+        ] + args
     subprocess.run(cmd, check=False)
 
 
+def warm_tex_cache_main(args: list[str] | None = None) -> None:
+    """Build the pandoc image if needed and pre-populate its TeX cache."""
+    parser = argparse.ArgumentParser(
+        description="Pre-populate the TeX/luaotfload cache used by --use-docker builds"
+    )
+    parser.add_argument(
+        "--tex-cache-dir",
+        type=str,
+        default="",
+        help="Host directory for the TeX caches instead of a managed volume.",
+    )
+    parsed = parser.parse_args(args)
+
+    ensure_docker_desktop()
+    dockerfile = Path(__file__).resolve().parent / "Dockerfile"
+    image_id = ensure_docker_image(PANDOC_IMAGE_NAME, str(dockerfile))
+    source = ensure_tex_cache(
+        PANDOC_IMAGE_NAME, parsed.tex_cache_dir, warm=False, image_id=image_id
+    )
+    if not warm_tex_cache(PANDOC_IMAGE_NAME, source):
+        sys.exit(1)
+    print(source)
+
+
 if __name__ == "__main__":  # pragma: no cover - manual invocation
     main()
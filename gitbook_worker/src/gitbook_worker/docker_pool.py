@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import subprocess
+import time
+import uuid
+
+from .docker_tools import get_image_id
+
+logger = logging.getLogger(__name__)
+
+# Files inside the container used to track activity for the idle shutdown
+HEARTBEAT_FILE = "/tmp/.gitbook-worker-heartbeat"
+BUSY_PREFIX = "/tmp/.gitbook-worker-busy-"
+
+# Keeps the container alive until nothing was dispatched for ``$1`` seconds
+# and no dispatched command is running anymore.
+WATCHDOG_SCRIPT = (
+    f"touch {HEARTBEAT_FILE}; "
+    "while true; do "
+    f"if ! ls {BUSY_PREFIX}* >/dev/null 2>&1 && "
+    f'[ $(( $(date +%s) - $(stat -c %Y {HEARTBEAT_FILE}) )) -ge "$1" ]; '
+    "then exit 0; fi; "
+    "sleep 5; "
+    "done"
+)
+
+# Wraps every dispatched command to record activity for the watchdog. The
+# command runs in its own session, whose ID is written to the busy file of the
+# dispatch token ``$1`` so that ``stop_dispatched`` can kill it.
+EXEC_WRAPPER = (
+    f"touch {HEARTBEAT_FILE}; b={BUSY_PREFIX}$1; shift; touch $b; "
+    'setsid "$@" & pid=$!; echo $pid > $b; wait $pid; rc=$?; '
+    f"rm -f $b; touch {HEARTBEAT_FILE}; exit $rc"
+)
+
+# Kills the session recorded in busy file ``$1`` and removes the file
+KILL_SCRIPT = (
+    'p=$(cat "$1" 2>/dev/null); '
+    'if [ -n "$p" ]; then kill -TERM -$p 2>/dev/null; sleep 2; '
+    "kill -KILL -$p 2>/dev/null; fi; "
+    'rm -f "$1"'
+)
+
+
+def _docker(args: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["docker"] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+class WorkerContainer:
+    """A long-lived container that runs commands with ``docker exec``.
+
+    The container is named after its image ID and ``run_args`` (mounts and
+    environment), so builds and batch jobs with the same mounts share one
+    warm container across processes, and a rebuilt image gets a new one.
+    ``image_id`` is looked up if not given. The container stops itself after
+    ``idle_timeout`` seconds without dispatched commands."""
+
+    def __init__(
+        self,
+        image: str,
+        run_args: list[str],
+        idle_timeout: int = 900,
+        image_id: str | None = None,
+    ):
+        self.image = image
+        self.run_args = list(run_args)
+        self.idle_timeout = idle_timeout
+        if image_id is None:
+            image_id = get_image_id(image)
+        parts = [image, image_id] + self.run_args
+        key = hashlib.sha256("\0".join(parts).encode("utf-8"))
+        safe_image = image.replace("/", "-").replace(":", "-")
+        self.name = f"gitbook-worker-{safe_image}-{key.hexdigest()[:12]}"
+
+    def is_healthy(self) -> bool:
+        """Return ``True`` if the container is running and accepts commands."""
+        return _docker(["exec", self.name, "true"]).returncode == 0
+
+    def start(self) -> None:
+        """Start the container unless a healthy one is already running."""
+        if self.is_healthy():
+            logger.info("Reusing warm container %s", self.name)
+            return
+        # Remove a stopped or unhealthy leftover of the same name.
+        _docker(["rm", "-f", self.name])
+        logger.info("Starting warm container %s from '%s' ...", self.name, self.image)
+        result = _docker(
+            ["run", "-d", "--rm", "--name", self.name]
+            + self.run_args
+            + ["--entrypoint", "sh", self.image, "-c", WATCHDOG_SCRIPT]
+            + ["sh", str(self.idle_timeout)]
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to start container {self.name}: {result.stderr}")
+        for _ in range(10):
+            if self.is_healthy():
+                return
+            time.sleep(0.5)
+        raise RuntimeError(f"Container {self.name} did not become healthy")
+
+    def ensure(self) -> "WorkerContainer":
+        """Health-check the container and restart it if necessary."""
+        if not self.is_healthy():
+            self.start()
+        return self
+
+    def exec_cmd(self, cmd: list[str], workdir: str | None = None) -> list[str]:
+        """Return the ``docker exec`` command that runs ``cmd`` in the container.
+
+        Every command gets its own dispatch token (see ``stop_dispatched``)."""
+        args = ["docker", "exec"]
+        if workdir:
+            args += ["-w", workdir]
+        token = uuid.uuid4().hex[:12]
+        return args + [self.name, "sh", "-c", EXEC_WRAPPER, "sh", token] + list(cmd)
+
+    def stop(self) -> None:
+        """Stop and remove the container."""
+        _docker(["rm", "-f", self.name])
+
+
+def run_name() -> str:
+    """Return a unique name for a one-off ``docker run`` container."""
+    return f"gitbook-worker-run-{uuid.uuid4().hex[:12]}"
+
+
+def stop_dispatched(cmd: list[str]) -> None:
+    """Kill what ``cmd`` started inside Docker after its client was killed.
+
+    Killing the ``docker exec`` or ``docker run`` client, e.g. on a timeout,
+    leaves pandoc and TeX running in the container. For a command of
+    ``WorkerContainer.exec_cmd`` this kills the command's session and removes
+    its busy file, which would keep the container alive. A ``docker run``
+    container started with ``--name`` is killed. Other commands are
+    ignored."""
+    if cmd[:2] == ["docker", "run"] and "--name" in cmd:
+        name = cmd[cmd.index("--name") + 1]
+        logger.info("Killing container %s", name)
+        _docker(["kill", name])
+        return
+    if cmd[:2] != ["docker", "exec"] or EXEC_WRAPPER not in cmd:
+        return
+    i = cmd.index(EXEC_WRAPPER)
+    name, token = cmd[i - 3], cmd[i + 2]
+    logger.info("Stopping dispatched command %s in container %s", token, name)
+    _docker(["exec", name, "sh", "-c", KILL_SCRIPT, "sh", f"{BUSY_PREFIX}{token}"])
@@ -5,37 +5,49 @@ import logging
 import platform
 import time
 
+from .cache import hash_file
+
 logger = logging.getLogger(__name__)
 
+# Image label holding the hash of the Dockerfile the image was built from
+DOCKERFILE_LABEL = "gitbook-worker.dockerfile"
+
+
+def ensure_docker_image(image_name, dockerfile_path) -> str:
+    """Build ``image_name`` unless it exists and matches ``dockerfile_path``.
 
-def ensure_docker_image(image_name, dockerfile_path) -> None:
-    # Prüfe, ob das Image schon existiert
-    result = subprocess.run(
-        ["docker", "images", "-q", image_name],
+    Images are labelled with the hash of the Dockerfile they were built from
+    (``DOCKERFILE_LABEL``), so a changed Dockerfile triggers a rebuild
+    instead of silently reusing the old image, while an up-to-date image is
+    reused wherever it was built. Returns the image ID."""
+    dockerfile_hash = hash_file(dockerfile_path)
+    image_id = get_image_id(image_name)
+    if image_id and get_image_label(image_name, DOCKERFILE_LABEL) == dockerfile_hash:
+        return image_id
+    if image_id:
+        logger.info("Image '%s' does not match its Dockerfile, rebuilding ...", image_name)
+    else:
+        logger.info("Building Docker image '%s' ...", image_name)
+    build_result = subprocess.run(
+        [
+            "docker",
+            "build",
+            "-t",
+            image_name,
+            "--label",
+            f"{DOCKERFILE_LABEL}={dockerfile_hash}",
+            "-f",
+            dockerfile_path,
+            os.path.dirname(dockerfile_path),
+        ],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
     )
-    if not result.stdout.strip():
-        # Baue das Image, falls es nicht existiert
-        logger.info("Building Docker image '%s' ...", image_name)
-        build_result = subprocess.run(
-            [
-                "docker",
-                "build",
-                "-t",
-                image_name,
-                "-f",
-                dockerfile_path,
-                os.path.dirname(dockerfile_path),
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        if build_result.returncode != 0:
-            logger.error("Docker build failed:\n%s", build_result.stderr)
-            sys.exit(1)
+    if build_result.returncode != 0:
+        logger.error("Docker build failed:\n%s", build_result.stderr)
+        sys.exit(1)
+    return get_image_id(image_name)
 
 
 def get_os() -> str:
@@ -92,3 +104,119 @@ def ensure_docker_desktop() -> None:
             return
 
     logger.error("Docker Desktop did not start in time")
+
+
+# Location of the persistent TeX caches (luaotfload font names, formats)
+# inside the pandoc container.
+TEX_CACHE_DIR = "/texcache"
+TEX_CACHE_LABEL = "gitbook-worker.texcache"
+
+
+def _docker(args: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["docker"] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def get_image_id(image_name: str) -> str:
+    """Return the ID of a local Docker image or an empty string."""
+    result = _docker(["image", "inspect", "-f", "{{.Id}}", image_name])
+    if result.returncode != 0:
+        return ""
+    return result.stdout.strip()
+
+
+def get_image_label(image_name: str, label: str) -> str:
+    """Return the value of ``label`` on a local Docker image or an empty string."""
+    template = f'{{{{index .Config.Labels "{label}"}}}}'
+    result = _docker(["image", "inspect", "-f", template, image_name])
+    value = result.stdout.strip()
+    if result.returncode != 0 or value == "<no value>":
+        return ""
+    return value
+
+
+def tex_cache_args(source: str) -> list[str]:
+    """Return ``docker run`` options mounting the TeX cache ``source``.
+
+    ``source`` is a named volume or a host directory. ``TEXMFVAR`` and
+    ``TEXMFCACHE`` point lualatex and luaotfload at the mounted cache."""
+    return [
+        "-v",
+        f"{source}:{TEX_CACHE_DIR}",
+        "-e",
+        f"TEXMFVAR={TEX_CACHE_DIR}",
+        "-e",
+        f"TEXMFCACHE={TEX_CACHE_DIR}",
+    ]
+
+
+def warm_tex_cache(image_name: str, source: str) -> bool:
+    """Pre-populate the TeX cache by building the luaotfload font database."""
+    logger.info("Warming TeX font cache %s for image '%s' ...", source, image_name)
+    result = _docker(
+        ["run", "--rm"]
+        + tex_cache_args(source)
+        + ["--entrypoint", "luaotfload-tool", image_name, "--update", "--force"]
+    )
+    if result.returncode != 0:
+        logger.error("Warming TeX font cache failed:\n%s", result.stderr)
+        return False
+    return True
+
+
+def _prune_tex_cache_volumes(keep: str) -> None:
+    """Remove TeX cache volumes that belong to other image versions."""
+    result = _docker(["volume", "ls", "-q", "--filter", f"label={TEX_CACHE_LABEL}"])
+    for volume in result.stdout.split():
+        if volume != keep:
+            logger.info("Removing outdated TeX cache volume %s", volume)
+            _docker(["volume", "rm", volume])
+
+
+def ensure_tex_cache(
+    image_name: str,
+    host_dir: str | None = None,
+    warm: bool = True,
+    image_id: str | None = None,
+) -> str:
+    """Return the TeX cache source for ``image_name``, creating it if needed.
+
+    Without ``host_dir`` a named Docker volume is managed. The cache is tied
+    to the image ID, so a rebuilt image gets a fresh cache and old volumes
+    are removed. New caches are warmed up once when ``warm`` is set.
+    ``image_id`` saves the lookup when the caller already knows it."""
+    image_id = image_id or get_image_id(image_name)
+    if not image_id:
+        raise RuntimeError(f"Docker image '{image_name}' not found")
+    short_id = image_id.split(":")[-1][:12]
+
+    if host_dir:
+        source = os.path.join(os.path.abspath(host_dir), short_id)
+        created = not os.path.isdir(source)
+        os.makedirs(source, exist_ok=True)
+    else:
+        source = f"gitbook-worker-texcache-{short_id}"
+        created = _docker(["volume", "inspect", source]).returncode != 0
+        if created:
+            result = _docker(
+                [
+                    "volume",
+                    "create",
+                    "--label",
+                    TEX_CACHE_LABEL,
+                    "--label",
+                    f"{TEX_CACHE_LABEL}.image={image_id}",
+                    source,
+                ]
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"Creating volume {source} failed: {result.stderr}")
+            _prune_tex_cache_volumes(keep=source)
+
+    if created and warm:
+        warm_tex_cache(image_name, source)
+    return source
@@ -0,0 +1,170 @@
+"""Fast preview builds: single-pass draft PDFs and HTML previews."""
+
+import logging
+import os
+import re
+import time
+from typing import List, Tuple
+
+from .cache import hash_file, hash_text, load_json, save_json
+from .utils import CHAPTER_MARKER_RE, run_streaming
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dep
+    Image = None
+
+# Longest edge in pixels of the preview images
+PROXY_MAX_SIZE = 800
+
+# Raster formats that are replaced by low-resolution proxies
+PROXY_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff"}
+
+IMAGE_RE = re.compile(r"(!\[[^\]]*\]\()\s*([^\s)]+)((?:\s+\"[^\"]*\")?\s*\))")
+
+
+def _resolve_image(path: str, search_dirs: List[str]) -> str | None:
+    if re.match(r"^[a-z]+://", path, re.IGNORECASE):
+        return None
+    for directory in search_dirs:
+        candidate = os.path.normpath(os.path.join(directory, path))
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def make_image_proxy(image: str, proxy_dir: str, max_size: int = PROXY_MAX_SIZE) -> str:
+    """Return a downscaled copy of ``image``, creating it if needed.
+
+    Proxies are cached in ``proxy_dir`` under a hash of the image content and
+    ``max_size``. Images that are already small enough are returned as is."""
+    ext = os.path.splitext(image)[1].lower()
+    jpeg = ext in (".jpg", ".jpeg")
+    name = hash_text(hash_file(image), max_size)[:24] + (".jpg" if jpeg else ".png")
+    proxy = os.path.join(proxy_dir, name)
+    if os.path.isfile(proxy):
+        return proxy
+    with Image.open(image) as img:
+        if max(img.size) <= max_size:
+            return image
+        img.thumbnail((max_size, max_size))
+        if jpeg:
+            img = img.convert("RGB")
+        os.makedirs(proxy_dir, exist_ok=True)
+        tmp_path = f"{proxy}.{os.getpid()}.tmp"
+        img.save(tmp_path, format="JPEG" if jpeg else "PNG", quality=70)
+    os.replace(tmp_path, proxy)
+    return proxy
+
+
+def write_proxy_markdown(
+    combined_md: str,
+    draft_md: str,
+    resource_path: str,
+    proxy_dir: str,
+    max_size: int = PROXY_MAX_SIZE,
+) -> int:
+    """Write ``combined_md`` to ``draft_md`` with images replaced by proxies.
+
+    Relative image paths are resolved against the chapter (see
+    ``CHAPTER_MARKER``, relative to the book directory ``resource_path``) and
+    ``resource_path``. The chapter markers themselves are not copied. Without
+    Pillow the markdown is otherwise copied unchanged. Returns the number of
+    replaced images."""
+    with open(combined_md, encoding="utf-8") as f:
+        lines = f.readlines()
+    if Image is None:
+        logging.warning("Pillow not installed; draft uses full-resolution images")
+    count = 0
+    search_dirs = [resource_path]
+
+    def repl(match: re.Match) -> str:
+        nonlocal count
+        image = _resolve_image(match.group(2), search_dirs)
+        if not image or os.path.splitext(image)[1].lower() not in PROXY_EXTENSIONS:
+            return match.group(0)
+        try:
+            proxy = make_image_proxy(image, proxy_dir, max_size)
+        except Exception as e:
+            logging.warning("No preview image for %s: %s", image, e)
+            return match.group(0)
+        if proxy == image:
+            return match.group(0)
+        count += 1
+        return f"{match.group(1)}{os.path.abspath(proxy)}{match.group(3)}"
+
+    with open(draft_md, "w", encoding="utf-8") as out:
+        for line in lines:
+            marker = CHAPTER_MARKER_RE.match(line.rstrip("\n"))
+            if marker:
+                chapter_dir = os.path.dirname(marker.group(1))
+                search_dirs = [os.path.join(resource_path, chapter_dir), resource_path]
+                continue
+            if Image is not None and "![" in line:
+                line = IMAGE_RE.sub(repl, line)
+            out.write(line)
+    logging.info("Replaced %s images by preview proxies", count)
+    return count
+
+
+def split_engine_opts(extra_args: List[str]) -> Tuple[List[str], List[str]]:
+    """Split ``--pdf-engine-opt`` values off pandoc ``extra_args``.
+
+    Returns ``(pandoc_args, engine_opts)`` for builds that run the engine
+    themselves."""
+    pandoc_args, engine_opts = [], []
+    for arg in extra_args:
+        if arg.startswith("--pdf-engine-opt="):
+            engine_opts.append(arg.split("=", 1)[1])
+        else:
+            pandoc_args.append(arg)
+    return pandoc_args, engine_opts
+
+
+def run_single_tex_pass(
+    tex_file: str,
+    pdf_engine: str,
+    engine_opts: List[str] | None = None,
+    timeout: float | None = None,
+    tail_bytes: int = 64 * 1024,
+) -> Tuple[str, str, int]:
+    """Typeset ``tex_file`` with exactly one run of ``pdf_engine``.
+
+    The PDF is written next to ``tex_file``. TeX continues after errors and
+    cross references stay unresolved, which is fine for a preview."""
+    cmd = [pdf_engine, "-interaction=nonstopmode"]
+    cmd += list(engine_opts or [])
+    cmd.append(os.path.basename(tex_file))
+    return run_streaming(
+        cmd,
+        cwd=os.path.dirname(os.path.abspath(tex_file)),
+        timeout=timeout,
+        tail_bytes=tail_bytes,
+        log_prefix=f"[{pdf_engine}] ",
+    )
+
+
+def record_build_time(cache_dir: str, mode: str, seconds: float) -> None:
+    """Remember the duration of the last build of kind ``mode``."""
+    path = os.path.join(cache_dir, "build_times.json")
+    times = load_json(path, {})
+    times[mode] = {"seconds": seconds, "finished": time.time()}
+    save_json(path, times)
+
+
+def last_build_time(cache_dir: str, mode: str) -> float | None:
+    """Return the duration of the last build of kind ``mode`` or ``None``."""
+    entry = load_json(os.path.join(cache_dir, "build_times.json"), {}).get(mode)
+    return entry["seconds"] if entry else None
+
+
+def compare_with_full_build(cache_dir: str, mode: str, seconds: float) -> str:
+    """Record a draft build and describe it relative to the last full build."""
+    record_build_time(cache_dir, mode, seconds)
+    full = last_build_time(cache_dir, "full")
+    if not full:
+        return f"{mode} built in {seconds:.1f}s (no full build recorded yet)"
+    return (
+        f"{mode} built in {seconds:.1f}s, last full build took {full:.1f}s "
+        f"({full / max(seconds, 0.001):.1f}x faster)"
+    )
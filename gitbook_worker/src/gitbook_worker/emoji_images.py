@@ -0,0 +1,251 @@
+"""Replace emoji in markdown by pre-rendered glyph images for LaTeX.
+
+Shaping color emoji fonts with HarfBuzz is slow in lualatex. Instead every
+emoji sequence is rasterized once from a local emoji font with Pillow and
+included as a small image. The rendered glyphs are cached per font, code
+point sequence and size, so they are shared by all runs and books."""
+
+import glob
+import logging
+import os
+import re
+import shutil
+from typing import Callable, Dict
+
+from .cache import hash_text
+from .toolchain import default_cache_file, font_file
+from .utils import EMOJI_RANGES
+
+try:
+    from PIL import Image, ImageDraw, ImageFont, features
+except ImportError:  # pragma: no cover - optional dep
+    Image = ImageDraw = ImageFont = features = None
+
+# Pixel height of the rendered glyphs
+EMOJI_IMAGE_SIZE = 72
+
+# Pandoc variables needed by the generated \includegraphics commands
+EMOJI_VARIABLES = ["-V", "graphics=true"]
+
+# Font families tried when no font file is given, in order of preference
+EMOJI_FONT_FAMILIES = [
+    "OpenMoji Color",
+    "OpenMoji Black",
+    "Noto Color Emoji",
+    "Segoe UI Emoji",
+]
+
+# Font files looked for in the usual font directories if fc-match is missing
+EMOJI_FONT_FILES = [
+    "OpenMoji-color-glyf_colr_0.ttf",
+    "OpenMoji-black-glyf.ttf",
+    "NotoColorEmoji.ttf",
+    "seguiemj.ttf",
+]
+
+FONT_DIRS = [
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "~/.fonts",
+    "~/.local/share/fonts",
+    "~/Library/Fonts",
+    "/Library/Fonts",
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+]
+
+
+def _emoji_class(ranges: str) -> str:
+    """Return a regex character class body for ``EMOJI_RANGES``."""
+    parts = []
+    for item in ranges.split(","):
+        low, _, high = item.strip().partition("-")
+        parts.append(chr(int(low, 16)))
+        if high:
+            parts.append("-" + chr(int(high, 16)))
+    return "".join(parts)
+
+
+_EMOJI_CHARS = _emoji_class(EMOJI_RANGES)
+
+# An emoji with optional variation selector and skin tone, joined into ZWJ
+# sequences, or a pair of regional indicators (flag).
+_EMOJI = f"[{_EMOJI_CHARS}]\ufe0f?[\U0001F3FB-\U0001F3FF]?"
+EMOJI_RE = re.compile(f"{_EMOJI}(?:\u200d{_EMOJI})*|[\U0001F1E6-\U0001F1FF]{{2}}")
+
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+CODE_SPAN_RE = re.compile(r"(`+)(?:.+?)\1")
+
+
+def default_emoji_cache_dir() -> str:
+    """Return the per-user directory of rendered emoji images."""
+    return os.path.join(os.path.dirname(default_cache_file()), "emoji")
+
+
+def find_emoji_font() -> str | None:
+    """Return the file of a locally installed emoji font or ``None``."""
+    for family in EMOJI_FONT_FAMILIES:
+        path = font_file(family)
+        if path:
+            return path
+    for name in EMOJI_FONT_FILES:
+        for directory in FONT_DIRS:
+            pattern = os.path.join(os.path.expanduser(directory), "**", name)
+            matches = glob.glob(pattern, recursive=True)
+            if matches:
+                return matches[0]
+    return None
+
+
+# A code point no font maps; rendering it yields the font's .notdef glyph
+NOTDEF_PROBE = "\U0010FFFD"
+
+
+def _rasterize(text: str, font):
+    scratch = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    box = scratch.textbbox((0, 0), text, font=font, embedded_color=True)
+    width, height = box[2] - box[0], box[3] - box[1]
+    if width <= 0 or height <= 0:
+        return None
+    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    ImageDraw.Draw(img).text(
+        (-box[0], -box[1]), text, font=font, embedded_color=True, fill="black"
+    )
+    return img if img.getbbox() is not None else None
+
+
+def render_emoji(text: str, font_path: str, size: int = EMOJI_IMAGE_SIZE):
+    """Rasterize the emoji sequence ``text`` to an RGBA image ``size`` px high.
+
+    Returns ``None`` if the font has no glyph for it."""
+    layout = ImageFont.Layout.BASIC
+    if features.check("raqm"):
+        # Needed to shape ZWJ sequences into a single glyph
+        layout = ImageFont.Layout.RAQM
+    try:
+        font = ImageFont.truetype(font_path, size, layout_engine=layout)
+    except OSError:
+        # Bitmap color fonts (e.g. Noto Color Emoji) only have fixed sizes.
+        font = ImageFont.truetype(font_path, 109, layout_engine=layout)
+    img = _rasterize(text, font)
+    if img is None:
+        return None
+    notdef = _rasterize(NOTDEF_PROBE, font)
+    if notdef is not None and notdef.tobytes() == img.tobytes():
+        return None
+    if img.height != size:
+        img = img.resize((max(1, round(img.width * size / img.height)), size))
+    return img
+
+
+class EmojiImageCache:
+    """Rendered emoji images of one font, stored under ``cache_dir``."""
+
+    def __init__(
+        self,
+        font_path: str,
+        cache_dir: str | None = None,
+        size: int = EMOJI_IMAGE_SIZE,
+        renderer: Callable | None = None,
+    ):
+        self.font_path = os.path.abspath(font_path)
+        self.size = size
+        self.renderer = renderer or render_emoji
+        stat = os.stat(self.font_path)
+        font_key = hash_text(self.font_path, stat.st_size, stat.st_mtime_ns)[:16]
+        self.dir = os.path.join(cache_dir or default_emoji_cache_dir(), font_key)
+        self._paths: Dict[str, str | None] = {}
+
+    def image_for(self, text: str) -> str | None:
+        """Return the image file of the emoji sequence ``text`` or ``None``."""
+        if text in self._paths:
+            return self._paths[text]
+        # Variation selectors do not change the rendered glyph.
+        codes = "-".join(f"{ord(c):x}" for c in text if c != "\ufe0f")
+        path = os.path.join(self.dir, f"{codes}_{self.size}.png")
+        missing = f"{path}.missing"
+        if not os.path.isfile(path) and not os.path.isfile(missing):
+            os.makedirs(self.dir, exist_ok=True)
+            img = self.renderer(text, self.font_path, self.size)
+            if img is None:
+                open(missing, "w").close()
+            else:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                img.save(tmp_path, format="PNG")
+                os.replace(tmp_path, path)
+        self._paths[text] = path if os.path.isfile(path) else None
+        return self._paths[text]
+
+
+def _latex_path(path: str) -> str:
+    return path.replace(os.sep, "/")
+
+
+def write_emoji_image_markdown(
+    combined_md: str,
+    emoji_md: str,
+    images: EmojiImageCache,
+    link_dir: str,
+    container_dir: str | None = None,
+) -> tuple[int, int]:
+    """Write ``combined_md`` to ``emoji_md`` with emoji replaced by images.
+
+    Each emoji becomes a raw LaTeX ``\\includegraphics`` scaled to the line
+    height, so the result is only meant for PDF output. Code blocks and code
+    spans are left untouched. The used images are copied from the cache to
+    ``link_dir``; ``container_dir`` is the path of ``link_dir`` inside the
+    pandoc container for Docker builds. Returns the number of replaced
+    emoji and the number of emoji outside code that could not be rendered and
+    were kept as text."""
+    if Image is None and images.renderer is render_emoji:
+        raise RuntimeError("Pillow is required to render emoji images")
+    os.makedirs(link_dir, exist_ok=True)
+    count = 0
+    missing = 0
+
+    def repl(match: re.Match) -> str:
+        nonlocal count, missing
+        image = images.image_for(match.group(0))
+        if not image:
+            missing += 1
+            return match.group(0)
+        name = os.path.basename(image)
+        target = os.path.join(link_dir, name)
+        if not os.path.isfile(target):
+            shutil.copyfile(image, target)
+        path = f"{container_dir}/{name}" if container_dir else os.path.abspath(target)
+        count += 1
+        return (
+            "`\\raisebox{-0.15em}{\\includegraphics[height=1em]{"
+            f"{_latex_path(path)}}}}}`{{=latex}}"
+        )
+
+    def replace_outside_code(line: str) -> str:
+        parts = []
+        last = 0
+        for span in CODE_SPAN_RE.finditer(line):
+            parts.append(EMOJI_RE.sub(repl, line[last : span.start()]))
+            parts.append(span.group(0))
+            last = span.end()
+        parts.append(EMOJI_RE.sub(repl, line[last:]))
+        return "".join(parts)
+
+    fence = None
+    with open(combined_md, encoding="utf-8") as src, open(
+        emoji_md, "w", encoding="utf-8"
+    ) as out:
+        for line in src:
+            match = FENCE_RE.match(line)
+            if match:
+                if fence is None:
+                    fence = match.group(1)
+                elif fence == match.group(1):
+                    fence = None
+                out.write(line)
+            elif fence is None and EMOJI_RE.search(line):
+                out.write(replace_outside_code(line))
+            else:
+                out.write(line)
+    logging.info("Replaced %s emoji by pre-rendered images", count)
+    if missing:
+        logging.warning("%s emoji could not be rendered and stay text", missing)
+    return count, missing
@@ -0,0 +1,251 @@
+"""Check that the configured fonts cover every character of a book.
+
+Glyphs missing from the PDF fonts otherwise only show up after a complete
+LaTeX run, as warnings or as empty boxes in the PDF. The code points of each
+font file (its cmap) are read once and cached under a key derived from the
+file, so the precheck itself only has to scan the markdown."""
+
+import bisect
+import logging
+import os
+import subprocess
+import unicodedata
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from .cache import hash_text, load_json, save_json
+from .emoji_images import CODE_SPAN_RE, FENCE_RE
+from .toolchain import default_cache_file, font_file
+from .utils import CHAPTER_MARKER_RE
+
+try:
+    from fontTools.ttLib import TTFont
+except ImportError:  # pragma: no cover - optional dep
+    TTFont = None
+
+# Characters that need no glyph: control and format characters, separators,
+# variation selectors and the emoji zero width joiner
+_IGNORED_CATEGORIES = {"Cc", "Cf", "Zs", "Zl", "Zp"}
+_IGNORED_CHARS = {"\ufe0e", "\ufe0f", "\u200d"}
+
+# Number of locations reported per uncovered character
+MAX_LOCATIONS = 5
+
+
+def default_coverage_cache_dir() -> str:
+    """Return the per-user directory of cached font coverage indexes."""
+    return os.path.join(os.path.dirname(default_cache_file()), "font_coverage")
+
+
+class FontCoverage:
+    """Sorted code point ranges ``[(first, last), ...]`` of one font."""
+
+    def __init__(self, ranges: Sequence[Sequence[int]]):
+        self.ranges = [(int(lo), int(hi)) for lo, hi in ranges]
+        self._starts = [lo for lo, _ in self.ranges]
+
+    @classmethod
+    def from_codepoints(cls, codepoints: Iterable[int]) -> "FontCoverage":
+        ranges: List[List[int]] = []
+        for cp in sorted(set(codepoints)):
+            if ranges and ranges[-1][1] + 1 == cp:
+                ranges[-1][1] = cp
+            else:
+                ranges.append([cp, cp])
+        return cls(ranges)
+
+    def __contains__(self, codepoint: int) -> bool:
+        i = bisect.bisect_right(self._starts, codepoint) - 1
+        return i >= 0 and codepoint <= self.ranges[i][1]
+
+    def __len__(self) -> int:
+        return sum(hi - lo + 1 for lo, hi in self.ranges)
+
+
+def _parse_fc_charset(text: str) -> List[Tuple[int, int]]:
+    """Parse the ``%{charset}`` output of ``fc-query`` (``"20-7e a0 ..."``)."""
+    ranges = []
+    for item in text.split():
+        lo, _, hi = item.partition("-")
+        try:
+            ranges.append((int(lo, 16), int(hi or lo, 16)))
+        except ValueError:
+            continue
+    return ranges
+
+
+def _probe_coverage(path: str) -> FontCoverage:
+    if TTFont is not None:
+        font = TTFont(path, fontNumber=0, lazy=True)
+        try:
+            return FontCoverage.from_codepoints((font.getBestCmap() or {}).keys())
+        finally:
+            font.close()
+    try:
+        result = subprocess.run(
+            ["fc-query", "--index=0", "--format=%{charset}", path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+    except OSError as e:
+        raise RuntimeError("fontTools or fc-query is required") from e
+    if result.returncode != 0:
+        raise RuntimeError(f"fc-query failed for {path}: {result.stderr.strip()}")
+    return FontCoverage(_parse_fc_charset(result.stdout))
+
+
+def font_coverage(path: str, cache_dir: str | None = None) -> FontCoverage:
+    """Return the code point coverage of the font file ``path``.
+
+    The index is cached in ``cache_dir`` until the file changes. Collections
+    (``.ttc``) are represented by their first font."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = hash_text(path, stat.st_size, stat.st_mtime_ns)[:16]
+    cache_file = os.path.join(cache_dir or default_coverage_cache_dir(), f"{key}.json")
+    entry = load_json(cache_file, {})
+    if entry.get("ranges") is not None:
+        return FontCoverage(entry["ranges"])
+    coverage = _probe_coverage(path)
+    try:
+        save_json(cache_file, {"font": path, "ranges": coverage.ranges})
+    except OSError as e:
+        logging.warning("Could not cache font coverage of %s: %s", path, e)
+    return coverage
+
+
+def _needs_glyph(char: str) -> bool:
+    if char in _IGNORED_CHARS:
+        return False
+    return unicodedata.category(char) not in _IGNORED_CATEGORIES
+
+
+def scan_characters(
+    md_file: str, max_locations: int = MAX_LOCATIONS
+) -> Dict[Tuple[str, bool], List[Tuple[str, int]]]:
+    """Return the characters of a combined markdown file and where they occur.
+
+    Keys are ``(char, in_code)``, where ``in_code`` marks code blocks and code
+    spans (typeset with the mono font). Values hold up to ``max_locations``
+    ``(chapter, line)`` pairs; lines count from the start of the chapter file
+    (see ``CHAPTER_MARKER``). ASCII is skipped, every font covers it."""
+    found: Dict[Tuple[str, bool], List[Tuple[str, int]]] = {}
+    chapter, offset = "", 0
+    fence = None
+
+    def record(text: str, in_code: bool, lineno: int) -> None:
+        for char in set(text):
+            if char.isascii() or not _needs_glyph(char):
+                continue
+            locations = found.setdefault((char, in_code), [])
+            if len(locations) < max_locations:
+                locations.append((chapter, lineno - offset))
+
+    with open(md_file, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            marker = CHAPTER_MARKER_RE.match(line.rstrip("\n"))
+            if marker:
+                # The marker is followed by a blank line, then line 1.
+                chapter, offset = marker.group(1), lineno + 1
+                continue
+            match = FENCE_RE.match(line)
+            if match:
+                if fence is None:
+                    fence = match.group(1)
+                elif fence == match.group(1):
+                    fence = None
+                continue
+            if line.isascii():
+                continue
+            if fence is not None:
+                record(line, True, lineno)
+                continue
+            last = 0
+            for span in CODE_SPAN_RE.finditer(line):
+                record(line[last : span.start()], False, lineno)
+                record(span.group(0), True, lineno)
+                last = span.end()
+            record(line[last:], False, lineno)
+    return found
+
+
+def resolve_font(font: str) -> str | None:
+    """Return the file of ``font`` (a file path or a family name) or ``None``."""
+    if os.path.isfile(font):
+        return font
+    return font_file(font)
+
+
+def check_font_coverage(
+    md_file: str,
+    text_fonts: Sequence[str],
+    code_fonts: Sequence[str],
+    fallback_fonts: Sequence[str] = (),
+    cache_dir: str | None = None,
+) -> Tuple[List[dict], List[str]]:
+    """Report characters of ``md_file`` the configured fonts cannot typeset.
+
+    Every character of the prose must be covered by all ``text_fonts`` (e.g.
+    main and sans font), every character of code by all ``code_fonts``,
+    unless one of the ``fallback_fonts`` (e.g. the emoji font) covers it.
+    Fonts are family names or font files; fonts that cannot be found are
+    skipped. Returns ``(issues, missing_fonts)``; each issue is a dict with
+    ``char``, ``codepoint``, ``name``, ``fonts`` (those lacking the glyph)
+    and ``locations``."""
+    coverages: Dict[str, FontCoverage] = {}
+    missing_fonts = []
+    for font in dict.fromkeys([*text_fonts, *code_fonts, *fallback_fonts]):
+        path = resolve_font(font)
+        if not path:
+            missing_fonts.append(font)
+            continue
+        try:
+            coverages[font] = font_coverage(path, cache_dir)
+        except Exception as e:
+            logging.warning("Could not read the coverage of %s: %s", font, e)
+            missing_fonts.append(font)
+
+    issues = []
+    for (char, in_code), locations in sorted(scan_characters(md_file).items()):
+        cp = ord(char)
+        if any(cp in coverages[f] for f in fallback_fonts if f in coverages):
+            continue
+        required = code_fonts if in_code else text_fonts
+        lacking = [f for f in required if f in coverages and cp not in coverages[f]]
+        if not lacking:
+            continue
+        issues.append(
+            {
+                "char": char,
+                "codepoint": f"U+{cp:04X}",
+                "name": unicodedata.name(char, ""),
+                "fonts": ", ".join(lacking),
+                "locations": locations,
+            }
+        )
+    return issues, missing_fonts
+
+
+def format_coverage_report(issues: List[dict], missing_fonts: List[str]) -> str:
+    """Return a markdown report of ``check_font_coverage`` results."""
+    lines = ["# Font Coverage", ""]
+    for font in missing_fonts:
+        lines.append(f"- Font not found: {font}")
+    if missing_fonts:
+        lines.append("")
+    if not issues:
+        lines.append("All characters are covered by the configured fonts.")
+        return "\n".join(lines) + "\n"
+    lines += [
+        "| Char | Code Point | Name | Missing In | Locations |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for issue in issues:
+        where = ", ".join(f"{ch or '-'}:{line}" for ch, line in issue["locations"])
+        char = issue["char"].replace("|", "\\|")
+        lines.append(
+            f"| {char} | {issue['codepoint']} | {issue['name']} | "
+            f"{issue['fonts']} | {where} |"
+        )
+    return "\n".join(lines) + "\n"
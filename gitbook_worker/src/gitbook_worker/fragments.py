@@ -0,0 +1,173 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from .cache import hash_file, hash_text
+from .pandoc_utils import MARKDOWN_FORMAT
+from .utils import run
+
+# Template that renders nothing but pandoc's syntax highlighting macros
+HIGHLIGHT_TEMPLATE = "$highlighting-macros$\n"
+
+# Variables pandoc normally derives from the document content. The master
+# document only contains \input commands, so they are set explicitly to load
+# the packages the chapter fragments rely on.
+MASTER_VARIABLES = ["-V", "tables=true", "-V", "graphics=true", "-V", "strikeout=true"]
+
+
+def _tex_path(path: str) -> str:
+    """Return ``path`` in a form LaTeX accepts inside ``\\input``."""
+    return os.path.abspath(path).replace(os.sep, "/")
+
+
+def _temp_path(directory: str, suffix: str) -> str:
+    """Return a new unique file in ``directory`` to be moved into place later."""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    os.close(fd)
+    return path
+
+
+def fragment_options_key(
+    filter_paths: List[str] | None, extra_args: List[str] | None, pandoc_version=()
+) -> str:
+    """Return a hash over all conversion options that affect a fragment."""
+    filters = [hash_file(p) for p in (filter_paths or [])]
+    return hash_text(MARKDOWN_FORMAT, filters, extra_args or [], pandoc_version)
+
+
+def build_fragment_cmd(
+    tex_output: str,
+    resource_path: str,
+    media_dir: str,
+    filter_paths: List[str] | None,
+    extra_args: List[str] | None = None,
+) -> List[str]:
+    """Return the pandoc command converting one chapter (stdin) to a LaTeX fragment.
+
+    Images are extracted into ``media_dir`` so that the fragment references
+    absolute paths and can be ``\\input`` from any directory."""
+    cmd = [
+        "pandoc",
+        "-f",
+        MARKDOWN_FORMAT,
+        "-t",
+        "latex",
+        "-o",
+        tex_output,
+        f"--resource-path={resource_path}",
+        f"--extract-media={_tex_path(media_dir)}",
+    ]
+    if extra_args:
+        cmd.extend(extra_args)
+    if filter_paths:
+        cmd.extend(f"--lua-filter={p}" for p in filter_paths)
+    return cmd
+
+
+def build_chapter_fragments(
+    chapters: List[Tuple[str, str]],
+    cache_dir: str,
+    resource_path: str,
+    filter_paths: List[str] | None = None,
+    extra_args: List[str] | None = None,
+    pandoc_version=(),
+    max_workers: int | None = None,
+) -> Tuple[List[str], List[str]]:
+    """Convert chapters to cached LaTeX fragments in parallel.
+
+    ``chapters`` are ``(name, markdown)`` pairs as returned by
+    ``split_combined_markdown``. A fragment is keyed by the chapter text and
+    the conversion options, so only changed chapters are run through pandoc.
+
+    Returns ``(fragment_paths, errors)`` with fragments in chapter order."""
+    frag_dir = os.path.join(cache_dir, "fragments")
+    media_dir = os.path.join(frag_dir, "media")
+    os.makedirs(frag_dir, exist_ok=True)
+    options = fragment_options_key(filter_paths, extra_args, pandoc_version)
+
+    fragments = []
+    todo = {}
+    for name, text in chapters:
+        path = os.path.join(frag_dir, f"{hash_text(options, text)[:24]}.tex")
+        fragments.append(path)
+        if os.path.isfile(path):
+            logging.info("Reusing LaTeX fragment for %s: %s", name, path)
+        elif path not in todo:
+            # Chapters with identical text share one fragment.
+            todo[path] = (name, text)
+    logging.info(
+        "%s of %s chapter fragments need conversion", len(todo), len(chapters)
+    )
+
+    def convert(item):
+        path, (name, text) = item
+        tmp_path = _temp_path(frag_dir, ".tex")
+        cmd = build_fragment_cmd(
+            tmp_path, resource_path, media_dir, filter_paths, extra_args
+        )
+        _, err, code = run(cmd, capture_output=True, input_text=text)
+        if code != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return f"{name}: pandoc exited with {code}: {err.strip()}"
+        os.replace(tmp_path, path)
+        return None
+
+    errors = []
+    if todo:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            errors = [e for e in pool.map(convert, todo.items()) if e]
+    return fragments, errors
+
+
+def write_master_markdown(fragments: List[str], master_md: str) -> str:
+    """Write a markdown document that ``\\input``s every fragment in order."""
+    with open(master_md, "w", encoding="utf-8") as f:
+        for frag in fragments:
+            f.write("```{=latex}\n")
+            f.write(f"\\input{{{_tex_path(frag)}}}\n")
+            f.write("```\n\n")
+    return master_md
+
+
+def write_highlighting_macros(cache_dir: str, pandoc_version=()) -> str:
+    """Write pandoc's LaTeX syntax highlighting macros to a header file.
+
+    Fragments with highlighted code use these macros, but pandoc only emits
+    them into the preamble when it highlighted code itself."""
+    version = ".".join(map(str, pandoc_version)) or "unknown"
+    header = os.path.join(cache_dir, f"highlighting_macros_{version}.tex")
+    if os.path.isfile(header):
+        return header
+    os.makedirs(cache_dir, exist_ok=True)
+    # Concurrent builds share the cache dir; every file is private until the
+    # header is moved into place.
+    template = _temp_path(cache_dir, ".template")
+    tmp_header = _temp_path(cache_dir, ".tex")
+    with open(template, "w", encoding="utf-8") as f:
+        f.write(HIGHLIGHT_TEMPLATE)
+    cmd = [
+        "pandoc",
+        "-f",
+        "markdown",
+        "-t",
+        "latex",
+        "-s",
+        f"--template={template}",
+        "-o",
+        tmp_header,
+    ]
+    try:
+        _, err, code = run(
+            cmd, capture_output=True, input_text="```python\nx = 1\n```\n"
+        )
+        if code != 0:
+            raise RuntimeError(f"Failed to write highlighting macros: {err}")
+        os.replace(tmp_header, header)
+    finally:
+        for path in (template, tmp_header):
+            if os.path.exists(path):
+                os.remove(path)
+    return header
@@ -1,26 +1,89 @@
-function Div(el)
-  if FORMAT:match('latex') and el.classes:includes('landscape') then
-    local cols = tonumber(el.attributes['cols']) or 0
-    -- Schriftgröße wählen
-    local size = ''
-    if cols >= 13 then
-      size = '\\tiny'
-    elseif cols >= 10 then
-      size = '\\scriptsize'
-    elseif cols >= 7 then
-      size = '\\footnotesize'
-    end
+-- Breite Tabellen in `.landscape`-Divs werden direkt aus dem Tabellen-AST als
+-- ltablex ausgegeben. Die Zelleninhalte bleiben Inlines und werden vom
+-- LaTeX-Writer des Hauptdokuments gesetzt, ein verschachteltes pandoc.write
+-- samt gsub-Nachbearbeitung ist damit nicht mehr noetig.
 
-    local blocks = {}
+local function raw(text)
+  return pandoc.RawInline('latex', text)
+end
 
-    -- Hilfsfunktion für die Spaltenspezifikation
-    local function to_X_spec(spec)
-      -- p{..}, m{..}, b{..} und >{..}lcr entfernen
-      spec = spec:gsub('>[^{}]+%b{}[lcr]', 'X')
-      spec = spec:gsub('[pmbx]%b{}', 'X')
-      spec = spec:gsub('[lcr]', 'X')
-      return spec
+-- Schriftgröße wählen
+local function font_size(cols)
+  if cols >= 13 then
+    return '\\tiny'
+  elseif cols >= 10 then
+    return '\\scriptsize'
+  elseif cols >= 7 then
+    return '\\footnotesize'
+  end
+  return ''
+end
+
+-- Zeilenumbrüche in Zellen dürfen die Tabellenzeile nicht beenden
+local cell_filter = {
+  LineBreak = function()
+    return raw('\\newline{}')
+  end,
+}
+
+local function cell_inlines(cell)
+  local inlines = pandoc.utils.blocks_to_inlines(cell.contents, { raw('\\newline{}') })
+  return pandoc.Inlines(inlines):walk(cell_filter)
+end
+
+local function add_row(out, row)
+  for i, cell in ipairs(row.cells) do
+    if i > 1 then
+      out:insert(raw(' & '))
     end
+    out:extend(cell_inlines(cell))
+  end
+  out:insert(raw(' \\\\\n'))
+end
+
+local function add_rows(out, rows)
+  for _, row in ipairs(rows) do
+    add_row(out, row)
+  end
+end
+
+-- Tabelle als ltablex-Struktur in einem einzigen Plain-Block
+local function table_to_ltablex(tbl)
+  local out = pandoc.List()
+  out:insert(raw('\\begin{ltablex}{\\linewidth}{' .. string.rep('X', #tbl.colspecs) .. '}\n'))
+
+  local caption = pandoc.utils.blocks_to_inlines(tbl.caption.long or {})
+  if #caption > 0 then
+    out:insert(raw('\\caption{'))
+    out:extend(caption)
+    out:insert(raw('}\\\\\n'))
+  end
+
+  out:insert(raw('\\hline\n'))
+  if #tbl.head.rows > 0 then
+    add_rows(out, tbl.head.rows)
+    out:insert(raw('\\hline\n'))
+  end
+  out:insert(raw('\\endhead\n'))
+
+  for _, body in ipairs(tbl.bodies) do
+    add_rows(out, body.head)
+    add_rows(out, body.body)
+  end
+  add_rows(out, tbl.foot.rows)
+
+  out:insert(raw('\\hline\n'))
+  out:insert(raw('\\end{ltablex}'))
+  return pandoc.Plain(out)
+end
+
+function Div(el)
+  -- 'json': das AST, aus dem bei mehreren Formaten der PDF-Writer schreibt
+  local latex = FORMAT:match('latex') or FORMAT == 'json'
+  if latex and el.classes:includes('landscape') then
+    local size = font_size(tonumber(el.attributes['cols']) or 0)
+
+    local blocks = {}
 
     -- 1) Landscape-Umgebung
     table.insert(blocks, pandoc.RawBlock('latex', '\\begin{landscape}'))
@@ -31,23 +94,13 @@ function Div(el)
       table.insert(blocks, pandoc.RawBlock('latex', '\\begingroup' .. size))
     end
 
-    local doc = pandoc.Pandoc(el.content)
-    local latex = pandoc.write(doc, 'latex')
-
-    -- longtable oder tabular durch ltablex ersetzen
-    latex = latex:gsub('\\begin{longtable}(%b[])?%s*{([^}]+)}', function(opt, spec)
-      opt = opt or ''
-      return '\\begin{ltablex' .. opt .. '{\\linewidth}{' .. to_X_spec(spec) .. '}'
-    end)
-    latex = latex:gsub('\\begin{tabular}(%b[])?%s*{([^}]+)}', function(opt, spec)
-      opt = opt or ''
-      return '\\begin{ltablex' .. opt .. '{\\linewidth}{' .. to_X_spec(spec) .. '}'
-    end)
-
-    latex = latex:gsub('\\end{longtable}', '\\end{ltablex}')
-    latex = latex:gsub('\\end{tabular}', '\\end{ltablex}')
-
-    table.insert(blocks, pandoc.RawBlock('latex', latex))
+    for _, block in ipairs(el.content) do
+      if block.t == 'Table' then
+        table.insert(blocks, table_to_ltablex(block))
+      else
+        table.insert(blocks, block)
+      end
+    end
 
     if size ~= '' then
       table.insert(blocks, pandoc.RawBlock('latex', '\\endgroup'))
@@ -62,4 +115,3 @@ function Div(el)
   end
   return nil
 end
-
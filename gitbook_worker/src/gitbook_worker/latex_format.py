@@ -0,0 +1,159 @@
+import logging
+import os
+import shutil
+import tempfile
+from typing import List
+
+from . import docker_tools, toolchain
+from .cache import hash_text
+from .fragments import MASTER_VARIABLES
+from .utils import PRECOMPILE_MARKER, run
+
+# Mount point of the format cache inside the pandoc container
+DOCKER_FORMAT_DIR = "/cache/latex_formats"
+
+# Template variables of every PDF build that shape the dumped preamble. The
+# content variables are always set, so one format fits every book.
+FORMAT_VARIABLES = ["-V", "geometry=a4paper"] + MASTER_VARIABLES
+
+# Document the preamble is rendered from. Pandoc emits its highlighting macros
+# before the header, i.e. before the dump marker, and only for documents with
+# highlighted code; books with code would then skip them when loading the
+# format. The code block puts them into every format and into its test compile.
+SAMPLE_DOCUMENT = "```python\nx = 1\n```\n"
+
+
+def _command(cmd: List[str], fmt_dir: str, docker_image: str | None) -> List[str]:
+    """Return ``cmd`` for local execution or wrapped in ``docker run``.
+
+    All commands work with paths relative to ``fmt_dir`` so that they are
+    valid on the host and inside the container alike."""
+    if not docker_image:
+        return cmd
+    return [
+        "docker",
+        "run",
+        "--rm",
+        "-v",
+        f"{os.path.abspath(fmt_dir)}:{DOCKER_FORMAT_DIR}",
+        "-w",
+        DOCKER_FORMAT_DIR,
+        "--entrypoint",
+        cmd[0],
+        docker_image,
+    ] + cmd[1:]
+
+
+def engine_key(engine: str, docker_image: str | None = None) -> str:
+    """Return a key of the TeX installation that builds and loads the format.
+
+    Formats only load in the TeX version that dumped them, so the key changes
+    with the engine binary or the Docker image ID."""
+    if docker_image:
+        return f"{docker_image}@{docker_tools.get_image_id(docker_image)}"
+    return toolchain.binary_key(engine) or engine
+
+
+def render_preamble(
+    header_file: str,
+    fmt_dir: str,
+    extra_args: List[str] | None = None,
+    docker_image: str | None = None,
+) -> str:
+    """Render pandoc's LaTeX template with ``header_file`` for ``SAMPLE_DOCUMENT``.
+
+    Returns the generated LaTeX source, which contains the part of the
+    preamble that is dumped into the format."""
+    os.makedirs(fmt_dir, exist_ok=True)
+    # Concurrent builds share fmt_dir, so every build copies its own header.
+    fd, header_copy = tempfile.mkstemp(suffix=".tex", dir=fmt_dir)
+    os.close(fd)
+    shutil.copyfile(header_file, header_copy)
+    cmd = ["pandoc", "-f", "markdown", "-t", "latex", "-s"]
+    cmd += ["-H", os.path.basename(header_copy)] + list(extra_args or [])
+    try:
+        out, err, code = run(
+            _command(cmd, fmt_dir, docker_image),
+            cwd=fmt_dir,
+            capture_output=True,
+            input_text=SAMPLE_DOCUMENT,
+        )
+    finally:
+        os.remove(header_copy)
+    if code != 0:
+        raise RuntimeError(f"Failed to render LaTeX preamble: {err}")
+    return out
+
+
+def ensure_latex_format(
+    header_file: str,
+    cache_dir: str,
+    engine: str = "lualatex",
+    extra_args: List[str] | None = None,
+    docker_image: str | None = None,
+) -> str | None:
+    """Return a precompiled LaTeX format for the pandoc template and header.
+
+    The preamble up to ``PRECOMPILE_MARKER`` is dumped with ``mylatexformat``
+    and cached in ``<cache_dir>/latex_formats`` under a hash of the rendered
+    preamble and the TeX installation (see ``engine_key``). Every new format
+    is test-compiled once with ``SAMPLE_DOCUMENT``; formats that cannot be
+    built or used (e.g. because a package does not survive the dump) are
+    remembered and the build continues without a format.
+
+    ``extra_args`` must contain every pandoc variable that influences the
+    preamble of the real build. Returns the path of the ``.fmt`` file or
+    ``None``."""
+    fmt_dir = os.path.join(cache_dir, "latex_formats")
+    try:
+        preamble = render_preamble(header_file, fmt_dir, extra_args, docker_image)
+    except Exception as e:
+        logging.warning("Precompiled preamble disabled: %s", e)
+        return None
+    if PRECOMPILE_MARKER not in preamble:
+        logging.warning("Header has no precompile marker; not building a format")
+        return None
+
+    key = hash_text(engine, engine_key(engine, docker_image), preamble)
+    name = f"preamble_{key[:16]}"
+    fmt_file = os.path.join(fmt_dir, f"{name}.fmt")
+    failed_file = os.path.join(fmt_dir, f"{name}.failed")
+    if os.path.isfile(fmt_file):
+        logging.info("Reusing precompiled LaTeX format: %s", fmt_file)
+        return fmt_file
+    if os.path.isfile(failed_file):
+        logging.info("Precompiled LaTeX format %s is known not to work", name)
+        return None
+
+    tex_file = f"{name}.tex"
+    with open(os.path.join(fmt_dir, tex_file), "w", encoding="utf-8") as f:
+        f.write(preamble)
+    logging.info("Building precompiled LaTeX format %s ...", name)
+    steps = [
+        [engine, "-ini", f"-jobname={name}", f"&{engine}", "mylatexformat.ltx", tex_file],
+        [engine, f"-fmt={name}", "-interaction=nonstopmode", "-halt-on-error", tex_file],
+    ]
+    for cmd in steps:
+        out, err, code = run(
+            _command(cmd, fmt_dir, docker_image), cwd=fmt_dir, capture_output=True
+        )
+        if code != 0:
+            logging.warning(
+                "Precompiled LaTeX format %s unusable, building without it:\n%s",
+                name,
+                (out or "")[-2000:] + (err or ""),
+            )
+            with open(failed_file, "w", encoding="utf-8") as f:
+                f.write(" ".join(cmd) + "\n")
+            if os.path.exists(fmt_file):
+                os.remove(fmt_file)
+            return None
+    logging.info("Precompiled LaTeX format created: %s", fmt_file)
+    return fmt_file
+
+
+def format_engine_opt(fmt_file: str, docker: bool = False) -> str:
+    """Return the pandoc option that makes the PDF engine load ``fmt_file``."""
+    if docker:
+        fmt_file = f"{DOCKER_FORMAT_DIR}/{os.path.basename(fmt_file)}"
+    return f"--pdf-engine-opt=-fmt={fmt_file}"
@@ -2,14 +2,17 @@ import csv
 import logging
 import os
 import re
-from typing import List
+from typing import Dict, List
 
 import requests
 import tqdm
 
 
-def check_links(md_files: List[str], report_csv: str):
-    """Check HTTP links in markdown files and write a CSV report."""
+def check_links(md_files: List[str], report_csv: str) -> Dict[str, bool]:
+    """Check HTTP links in markdown files and write a CSV report.
+
+    Returns whether each checked link works, keyed by URL."""
+    status = {}
     try:
         with open(report_csv, "w", encoding="utf-8", newline="") as csvfile:
             writer = csv.writer(csvfile)
@@ -35,6 +38,7 @@ def check_links(md_files: List[str], report_csv: str):
                                         logging.info("✅ Good link found in %s: %s (Line %s)", md, url, lineno)
                                 except Exception as e:
                                     finding = ("💥❌", md, url, lineno, line, "unknown", str(e))
+                                status[url] = finding is None
                                 if finding:
                                     broken.append(finding)
                                     writer.writerow(finding)
@@ -42,11 +46,20 @@ def check_links(md_files: List[str], report_csv: str):
                 except Exception as e:
                     logging.warning("Failed to open %s for link check: %s", md, e)
             logging.info("--- Final Report: %s broken links, %s good links ---", len(broken), len(good))
+        return status
     except Exception as e:
         logging.error("Failed to check links and write report to CSV: %s", e)
         raise
 
 
+def link_works(url: str, timeout: int = 5) -> bool:
+    """Return whether ``url`` answers a HEAD request as ``check_links`` checks it."""
+    try:
+        return requests.head(url, timeout=timeout).status_code < 400
+    except Exception:
+        return False
+
+
 def check_images(md_files: List[str]):
     """Check if images (local or remote) referenced in markdown exist."""
     missing = []
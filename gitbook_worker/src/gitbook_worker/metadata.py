@@ -0,0 +1,92 @@
+"""YAML frontmatter of the markdown chapters, read once and shared.
+
+Only the lines up to the closing frontmatter delimiter are read, parsed with
+libyaml when it is available. Results are kept per file until the file
+changes, so every stage asking for a chapter's metadata gets the same parsed
+mapping without reading or parsing the file again."""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - optional dep
+    yaml = None
+
+# The libyaml based loader is much faster than the pure Python one.
+_Loader = getattr(yaml, "CSafeLoader", None) or getattr(yaml, "SafeLoader", None)
+
+FRONTMATTER_END = ("---", "...")
+
+# (path) -> ((mtime_ns, size), metadata, error)
+_cache: Dict[str, Tuple[Tuple[int, int], Any, str | None]] = {}
+_lock = threading.Lock()
+
+
+def read_frontmatter(path: str) -> str | None:
+    """Return the YAML frontmatter text of ``path`` or ``None``.
+
+    Reading stops at the closing ``---`` (or ``...``) line; a file without
+    one is read to the end as in pandoc."""
+    with open(path, encoding="utf-8") as f:
+        first = f.readline()
+        if not first.startswith("---"):
+            return None
+        lines = [first[3:]]
+        for line in f:
+            if line.rstrip() in FRONTMATTER_END:
+                break
+            lines.append(line)
+    return "".join(lines)
+
+
+def parse_frontmatter(text: str) -> Any:
+    """Parse frontmatter ``text`` with the fastest available safe loader."""
+    return yaml.load(text, Loader=_Loader)
+
+
+def chapter_metadata(path: str) -> Tuple[Any, str | None]:
+    """Return ``(metadata, error)`` of the chapter ``path``.
+
+    ``metadata`` is ``None`` for chapters without frontmatter; ``error``
+    describes a file or YAML error. Results are cached until the file's
+    modification time or size changes."""
+    try:
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+    except OSError as e:
+        return None, str(e)
+    with _lock:
+        cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1], cached[2]
+    meta, error = None, None
+    try:
+        text = read_frontmatter(path)
+        if text is not None:
+            # An empty block is frontmatter without any fields.
+            meta = parse_frontmatter(text)
+            if meta is None:
+                meta = {}
+    except Exception as e:
+        error = str(e)
+    with _lock:
+        _cache[path] = (key, meta, error)
+    return meta, error
+
+
+def load_metadata(
+    md_files: List[str], max_workers: int | None = None
+) -> Dict[str, Tuple[Any, str | None]]:
+    """Return ``chapter_metadata`` for all ``md_files``, read concurrently."""
+    if not yaml:
+        logging.warning("PyYAML not installed; skipping metadata.")
+        return {}
+    files = list(dict.fromkeys(md_files))
+    if len(files) <= 1 or max_workers == 1:
+        return {md: chapter_metadata(md) for md in files}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(files, pool.map(chapter_metadata, files)))
@@ -1,7 +1,145 @@
 import os
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from .utils import run
+from .cache import hash_file, hash_text
+from .docker_pool import WorkerContainer, run_name, stop_dispatched
+from .docker_tools import tex_cache_args
+from .utils import run_streaming
+
+# Reader format used for the combined GitBook markdown
+MARKDOWN_FORMAT = "gfm+emoji+fenced_divs+raw_attribute"
+
+# File extensions of the supported pandoc output formats
+FORMAT_EXTENSIONS = {
+    "pdf": ".pdf",
+    "html": ".html",
+    "epub": ".epub",
+    "json": ".json",
+}
+
+
+# Supported LaTeX engines, from most to least capable
+PDF_ENGINES = ("lualatex", "xelatex", "pdflatex")
+
+# Characters pdflatex typesets with its default utf8 input encoding and T1
+# fonts: Latin-1, Latin Extended-A, the common punctuation (dashes, quotes,
+# daggers, bullet, ellipsis, per mille, guillemets) and the euro sign.
+# Anything else (emoji, CJK, Greek, Latin Extended-B, ...) needs a Unicode
+# engine.
+NON_PDFLATEX_RE = re.compile(
+    r"[^\x00-\u017f\u2013\u2014\u2018-\u201e\u2020-\u2022\u2026\u2030"
+    r"\u2039\u203a\u20ac]"
+)
+
+
+def needs_unicode_engine(md_file: str) -> bool:
+    """Return ``True`` if ``md_file`` contains characters pdflatex cannot set."""
+    with open(md_file, encoding="utf-8") as f:
+        for line in f:
+            if NON_PDFLATEX_RE.search(line):
+                return True
+    return False
+
+
+def select_pdf_engine(requested: str, md_file: str | None = None) -> str:
+    """Resolve ``requested`` (an engine name or ``auto``) to a PDF engine.
+
+    ``auto`` picks ``pdflatex`` for books without emoji or other characters
+    outside its input encoding and ``lualatex`` otherwise."""
+    if requested != "auto":
+        if requested not in PDF_ENGINES:
+            raise ValueError(f"Unsupported PDF engine: {requested}")
+        return requested
+    if md_file and not needs_unicode_engine(md_file):
+        return "pdflatex"
+    return "lualatex"
+
+
+def _writer_args(
+    output_format: str, pdf_engine: str = "lualatex", toc: bool = True
+) -> list[str]:
+    """Return the pandoc writer options for ``output_format``."""
+    toc_args = ["--toc"] if toc else []
+    if output_format == "pdf":
+        return (
+            ["-t", "latex", f"--pdf-engine={pdf_engine}"]
+            + toc_args
+            + ["-V", "geometry=a4paper"]
+        )
+    if output_format == "html":
+        return ["-t", "html5", "--standalone"] + toc_args
+    if output_format == "epub":
+        return ["-t", "epub3"] + toc_args
+    if output_format == "json":
+        return ["-t", "json"]
+    raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def _reader_format(source: str, input_format: str | None) -> str:
+    """Return the pandoc reader format for ``source``.
+
+    Sources ending in ``.json`` are treated as a cached pandoc AST."""
+    if input_format:
+        return input_format
+    return "json" if source.endswith(".json") else MARKDOWN_FORMAT
+
+
+def output_path_for_format(output: str, output_format: str) -> str:
+    """Return ``output`` with the file extension of ``output_format``."""
+    base, _ = os.path.splitext(output)
+    return base + FORMAT_EXTENSIONS[output_format]
+
+
+def pandoc_ast_path(
+    combined_md: str,
+    cache_dir: str,
+    input_format: str = MARKDOWN_FORMAT,
+    filter_paths: list[str] | None = None,
+) -> str:
+    """Return the cache path of the pandoc JSON AST for ``combined_md``.
+
+    The file name is derived from the markdown content, the reader format and
+    the Lua filters applied to the AST, so an existing file can be reused as
+    long as neither the input nor the filters changed."""
+    parts = [hash_file(combined_md), input_format]
+    if filter_paths:
+        parts += [hash_file(p) for p in filter_paths]
+    key = hash_text(*parts)[:16]
+    return os.path.join(cache_dir, f"pandoc_ast_{key}.json")
+
+
+DOCKER_OUT_DIR = "/data"
+DOCKER_TEMP_DIR = "/temp"
+DOCKER_CLONE_DIR = "/gitbook_repo"
+
+
+def docker_pandoc_run_args(
+    out_dir: str,
+    temp_dir: str,
+    clone_dir: str,
+    filter_paths: list[str] | None,
+    volumes: list[tuple[str, str]] | None = None,
+    tex_cache: str | None = None,
+) -> list[str]:
+    """Return the ``docker run`` mount and environment options for pandoc."""
+    args = [
+        "-v",
+        f"{os.path.abspath(out_dir)}:{DOCKER_OUT_DIR}",
+        "-v",
+        f"{os.path.abspath(temp_dir)}:{DOCKER_TEMP_DIR}",
+        "-v",
+        f"{os.path.abspath(clone_dir)}:{DOCKER_CLONE_DIR}",
+    ]
+    if filter_paths:
+        for filter_dir in dict.fromkeys(os.path.dirname(p) for p in filter_paths):
+            args += ["-v", f"{filter_dir}:/filters"]
+    for host_dir, container_dir in volumes or []:
+        args += ["-v", f"{os.path.abspath(host_dir)}:{container_dir}"]
+    if tex_cache:
+        args += tex_cache_args(tex_cache)
+    return args
 
 
 def build_docker_pandoc_cmd(
@@ -12,55 +150,70 @@ def build_docker_pandoc_cmd(
     pdf_output: str,
     header_file: str,
     filter_paths: list[str] | None,
+    output_format: str = "pdf",
+    input_format: str | None = None,
+    extra_args: list[str] | None = None,
+    volumes: list[tuple[str, str]] | None = None,
+    tex_cache: str | None = None,
+    container: WorkerContainer | None = None,
+    pdf_engine: str = "lualatex",
 ) -> list[str]:
-    """Return the Docker command to run pandoc with optional Lua filters."""
+    """Return the Docker command to run pandoc with optional Lua filters.
+
+    ``output_format`` selects the pandoc writer (see ``FORMAT_EXTENSIONS``).
+    ``combined_md`` may also be a cached pandoc JSON AST. ``volumes`` are
+    additional ``(host_dir, container_dir)`` mounts. ``tex_cache`` is a
+    volume or host directory kept across runs for the TeX font caches
+    (see ``docker_tools.ensure_tex_cache``).
+
+    With ``container`` pandoc is dispatched via ``docker exec`` into a warm
+    container that was started with ``docker_pandoc_run_args``; otherwise a
+    fresh ``docker run --rm`` container is used, named and with an init
+    process so that a timeout can kill it (see ``stop_dispatched``).
+    ``pdf_engine`` is one of ``PDF_ENGINES``."""
     abs_out_dir = os.path.abspath(out_dir)
     abs_temp_dir = os.path.abspath(temp_dir)
-    abs_clone_dir = os.path.abspath(clone_dir)
 
-    docker_out_dir = "/data"
-    docker_temp_dir = "/temp"
-    docker_clone_dir = "/gitbook_repo"
+    def container_path(path: str, default_dir: str) -> str:
+        parent = os.path.dirname(os.path.abspath(path))
+        if parent == abs_temp_dir:
+            return f"{DOCKER_TEMP_DIR}/{os.path.basename(path)}"
+        if parent == abs_out_dir:
+            return f"{DOCKER_OUT_DIR}/{os.path.basename(path)}"
+        return f"{default_dir}/{os.path.basename(path)}"
 
-    docker_combined_md = f"/temp/{os.path.basename(combined_md)}"
-    docker_pdf_output = f"/data/{os.path.basename(pdf_output)}"
-    docker_header_file = f"/temp/{os.path.basename(header_file)}"
+    docker_combined_md = container_path(combined_md, DOCKER_TEMP_DIR)
+    docker_pdf_output = container_path(pdf_output, DOCKER_OUT_DIR)
+    docker_header_file = f"{DOCKER_TEMP_DIR}/{os.path.basename(header_file)}"
 
-    cmd = [
-        "docker",
-        "run",
-        "--rm",
-        "-v",
-        f"{abs_out_dir}:{docker_out_dir}",
-        "-v",
-        f"{abs_temp_dir}:{docker_temp_dir}",
-        "-v",
-        f"{abs_clone_dir}:{docker_clone_dir}",
-    ]
-    if filter_paths:
-        for p in filter_paths:
-            cmd += ["-v", f"{os.path.dirname(p)}:/filters"]
-    cmd += [
-        "erda-pandoc",
+    args = [
         docker_combined_md,
         "-o",
         docker_pdf_output,
         "-f",
-        "gfm+emoji+fenced_divs+raw_attribute",
-        "-t",
-        "latex",
-        "--pdf-engine=lualatex",
-        "--toc",
-        "-V",
-        "geometry=a4paper",
-        f"--resource-path={docker_clone_dir}",
-        "-H",
-        docker_header_file,
+        _reader_format(combined_md, input_format),
     ]
+    args += _writer_args(output_format, pdf_engine)
+    if extra_args:
+        args += extra_args
+    args.append(f"--resource-path={DOCKER_CLONE_DIR}")
+    if output_format == "pdf":
+        args += ["-H", docker_header_file]
     if filter_paths:
         for p in filter_paths:
-            cmd.append(f"--lua-filter=/filters/{os.path.basename(p)}")
-    return cmd
+            args.append(f"--lua-filter=/filters/{os.path.basename(p)}")
+
+    if container:
+        return container.exec_cmd(["pandoc"] + args, workdir=DOCKER_OUT_DIR)
+    run_args = docker_pandoc_run_args(
+        out_dir, temp_dir, clone_dir, filter_paths, volumes, tex_cache
+    )
+    return (
+        ["docker", "run", "--rm", "--init", "--name", run_name()]
+        + run_args
+        + ["erda-pandoc"]
+        + args
+    )
 
 
 def build_pandoc_cmd(
@@ -70,38 +223,109 @@ def build_pandoc_cmd(
     header_file: str,
     filter_paths: list[str] | None,
     extra_args: list[str] | None = None,
+    output_format: str = "pdf",
+    input_format: str | None = None,
+    pdf_engine: str = "lualatex",
+    toc: bool = True,
 ) -> list[str]:
-    """Return the pandoc command for local execution with optional Lua filters."""
+    """Return the pandoc command for local execution with optional Lua filters.
+
+    ``output_format`` selects the pandoc writer (see ``FORMAT_EXTENSIONS``).
+    ``combined_md`` may also be a cached pandoc JSON AST as returned by
+    ``pandoc_ast_path``; the reader is then switched to ``json``. The LaTeX
+    header is only passed to the PDF writer, which uses ``pdf_engine``.
+    ``toc=False`` omits the table of contents."""
     cmd = [
         "pandoc",
         combined_md,
         "-o",
         pdf_output,
         "-f",
-        "gfm+emoji+fenced_divs+raw_attribute",
-        "-t",
-        "latex",
-        "--pdf-engine=lualatex",
-        "--toc",
-        "-V",
-        "geometry=a4paper",
+        _reader_format(combined_md, input_format),
     ]
+    cmd.extend(_writer_args(output_format, pdf_engine, toc))
     if extra_args:
         cmd.extend(extra_args)
     args = []
     if filter_paths:
         args.extend(f"--lua-filter={p}" for p in filter_paths)
-    args.extend([f"--resource-path={resource_path}", "-H", header_file])
+    args.append(f"--resource-path={resource_path}")
+    if output_format == "pdf":
+        args.extend(["-H", header_file])
     cmd.extend(args)
     return cmd
 
 
-def run_pandoc(cmd: list[str]):
-    """Execute pandoc and return (stdout, stderr, exit_code)."""
+class LatexProgress:
+    """Report LaTeX runs and ``[page]`` counters found in streamed output.
+
+    TeX prints ``[n]`` (optionally followed by file names) whenever page
+    ``n`` is shipped out; pandoc announces every engine run with
+    ``Run #n`` in verbose mode."""
+
+    PAGE_RE = re.compile(r"\[(\d+)(?=[\]\s{<]|$)")
+    RUN_RE = re.compile(r"Run #(\d+)")
+
+    def __init__(self, label: str = "pandoc", every: int = 10):
+        self.label = label
+        self.every = every
+        self.pages = 0
+        self.runs = 0
+
+    def __call__(self, stream: str, line: str) -> None:
+        run_match = self.RUN_RE.search(line)
+        if run_match:
+            self.runs = int(run_match.group(1))
+            self.pages = 0
+            logging.info("%s: LaTeX run %s", self.label, self.runs)
+            return
+        for match in self.PAGE_RE.finditer(line):
+            page = int(match.group(1))
+            if page > self.pages:
+                if page == 1 or page // self.every > self.pages // self.every:
+                    logging.info("%s: page %s", self.label, page)
+                self.pages = page
+
+
+def run_pandoc(
+    cmd: list[str],
+    timeout: float | None = None,
+    tail_bytes: int = 64 * 1024,
+    label: str = "pandoc",
+):
+    """Execute pandoc and return (stdout, stderr, exit_code).
+
+    The output is streamed into the log while pandoc runs; only the last
+    ``tail_bytes`` of each stream are returned. A run exceeding ``timeout``
+    seconds is killed (see ``run_streaming``), inside a warm container too."""
     start = datetime.now()
     logging.info("Starting pandoc at %s", start.isoformat())
     logging.info("Pandoc command: %s", cmd)
-    out, err, code = run(cmd, capture_output=True)
+    out, err, code = run_streaming(
+        cmd,
+        timeout=timeout,
+        tail_bytes=tail_bytes,
+        on_line=LatexProgress(label),
+        log_prefix=f"[{label}] ",
+        on_timeout=lambda: stop_dispatched(cmd),
+    )
     end = datetime.now()
     logging.info("Pandoc finished at %s with exit code %s", end.isoformat(), code)
     return out, err, code
+
+
+def run_pandoc_formats(
+    cmds: dict[str, list[str]], max_workers: int | None = None, **kwargs
+) -> dict[str, tuple[str, str, int]]:
+    """Run one pandoc command per output format in parallel.
+
+    ``kwargs`` are passed on to ``run_pandoc``. Returns a mapping of output
+    format to ``(stdout, stderr, exit_code)``."""
+    if not cmds:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(cmds)) as pool:
+        futures = {
+            fmt: pool.submit(run_pandoc, cmd, label=f"pandoc {fmt}", **kwargs)
+            for fmt, cmd in cmds.items()
+        }
+        return {fmt: future.result() for fmt, future in futures.items()}
@@ -0,0 +1,154 @@
+"""Rate limits, retry delays and request statistics for AI services.
+
+All threads calling one provider share a limiter with a token bucket for
+requests per minute and one for tokens per minute, so concurrent reference
+checks stay within the provider's quota instead of running into HTTP 429."""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Dict
+
+# Upper bound of a single retry delay in seconds
+MAX_RETRY_DELAY = 60.0
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units a minute up to one minute's worth.
+
+    A rate of zero or less means no limit."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """Take ``amount`` units and return the seconds to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Larger requests than the capacity would never fit otherwise.
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until ``amount`` units are available; return the wait time."""
+        if self.rate <= 0:
+            return 0.0
+        wait = self._reserve(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class RequestStats:
+    """Latency and retries of the requests sent to one provider."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, retries: int, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.failures += not ok
+            self.retries += retries
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def summary(self) -> str:
+        if not self.calls:
+            return "no requests"
+        return (
+            f"{self.calls} requests, {self.failures} failed, {self.retries} "
+            f"retries, {self.total_seconds / self.calls:.2f} s average and "
+            f"{self.max_seconds:.2f} s maximum latency"
+        )
+
+
+class RateLimiter:
+    """Request and token buckets shared by all calls to one provider."""
+
+    def __init__(
+        self, requests_per_minute: float = 0, tokens_per_minute: float = 0
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.stats = RequestStats()
+
+    def acquire(self, tokens: int) -> float:
+        """Wait for a request slot and ``tokens``; return the time waited."""
+        return self.requests.acquire(1) + self.tokens.acquire(tokens)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_rate_limit(
+    provider: str, requests_per_minute: float = 0, tokens_per_minute: float = 0
+) -> RateLimiter:
+    """Set the limits of ``provider``; zero means unlimited."""
+    with _limiters_lock:
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        _limiters[provider.lower()] = limiter
+        return limiter
+
+
+def rate_limiter(provider: str) -> RateLimiter:
+    """Return the shared limiter of ``provider`` (unlimited by default)."""
+    with _limiters_lock:
+        return _limiters.setdefault(provider.lower(), RateLimiter())
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of ``text`` (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """Parse a ``Retry-After`` header given in seconds or as HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def retry_delay(
+    attempt: int, retry_after: float | None = None, base: float = 1.0
+) -> float:
+    """Return the delay before retry ``attempt`` (counting from 0).
+
+    The server's ``retry_after`` wins; otherwise the delay grows
+    exponentially with full jitter, capped at ``MAX_RETRY_DELAY``."""
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY)
+    return random.uniform(0, min(MAX_RETRY_DELAY, base * 2**attempt))
+
+
+def log_stats() -> None:
+    """Log the request statistics of every provider used."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    for provider, limiter in limiters.items():
+        if limiter.stats.calls:
+            logging.info("AI requests (%s): %s", provider, limiter.stats.summary())
@@ -0,0 +1,226 @@
+"""Readability scores of markdown chapters computed on their prose only.
+
+Code blocks, tables, URLs and markup would otherwise count as words and
+sentences and skew the scores. Chapters are scored in a process pool and the
+results are cached by content hash, so unchanged chapters are not rescored."""
+
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple
+
+from .cache import hash_file, hash_text, load_json, save_json
+
+try:
+    import textstat
+except ImportError:  # pragma: no cover - optional dep
+    textstat = None
+
+# Bump when ``strip_to_prose`` changes so cached scores are recomputed.
+PROSE_VERSION = 1
+
+CACHE_FILE = "readability.json"
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+_INLINE_RES = [
+    (re.compile(r"<!--.*?-->"), ""),
+    (re.compile(r"`+[^`]*`+"), ""),
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), ""),
+    (re.compile(r"\[\^[^\]]+\]"), ""),
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"\[([^\]]+)\]\[[^\]]*\]"), r"\1"),
+    (re.compile(r"<?(?:https?|ftp)://[^\s>)]+>?"), ""),
+    (re.compile(r"<[^>]+>"), ""),
+    (re.compile(r"[*_~]{1,3}"), ""),
+]
+
+
+def _prose_line(line: str) -> str:
+    line = line.strip()
+    if line.startswith(">"):
+        line = line.lstrip("> ")
+    is_item = bool(_LIST_RE.match(line))
+    line = _LIST_RE.sub("", line)
+    for pattern, repl in _INLINE_RES:
+        line = pattern.sub(repl, line)
+    line = line.strip()
+    # List items rarely end with punctuation; count each as a sentence.
+    if is_item and line and line[-1] not in ".!?:;":
+        line += "."
+    return line
+
+
+def split_prose_sections(text: str) -> List[Tuple[str, int, str]]:
+    """Return the prose of ``text`` as ``(heading, line, prose)`` sections.
+
+    Front matter, code blocks, tables, HTML comments, images, URLs and inline
+    markup are dropped; link texts are kept. Headings start a new section
+    and are not part of the prose. Text before the first heading belongs to
+    a section with an empty heading at line 1."""
+    sections: List[Tuple[str, int, List[str]]] = [("", 1, [])]
+    lines = text.splitlines()
+    start = 0
+    if lines and lines[0].strip() == "---":
+        for i in range(1, len(lines)):
+            if lines[i].strip() in ("---", "..."):
+                start = i + 1
+                break
+    fence = None
+    in_comment = False
+    for lineno, line in enumerate(lines[start:], start + 1):
+        match = _FENCE_RE.match(line)
+        if match:
+            if fence is None:
+                fence = match.group(1)
+            elif fence == match.group(1):
+                fence = None
+            continue
+        if fence is not None:
+            continue
+        if in_comment:
+            if "-->" in line:
+                in_comment = False
+                line = line.split("-->", 1)[1]
+            else:
+                continue
+        if "<!--" in line and "-->" not in line.split("<!--", 1)[1]:
+            in_comment = True
+            line = line.split("<!--", 1)[0]
+        heading = _HEADING_RE.match(line)
+        if heading:
+            sections.append((_prose_line(heading.group(2)), lineno, []))
+            continue
+        if line.lstrip().startswith("|"):
+            continue
+        prose = _prose_line(line)
+        sections[-1][2].append(prose)
+    return [
+        (heading, line, "\n".join(prose))
+        for heading, line, prose in sections
+        if heading or any(prose)
+    ]
+
+
+def strip_to_prose(text: str) -> str:
+    """Return the prose of the markdown ``text`` (see ``split_prose_sections``)."""
+    return "\n".join(prose for _, _, prose in split_prose_sections(text))
+
+
+def _scores(prose: str) -> Dict[str, float | int | None]:
+    words = len(prose.split())
+    if not words:
+        return {"fre": None, "fk": None, "words": 0}
+    return {
+        "fre": textstat.flesch_reading_ease(prose),
+        "fk": textstat.flesch_kincaid_grade(prose),
+        "words": words,
+    }
+
+
+def score_markdown(text: str, sections: bool = False) -> dict:
+    """Return the readability of the markdown ``text``.
+
+    The result holds the Flesch reading ease ``fre``, the Flesch-Kincaid
+    grade ``fk`` and the number of prose ``words``. With ``sections=True``
+    it also lists the same scores per heading under ``sections``."""
+    parts = split_prose_sections(text)
+    result = _scores("\n".join(prose for _, _, prose in parts))
+    if sections:
+        result["sections"] = [
+            {"heading": heading, "line": line, **_scores(prose)}
+            for heading, line, prose in parts
+        ]
+    return result
+
+
+def _score_file(path: str, sections: bool) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return score_markdown(f.read(), sections)
+
+
+def _score_files(
+    todo: Dict[str, str], sections: bool, max_workers: int | None
+) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+
+    def collect(path, get):
+        try:
+            results[path] = get()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            logging.warning("Readability check failed for %s: %s", path, e)
+
+    if len(todo) > 1 and max_workers != 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {p: pool.submit(_score_file, p, sections) for p in todo}
+                for path, future in futures.items():
+                    collect(path, future.result)
+            return results
+        except (BrokenProcessPool, OSError) as e:
+            logging.warning("Process pool unavailable, scoring serially: %s", e)
+            results.clear()
+    for path in todo:
+        collect(path, lambda: _score_file(path, sections))
+    return results
+
+
+def readability_scores(
+    md_files: List[str],
+    cache_dir: str | None = None,
+    sections: bool = False,
+    max_workers: int | None = None,
+) -> Dict[str, dict]:
+    """Return ``score_markdown`` results for ``md_files`` keyed by file.
+
+    Files are scored in parallel by up to ``max_workers`` processes. With a
+    ``cache_dir`` results are reused for files whose content did not change.
+    Files that cannot be read are logged and left out."""
+    if not textstat:
+        logging.warning("textstat not installed; skipping readability checks.")
+        return {}
+    cache_file = os.path.join(cache_dir, CACHE_FILE) if cache_dir else None
+    cache = load_json(cache_file, {}) if cache_file else {}
+    keys: Dict[str, str] = {}
+    for md in md_files:
+        try:
+            keys[md] = hash_text(
+                hash_file(md), sections, PROSE_VERSION, textstat.__version__
+            )
+        except OSError as e:
+            logging.warning("Readability check failed for %s: %s", md, e)
+    todo = {md: key for md, key in keys.items() if key not in cache}
+    if todo:
+        logging.info(
+            "Scoring readability of %s files (%s cached)",
+            len(todo),
+            len(keys) - len(todo),
+        )
+    scored = _score_files(todo, sections, max_workers)
+    if cache_file and scored:
+        paths = {os.path.abspath(md) for md in keys}
+        current = set(keys.values())
+        # Drop results of earlier versions of these files.
+        cache = {
+            k: v
+            for k, v in cache.items()
+            if k in current or v.get("path") not in paths
+        }
+        for md, key in keys.items():
+            if md in scored:
+                cache[key] = {"path": os.path.abspath(md), **scored[md]}
+        try:
+            save_json(cache_file, cache)
+        except OSError as e:
+            logging.warning("Could not write readability cache: %s", e)
+    results = {}
+    for md, key in keys.items():
+        result = scored.get(md) or cache.get(key)
+        if result:
+            results[md] = {k: v for k, v in result.items() if k != "path"}
+    return results
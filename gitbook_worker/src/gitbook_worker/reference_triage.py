@@ -0,0 +1,101 @@
+"""Local checks of source references before they are sent to an AI service.
+
+References that are nothing but a link, a DOI or an ISBN can be verified
+without an AI request: links by the link check, DOIs by their syntax and
+ISBNs by their checksum. Only references that fail these checks or are full
+citations are left for the AI."""
+
+import re
+from datetime import date
+from typing import Any, Callable, Dict, Tuple
+
+from .linkcheck import link_works
+
+DOI_RE = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>]+)")
+ISBN_RE = re.compile(r"\bISBN(?:-1[03])?:?\s*([0-9][0-9\- ]{8,15}[0-9Xx])\b", re.I)
+URL_RE = re.compile(r"<?(https?://[^\s<>]+)>?")
+MD_LINK_RE = re.compile(r"\[[^\]]*\]\((https?://[^)\s]+)\)")
+_NUMBERING_RE = re.compile(r"^\s*(?:[0-9a-z\*]+[\.)]|[-*+])\s+")
+# Labels that may accompany a lone identifier
+_LABEL_RE = re.compile(r"\b(?:doi|isbn(?:-1[03])?|url|online|link)\b", re.I)
+
+
+def isbn_valid(isbn: str) -> bool:
+    """Return whether ``isbn`` (ISBN-10 or ISBN-13) has a valid checksum."""
+    digits = re.sub(r"[\s-]", "", isbn).upper()
+    if re.fullmatch(r"\d{9}[\dX]", digits):
+        values = [10 if c == "X" else int(c) for c in digits]
+        return sum((10 - i) * v for i, v in enumerate(values)) % 11 == 0
+    if re.fullmatch(r"97[89]\d{10}", digits):
+        return sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(digits)) % 10 == 0
+    return False
+
+
+def doi_valid(doi: str) -> bool:
+    """Return whether ``doi`` is a syntactically valid DOI."""
+    return bool(re.fullmatch(r"10\.\d{4,9}/\S*[^\s.,;]", doi))
+
+
+def classify_reference(line: str) -> Tuple[str, str | None]:
+    """Return the kind of reference ``line`` and its identifier.
+
+    The kind is ``doi``, ``isbn`` or ``url`` if the reference consists of
+    that identifier only (besides a link text and a label such as
+    ``DOI:``), otherwise ``citation`` with no identifier."""
+    text = _NUMBERING_RE.sub("", line, count=1)
+    urls = MD_LINK_RE.findall(text)
+    rest = MD_LINK_RE.sub(" ", text)
+    urls += URL_RE.findall(rest)
+    rest = URL_RE.sub(" ", rest)
+    dois = DOI_RE.findall(rest)
+    rest = DOI_RE.sub(" ", rest)
+    isbns = ISBN_RE.findall(rest)
+    rest = ISBN_RE.sub(" ", rest)
+    if re.search(r"\w", _LABEL_RE.sub(" ", rest)):
+        return "citation", None
+    # Links to doi.org and the like carry the DOI.
+    dois += [m.group(1) for m in map(DOI_RE.search, urls) if m]
+    found = [("doi", d.rstrip(".,;")) for d in dois]
+    found += [("isbn", i) for i in isbns]
+    if not found:
+        found = [("url", u.rstrip(".,;")) for u in urls]
+    if len(found) != 1:
+        return "citation", None
+    return found[0]
+
+
+def triage_reference(
+    line: str,
+    link_status: Dict[str, bool] | None = None,
+    check_link: Callable[[str], bool] = link_works,
+) -> Dict[str, Any] | None:
+    """Check reference ``line`` locally.
+
+    Returns a result in the format of the AI answers if the reference is a
+    lone link, DOI or ISBN that checks out, otherwise ``None``. Links are
+    looked up in ``link_status`` (the result of ``check_links``) and
+    checked with ``check_link`` if missing there."""
+    kind, identifier = classify_reference(line)
+    if kind == "doi":
+        ok, hint = doi_valid(identifier), "DOI-Syntax lokal geprüft"
+    elif kind == "isbn":
+        ok, hint = isbn_valid(identifier), "ISBN-Prüfziffer lokal geprüft"
+    elif kind == "url":
+        if link_status and identifier in link_status:
+            ok = link_status[identifier]
+        else:
+            ok = check_link(identifier)
+        hint = "Link lokal geprüft"
+    else:
+        return None
+    if not ok:
+        return None
+    return {
+        "success": True,
+        "org": line,
+        "new": None,
+        "error": None,
+        "hint": hint,
+        "validation_date": date.today().isoformat(),
+        "type": "external url" if kind == "url" else "external reference",
+    }
@@ -1,9 +1,42 @@
 import logging
 import os
+import re
 import stat
 import shutil
+import time
+from typing import Dict, List
 
-from .utils import run
+from .cache import hash_text
+from .toolchain import default_cache_file
+from .utils import parse_summary, run
+
+# How much of the repository ``clone_or_update_repo`` fetches:
+#   full     all history and blobs
+#   shallow  only the tip commit (``--depth 1``)
+#   partial  all commits, blobs fetched on demand (``--filter=blob:none``)
+#   sparse   partial clone with only SUMMARY.md, its chapters and the
+#            directories of their images checked out
+CLONE_STRATEGIES = ("full", "shallow", "partial", "sparse")
+
+CLONE_ARGS = {
+    "full": [],
+    "shallow": ["--depth", "1"],
+    "partial": ["--filter=blob:none"],
+    "sparse": ["--filter=blob:none", "--no-checkout"],
+}
+
+# Always part of a sparse checkout
+SPARSE_BASE_PATTERNS = [
+    "/SUMMARY.md",
+    "/README.md",
+    "/book.json",
+    "/.gitbook.yaml",
+    "/.gitbook/assets/",
+]
+
+_LOCAL_IMAGE_RE = re.compile(
+    r"!\[[^\]]*\]\(\s*<?([^\s)>]+)|<img[^>]+src=[\"']([^\"']+)"
+)
 
 
 def remove_readonly(func, path, excinfo):
@@ -30,13 +63,239 @@ def checkout_branch(repo_dir: str, branch_name: str) -> None:
         raise
 
 
+def default_mirror_dir() -> str:
+    """Return the per-user directory of the bare mirror repositories."""
+    return os.path.join(os.path.dirname(default_cache_file()), "mirrors")
+
+
+def mirror_path(repo_url: str, mirror_dir: str | None = None) -> str:
+    """Return the bare mirror repository of ``repo_url`` in ``mirror_dir``."""
+    name = repo_url.rstrip("/").rsplit("/", 1)[-1]
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+    if name.endswith(".git"):
+        name = name[:-4]
+    return os.path.join(
+        mirror_dir or default_mirror_dir(), f"{name}-{hash_text(repo_url)[:12]}.git"
+    )
+
+
+def update_mirror(
+    repo_url: str, branch_name: str | None = None, mirror_dir: str | None = None
+) -> str:
+    """Create or update the bare mirror of ``repo_url`` and return its path.
+
+    Only ``branch_name`` is fetched (all branches without one), so an update
+    downloads just the new objects of that branch. Clones refer to the
+    mirror's objects instead of copying them, so mirrors must never be
+    pruned or garbage collected with ``--prune=now``."""
+    path = mirror_path(repo_url, mirror_dir)
+    if not os.path.isdir(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        run(["git", "init", "--bare", "--quiet", path])
+        run(["git", "-C", path, "remote", "add", "origin", repo_url])
+        logging.info("Created mirror of %s in %s", repo_url, path)
+    if branch_name:
+        refspec = f"+refs/heads/{branch_name}:refs/heads/{branch_name}"
+    else:
+        refspec = "+refs/heads/*:refs/heads/*"
+    run(["git", "-C", path, "fetch", "--quiet", "origin", refspec])
+    return path
+
+
+def use_mirror_objects(clone_dir: str, mirror: str) -> None:
+    """Let the existing clone ``clone_dir`` borrow objects from ``mirror``."""
+    alternates = os.path.join(clone_dir, ".git", "objects", "info", "alternates")
+    objects = os.path.abspath(os.path.join(mirror, "objects"))
+    try:
+        with open(alternates, encoding="utf-8") as f:
+            if objects in f.read().splitlines():
+                return
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(alternates), exist_ok=True)
+    with open(alternates, "a", encoding="utf-8") as f:
+        f.write(objects + "\n")
+
+
+def _clone(
+    repo_url: str,
+    clone_dir: str,
+    branch_name: str | None,
+    strategy: str,
+    mirror: str | None = None,
+) -> None:
+    cmd = ["git", "clone"] + CLONE_ARGS[strategy]
+    if mirror:
+        cmd += ["--reference", mirror]
+    if branch_name:
+        cmd += ["--branch", branch_name]
+    run(cmd + [repo_url, clone_dir])
+    if strategy == "sparse":
+        # Check out SUMMARY.md first to learn which chapters are needed.
+        set_sparse_patterns(clone_dir, SPARSE_BASE_PATTERNS)
+        run(["git", "-C", clone_dir, "checkout"])
+
+
+def set_sparse_patterns(clone_dir: str, patterns: List[str]) -> None:
+    """Restrict the worktree of ``clone_dir`` to the gitignore-style ``patterns``."""
+    run(
+        ["git", "-C", clone_dir, "sparse-checkout", "set", "--no-cone", "--stdin"],
+        input_text="\n".join(patterns) + "\n",
+    )
+
+
+def _repo_path(clone_dir: str, path: str) -> str | None:
+    rel = os.path.relpath(os.path.normpath(path), clone_dir)
+    if rel.startswith(".."):
+        return None
+    return "/" + rel.replace(os.sep, "/")
+
+
+def sparse_patterns(clone_dir: str) -> List[str]:
+    """Return sparse-checkout patterns for the book checked out in ``clone_dir``.
+
+    Besides ``SPARSE_BASE_PATTERNS`` these are the chapters listed in
+    SUMMARY.md and the directories of the local images the chapters refer
+    to, so the chapters must already be checked out."""
+    patterns = list(SPARSE_BASE_PATTERNS)
+    summary = os.path.join(clone_dir, "SUMMARY.md")
+    if not os.path.isfile(summary):
+        logging.warning("SUMMARY.md not found in %s", clone_dir)
+        return patterns
+    for md in parse_summary(summary):
+        chapter = _repo_path(clone_dir, md)
+        if chapter:
+            patterns.append(chapter)
+        if not os.path.isfile(md):
+            continue
+        with open(md, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        for match in _LOCAL_IMAGE_RE.finditer(text):
+            target = match.group(1) or match.group(2)
+            if re.match(r"^[a-z]+:", target, re.IGNORECASE):
+                continue
+            base = clone_dir if target.startswith("/") else os.path.dirname(md)
+            image_dir = _repo_path(
+                clone_dir, os.path.dirname(os.path.join(base, target.lstrip("/")))
+            )
+            if image_dir and image_dir != "/":
+                patterns.append(image_dir + "/")
+    return list(dict.fromkeys(patterns))
+
+
+def update_sparse_checkout(clone_dir: str) -> None:
+    """Check out the chapters of SUMMARY.md and their image directories."""
+    patterns = sparse_patterns(clone_dir)
+    set_sparse_patterns(clone_dir, patterns)
+    # Image directories are only found once the chapters are checked out.
+    with_images = sparse_patterns(clone_dir)
+    if with_images != patterns:
+        set_sparse_patterns(clone_dir, with_images)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def clone_stats(clone_dir: str) -> Dict[str, int]:
+    """Return the bytes used by ``.git`` and by the worktree of ``clone_dir``."""
+    git_bytes = _dir_size(os.path.join(clone_dir, ".git"))
+    return {
+        "git_bytes": git_bytes,
+        "worktree_bytes": _dir_size(clone_dir) - git_bytes,
+    }
+
+
+def remote_branch_head(clone_dir: str, branch_name: str) -> str | None:
+    """Return the commit of ``branch_name`` on ``origin`` or ``None``."""
+    out, err, code = run(
+        ["git", "-C", clone_dir, "ls-remote", "origin", f"refs/heads/{branch_name}"],
+        capture_output=True,
+    )
+    if code != 0:
+        logging.warning("git ls-remote failed: %s", err.strip())
+        return None
+    fields = out.split()
+    return fields[0] if fields else None
+
+
+def local_head(clone_dir: str) -> str | None:
+    """Return the commit checked out in ``clone_dir`` or ``None``."""
+    out, _, code = run(
+        ["git", "-C", clone_dir, "rev-parse", "HEAD"], capture_output=True
+    )
+    return (out.strip() or None) if code == 0 else None
+
+
+def has_local_changes(clone_dir: str, untracked: bool = True) -> bool:
+    """Return ``True`` if the checkout in ``clone_dir`` differs from its commit.
+
+    Untracked files count as changes unless ``untracked`` is ``False``. A
+    failing ``git status`` is reported as changed."""
+    cmd = ["git", "-C", clone_dir, "status", "--porcelain"]
+    if not untracked:
+        cmd.append("--untracked-files=no")
+    out, _, code = run(cmd, capture_output=True)
+    return code != 0 or bool(out.strip())
+
+
+def is_up_to_date(clone_dir: str, branch_name: str | None) -> bool:
+    """Return ``True`` if ``clone_dir`` has the remote tip of ``branch_name``
+    checked out without changes to tracked files.
+
+    Untracked files such as build artifacts are allowed."""
+    if not branch_name or not os.path.isdir(os.path.join(clone_dir, ".git")):
+        return False
+    head = local_head(clone_dir)
+    if not head or head != remote_branch_head(clone_dir, branch_name):
+        return False
+    return not has_local_changes(clone_dir, untracked=False)
+
+
 def clone_or_update_repo(
     repo_url: str,
     clone_dir: str,
     branch_name: str | None = None,
     force: bool = False,
-) -> None:
-    if os.path.isdir(clone_dir):
+    strategy: str = "full",
+    mirror_dir: str | None = None,
+) -> Dict[str, object]:
+    """Clone ``repo_url`` into ``clone_dir`` or update an existing clone.
+
+    ``strategy`` is one of ``CLONE_STRATEGIES`` and applies to new clones;
+    updates of a sparse clone refresh its checkout from SUMMARY.md. With a
+    ``mirror_dir`` the branch is first fetched into a shared bare mirror
+    (see ``update_mirror``) and new clones borrow its objects via
+    ``--reference``, so each object is downloaded and stored once per host.
+    An existing clone whose HEAD already is the remote tip of
+    ``branch_name`` and has no changes to tracked files is left alone: no
+    fetch, reset or clean, so build artifacts in the tree survive.
+
+    Returns the strategy, the elapsed seconds, the disk usage (see
+    ``clone_stats``), the checked out ``head`` and whether it ``changed``
+    compared to the clone found in ``clone_dir``, so later stages can skip
+    work as well."""
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(f"Unknown clone strategy: {strategy}")
+    start = time.perf_counter()
+    previous = None
+    unchanged = False
+    if os.path.isdir(os.path.join(clone_dir, ".git")):
+        previous = local_head(clone_dir)
+        unchanged = is_up_to_date(clone_dir, branch_name)
+    mirror = None
+    if mirror_dir and not unchanged:
+        mirror = update_mirror(repo_url, branch_name, mirror_dir)
+    if unchanged:
+        logging.info("Remote branch '%s' has not moved, skipping update", branch_name)
+    elif os.path.isdir(clone_dir):
         resp = "y" if force else input(
             f"Directory '{clone_dir}' exists. Clean and reclone? (y/N) "
         ).strip().lower()
@@ -45,6 +304,8 @@ def clone_or_update_repo(
                 try:
                     run(["git", "-C", clone_dir, "status"], capture_output=True)
                     logging.info("Valid Git repository found: %s", clone_dir)
+                    if mirror:
+                        use_mirror_objects(clone_dir, mirror)
                     run(["git", "-C", clone_dir, "fetch", "--all"])
                     run(["git", "-C", clone_dir, "reset", "--hard", f"origin/{branch_name}"])
                     run(["git", "-C", clone_dir, "clean", "-fdx"])
@@ -52,21 +313,39 @@ def clone_or_update_repo(
                     logging.warning("Git command failed. Re-cloning repository.")
                     logging.info("Cleaning directory: %s", clone_dir)
                     remove_tree(clone_dir)
-                    run(["git", "clone", repo_url, clone_dir])
+                    _clone(repo_url, clone_dir, branch_name, strategy, mirror)
             else:
                 logging.info("Cleaning non-repo directory: %s", clone_dir)
                 remove_tree(clone_dir)
-                if branch_name:
-                    run(["git", "clone", "--branch", branch_name, repo_url, clone_dir])
-                else:
-                    run(["git", "clone", repo_url, clone_dir])
+                _clone(repo_url, clone_dir, branch_name, strategy, mirror)
         else:
+            if mirror and os.path.isdir(os.path.join(clone_dir, ".git")):
+                use_mirror_objects(clone_dir, mirror)
             run(["git", "-C", clone_dir, "fetch", "--all"])
             run(["git", "-C", clone_dir, "checkout", branch_name])
             run(["git", "-C", clone_dir, "pull", "origin", branch_name])
     else:
-        if branch_name:
-            run(["git", "clone", "--branch", branch_name, repo_url, clone_dir])
-        else:
-            run(["git", "clone", repo_url, clone_dir])
+        _clone(repo_url, clone_dir, branch_name, strategy, mirror)
+    if (
+        not unchanged
+        and strategy == "sparse"
+        and os.path.isfile(os.path.join(clone_dir, ".git", "info", "sparse-checkout"))
+    ):
+        update_sparse_checkout(clone_dir)
+    head = previous if unchanged else local_head(clone_dir)
+    stats: Dict[str, object] = {
+        "strategy": strategy,
+        "seconds": time.perf_counter() - start,
+        **clone_stats(clone_dir),
+        "head": head,
+        "changed": head is None or head != previous,
+    }
+    logging.info(
+        "Repository ready in %.1fs (%s): .git %.1f MB, worktree %.1f MB",
+        stats["seconds"],
+        strategy,
+        stats["git_bytes"] / 1e6,
+        stats["worktree_bytes"] / 1e6,
+    )
+    return stats
 
@@ -0,0 +1,106 @@
+"""JSON schemas for AI answers: provider request options and validation.
+
+The schema is sent with the request where the provider supports structured
+output (OpenAI ``response_format``, Gemini ``responseSchema``), so answers
+are plain JSON instead of free text. Every answer is still validated against
+the schema before it is used."""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+# OpenAI models supporting ``json_schema`` answers and those only supporting
+# ``json_object``; other models get no response format.
+OPENAI_SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+OPENAI_JSON_MODELS = ("gpt-4-turbo", "gpt-3.5-turbo")
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+    "null": type(None),
+}
+
+
+def _types(schema: Dict[str, Any]) -> List[str]:
+    kind = schema.get("type", [])
+    return [kind] if isinstance(kind, str) else list(kind)
+
+
+def _has_type(value: Any, kind: str) -> bool:
+    if isinstance(value, bool) and kind in ("integer", "number"):
+        return False
+    return isinstance(value, _TYPES[kind])
+
+
+def validate_json(data: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """Return the violations of ``schema`` by ``data`` (empty if valid).
+
+    Supports the subset used here: ``type`` (also as list), ``properties``,
+    ``required``, ``items`` and ``enum``."""
+    kinds = _types(schema)
+    if kinds and not any(_has_type(data, kind) for kind in kinds):
+        return [f"{path}: expected {' or '.join(kinds)}, got {type(data).__name__}"]
+    errors = []
+    if "enum" in schema and data is not None and data not in schema["enum"]:
+        errors.append(f"{path}: {data!r} not in {schema['enum']}")
+    if isinstance(data, dict):
+        for name in schema.get("required", []):
+            if name not in data:
+                errors.append(f"{path}: missing {name!r}")
+        for name, sub in schema.get("properties", {}).items():
+            if name in data:
+                errors += validate_json(data[name], sub, f"{path}.{name}")
+    if isinstance(data, list) and "items" in schema:
+        for i, item in enumerate(data):
+            errors += validate_json(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+def parse_json_answer(text: str) -> Tuple[bool, Any]:
+    """Parse an answer given as JSON, possibly wrapped in a code fence."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    try:
+        return True, json.loads(text)
+    except json.JSONDecodeError as e:
+        return False, f"invalid JSON: {e}"
+
+
+def gemini_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate ``schema`` to the OpenAPI subset of Gemini's ``responseSchema``."""
+    result: Dict[str, Any] = {}
+    kinds = _types(schema)
+    if kinds:
+        non_null = [kind for kind in kinds if kind != "null"]
+        result["type"] = (non_null or ["string"])[0].upper()
+        if "null" in kinds:
+            result["nullable"] = True
+    for key in ("description", "enum", "required"):
+        if key in schema:
+            result[key] = schema[key]
+    if "properties" in schema:
+        result["properties"] = {
+            name: gemini_schema(sub) for name, sub in schema["properties"].items()
+        }
+    if "items" in schema:
+        result["items"] = gemini_schema(schema["items"])
+    return result
+
+
+def openai_response_format(
+    model: str, schema: Dict[str, Any], name: str
+) -> Dict[str, Any] | None:
+    """Return the ``response_format`` for ``model`` or ``None``."""
+    if model.startswith(OPENAI_SCHEMA_MODELS):
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": name, "schema": schema},
+        }
+    if model.startswith(OPENAI_JSON_MODELS):
+        return {"type": "json_object"}
+    return None
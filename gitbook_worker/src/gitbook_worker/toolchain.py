@@ -0,0 +1,221 @@
+"""Cached probes of the external toolchain (pandoc, fontconfig).
+
+Results are stored in a small JSON file that survives between runs. Every
+entry remembers the state it was derived from (binary path and mtime,
+fontconfig cache timestamps), so an entry is only reused as long as that
+state is unchanged."""
+
+import glob
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+from typing import Any, Dict, FrozenSet, Tuple
+
+from .cache import load_json, save_json
+
+# Directories fontconfig writes its caches to; fc-cache touches them whenever
+# fonts are added or removed.
+FONTCONFIG_CACHE_DIRS = [
+    "~/.cache/fontconfig",
+    "~/.fontconfig",
+    "/var/cache/fontconfig",
+    "/usr/local/var/cache/fontconfig",
+    "/usr/lib/fontconfig/cache",
+]
+
+# Parsed in-memory copies of the probe results of this process
+_memory: Dict[str, Any] = {}
+
+
+def default_cache_file() -> str:
+    """Return the path of the toolchain probe cache.
+
+    ``GITBOOK_WORKER_TOOLCHAIN_CACHE`` overrides the per-user default."""
+    path = os.environ.get("GITBOOK_WORKER_TOOLCHAIN_CACHE")
+    if path:
+        return path
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "gitbook-worker", "toolchain.json")
+
+
+def _load(cache_file: str | None) -> Tuple[str, Dict[str, Any]]:
+    cache_file = cache_file or default_cache_file()
+    data = load_json(cache_file, {})
+    return cache_file, data if isinstance(data, dict) else {}
+
+
+def _store(cache_file: str, data: Dict[str, Any]) -> None:
+    try:
+        save_json(cache_file, data)
+    except OSError as e:
+        logging.warning("Could not write toolchain cache %s: %s", cache_file, e)
+
+
+def binary_key(name: str) -> str | None:
+    """Return ``"<path>:<mtime_ns>"`` of the executable ``name`` or ``None``."""
+    path = shutil.which(name)
+    if not path:
+        return None
+    try:
+        return f"{os.path.realpath(path)}:{os.stat(path).st_mtime_ns}"
+    except OSError:
+        return None
+
+
+def fontconfig_stamp() -> str:
+    """Return the newest modification time of the fontconfig caches."""
+    newest = 0
+    for pattern in FONTCONFIG_CACHE_DIRS:
+        directory = os.path.expanduser(pattern)
+        for path in [directory] + glob.glob(os.path.join(directory, "*")):
+            try:
+                newest = max(newest, os.stat(path).st_mtime_ns)
+            except OSError:
+                continue
+    return str(newest)
+
+
+def pandoc_version(cache_file: str | None = None) -> Tuple[int, ...]:
+    """Return the installed pandoc version, probing only if pandoc changed."""
+    key = binary_key("pandoc")
+    if key is None:
+        logging.warning("pandoc not found")
+        return (0,)
+    if _memory.get("pandoc_key") == key:
+        return _memory["pandoc_version"]
+
+    cache_file, data = _load(cache_file)
+    entry = data.get("pandoc", {})
+    if entry.get("key") == key:
+        version = tuple(entry["version"])
+    else:
+        version = _probe_pandoc_version()
+        if version != (0,):
+            data["pandoc"] = {"key": key, "version": list(version)}
+            _store(cache_file, data)
+    _memory["pandoc_key"] = key
+    _memory["pandoc_version"] = version
+    return version
+
+
+def _probe_pandoc_version() -> Tuple[int, ...]:
+    try:
+        result = subprocess.run(
+            ["pandoc", "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+    except OSError as e:
+        logging.warning("pandoc --version failed: %s", e)
+        return (0,)
+    if result.returncode != 0 or not result.stdout:
+        logging.warning("pandoc --version failed")
+        return (0,)
+    first = result.stdout.splitlines()[0]
+    m = re.search(r"pandoc\s+([0-9]+(?:\.[0-9]+)*)", first)
+    if not m:
+        logging.warning("Unable to parse pandoc version from: %s", first)
+        return (0,)
+    return tuple(int(p) for p in m.group(1).split("."))
+
+
+def font_families(cache_file: str | None = None) -> FrozenSet[str]:
+    """Return the lower-cased family names of all installed fonts.
+
+    The list is read with ``fc-list`` once and cached until ``fc-list`` or the
+    fontconfig caches change. Without fontconfig an empty set is returned."""
+    fc_key = binary_key("fc-list")
+    if fc_key is None:
+        return frozenset()
+    key = f"{fc_key}|{fontconfig_stamp()}"
+    if _memory.get("fonts_key") == key:
+        return _memory["fonts"]
+
+    cache_file, data = _load(cache_file)
+    entry = data.get("fonts", {})
+    if entry.get("key") == key:
+        families = frozenset(entry["families"])
+    else:
+        families = _probe_font_families()
+        if families is not None:
+            data["fonts"] = {"key": key, "families": sorted(families)}
+            _store(cache_file, data)
+        families = families or frozenset()
+    _memory["fonts_key"] = key
+    _memory["fonts"] = families
+    return families
+
+
+def _probe_font_families() -> FrozenSet[str] | None:
+    try:
+        result = subprocess.run(
+            ["fc-list", ":", "family"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+    except OSError as e:
+        logging.warning("fc-list failed: %s", e)
+        return None
+    if result.returncode != 0:
+        return None
+    families = set()
+    for line in result.stdout.splitlines():
+        for family in line.split(","):
+            family = family.strip().replace("\\-", "-")
+            if family:
+                families.add(family.lower())
+    return frozenset(families)
+
+
+def font_file(family: str, cache_file: str | None = None) -> str | None:
+    """Return the font file fontconfig uses for ``family`` or ``None``.
+
+    Families fontconfig only substitutes (e.g. DejaVu Sans for a missing
+    font) count as not installed. Cached like ``font_families``."""
+    fc_key = binary_key("fc-match")
+    if fc_key is None:
+        return None
+    key = f"{fc_key}|{fontconfig_stamp()}"
+    if _memory.get("font_files_key") != key:
+        cache_file, data = _load(cache_file)
+        entry = data.get("font_files", {})
+        _memory["font_files_key"] = key
+        files = entry.get("files", {}) if entry.get("key") == key else {}
+        _memory["font_files"] = dict(files)
+    files = _memory["font_files"]
+    if family not in files:
+        files[family] = _probe_font_file(family)
+        cache_file, data = _load(cache_file)
+        data["font_files"] = {"key": key, "files": files}
+        _store(cache_file, data)
+    return files[family] or None
+
+
+def _probe_font_file(family: str) -> str:
+    try:
+        result = subprocess.run(
+            ["fc-match", "-f", "%{family}\n%{file}", family],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+    except OSError as e:
+        logging.warning("fc-match failed: %s", e)
+        return ""
+    lines = result.stdout.splitlines()
+    if result.returncode != 0 or len(lines) != 2:
+        return ""
+    families = [f.strip().lower() for f in lines[0].split(",")]
+    return lines[1] if family.lower() in families else ""
+
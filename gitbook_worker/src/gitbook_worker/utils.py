@@ -1,12 +1,19 @@
 import os
 import re
+import signal
 import subprocess
 import sys
 import logging
-from collections import defaultdict
-from typing import List, Tuple
+import threading
+import bisect
+from collections import Counter, deque
+from typing import Callable, List, Tuple
 import requests
 
+from . import toolchain
+from .cache import hash_text
+from .readability import readability_scores
+
 # Emoji ranges supported by the LaTeX header
 EMOJI_RANGES = (
     "1F300-1F5FF, 1F600-1F64F, 1F680-1F6FF, 1F700-1F77F, 1F780-1F7FF, "
@@ -14,10 +21,14 @@ EMOJI_RANGES = (
     "2600-26FF, 2700-27BF, 2300-23FF, 2B50, 2B06, 2934-2935, 25A0-25FF"
 )
 
+# Everything in the LaTeX preamble before this line can be precompiled with
+# mylatexformat; everything after it is processed on every run.
+PRECOMPILE_MARKER = "\\csname endofdump\\endcsname"
+
 try:
-    import textstat
+    import numpy as np
 except ImportError:  # pragma: no cover - optional dep
-    textstat = None
+    np = None
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
@@ -43,18 +54,126 @@ def run(cmd, cwd=None, capture_output=False, input_text=None) -> Tuple[str, str,
     return "", "", result.returncode
 
 
+# Exit code reported for commands stopped by ``run_streaming``'s timeout,
+# matching coreutils ``timeout``.
+TIMEOUT_EXIT_CODE = 124
+
+
+class TailBuffer:
+    """Keep the last ``max_bytes`` of text appended line by line."""
+
+    def __init__(self, max_bytes: int = 64 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.truncated = False
+        self._lines: deque = deque()
+
+    def append(self, line: str) -> None:
+        self._lines.append(line)
+        self.size += len(line)
+        while self.size > self.max_bytes and len(self._lines) > 1:
+            self.size -= len(self._lines.popleft())
+            self.truncated = True
+
+    def getvalue(self) -> str:
+        text = "".join(self._lines)
+        if self.truncated:
+            return "[... output truncated ...]\n" + text
+        return text
+
+
+def _kill_process_group(proc: subprocess.Popen, grace: float = 5.0) -> None:
+    """Terminate ``proc`` and all of its children."""
+    if sys.platform.startswith("win"):
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_streaming(
+    cmd,
+    cwd=None,
+    timeout: float | None = None,
+    tail_bytes: int = 64 * 1024,
+    on_line: Callable[[str, str], None] | None = None,
+    log_prefix: str = "",
+    on_timeout: Callable[[], None] | None = None,
+) -> Tuple[str, str, int]:
+    """Execute a command and stream its output line by line into the log.
+
+    Only the last ``tail_bytes`` of stdout and stderr are kept in memory and
+    returned, e.g. for an error log file. ``on_line`` is called with the
+    stream name (``"stdout"``/``"stderr"``) and every line, for example to
+    report progress. After ``timeout`` seconds the command is killed together
+    with its process group, ``on_timeout`` is called to stop what it started
+    elsewhere (e.g. inside a container) and ``TIMEOUT_EXIT_CODE`` is
+    returned."""
+    logging.info("Running command: %s", cmd)
+    popen_args = {}
+    if sys.platform.startswith("win"):
+        popen_args["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_args["start_new_session"] = True
+    proc = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        shell=False,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        **popen_args,
+    )
+    tails = {"stdout": TailBuffer(tail_bytes), "stderr": TailBuffer(tail_bytes)}
+
+    def pump(name, stream):
+        for line in stream:
+            tails[name].append(line)
+            logging.info("%s%s", log_prefix, line.rstrip("\n"))
+            if on_line:
+                on_line(name, line)
+        stream.close()
+
+    readers = [
+        threading.Thread(target=pump, args=(name, getattr(proc, name)), daemon=True)
+        for name in tails
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        code = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logging.error("Command timed out after %ss, killing it: %s", timeout, cmd)
+        _kill_process_group(proc)
+        if on_timeout:
+            on_timeout()
+        tails["stderr"].append(f"\nTimed out after {timeout} seconds\n")
+        code = TIMEOUT_EXIT_CODE
+    for reader in readers:
+        reader.join(timeout=5)
+    return tails["stdout"].getvalue(), tails["stderr"].getvalue(), code
+
+
 def get_pandoc_version() -> Tuple[int, ...]:
-    """Return the installed pandoc version as a tuple."""
-    out, _, code = run(["pandoc", "--version"], capture_output=True)
-    if code != 0 or not out:
-        logging.warning("pandoc --version failed")
-        return (0,)
-    first = out.splitlines()[0]
-    m = re.search(r"pandoc\s+([0-9]+(?:\.[0-9]+)*)", first)
-    if not m:
-        logging.warning("Unable to parse pandoc version from: %s", first)
-        return (0,)
-    return tuple(int(p) for p in m.group(1).split("."))
+    """Return the installed pandoc version as a tuple.
+
+    The version is cached by ``toolchain`` until the pandoc binary changes."""
+    return toolchain.pandoc_version()
 
 
 def font_available(name: str) -> bool:
@@ -68,10 +187,9 @@ def font_available(name: str) -> bool:
         except Exception:  # pragma: no cover - environment specific
             pass
         return False
-    out, _, code = run(["fc-list"], capture_output=True)
-    if code != 0:
-        return False
-    return name.lower() in out.lower()
+    families = toolchain.font_families()
+    name = name.lower()
+    return name in families or any(name in family for family in families)
 
 
 def parse_summary(summary_path):
@@ -90,22 +208,88 @@ def parse_summary(summary_path):
     return files
 
 
-def readability_report(md_files):
-    """Compute readability scores for each markdown file."""
-    report = []
-    if not textstat:
-        logging.warning("textstat not installed; skipping readability checks.")
-        return report
-    for md in md_files:
-        try:
-            with open(md, encoding="utf-8") as f:
-                text = f.read()
-            fre = textstat.flesch_reading_ease(text)
-            fk = textstat.flesch_kincaid_grade(text)
-            report.append((md, fre, fk))
-        except Exception as e:
-            logging.warning("Readability check failed for %s: %s", md, e)
-    return report
+# Comment written before every chapter of the combined markdown, naming the
+# chapter relative to the book root. Pandoc drops it for LaTeX output, later
+# stages use it to map text back to its chapter. HTML and EPUB writers keep
+# raw comments, so it is removed with ``strip_chapter_markers`` for them.
+CHAPTER_MARKER = "<!-- chapter: {} -->"
+CHAPTER_MARKER_RE = re.compile(r"^<!-- chapter: (.+) -->$")
+
+
+def combine_markdown(
+    md_files: List[str], combined_md: str, root: str | None = None
+) -> List[str]:
+    """Concatenate ``md_files`` into ``combined_md``.
+
+    Every chapter is preceded by a ``CHAPTER_MARKER`` line so that the
+    combined file can be split again with ``split_combined_markdown``. The
+    marker names the chapter relative to the book directory ``root``
+    (default: the common directory of ``md_files``), so no host paths end up
+    in the markdown. Missing files are skipped. Returns the list of chapters
+    written."""
+    if root is None:
+        dirs = [os.path.dirname(os.path.abspath(md)) for md in md_files]
+        root = os.path.commonpath(dirs) if dirs else "."
+    written = []
+    with open(combined_md, "w", encoding="utf-8") as out:
+        for md in md_files:
+            if os.path.isfile(md):
+                with open(md, encoding="utf-8") as mdf:
+                    chapter = os.path.relpath(md, root).replace(os.sep, "/")
+                    out.write(CHAPTER_MARKER.format(chapter) + "\n\n")
+                    out.write(mdf.read())
+                    out.write("\n\n")
+                written.append(md)
+            else:
+                logging.warning("Skipping missing file: %s", md)
+    return written
+
+
+def strip_chapter_markers(combined_md: str, stripped_md: str) -> str:
+    """Write ``combined_md`` without chapter markers to ``stripped_md``.
+
+    Returns ``stripped_md``."""
+    with open(combined_md, encoding="utf-8") as f, open(
+        stripped_md, "w", encoding="utf-8"
+    ) as out:
+        for line in f:
+            if not CHAPTER_MARKER_RE.match(line.rstrip("\r\n")):
+                out.write(line)
+    return stripped_md
+
+
+def split_combined_markdown(combined_md: str) -> List[Tuple[str, str]]:
+    """Split a combined markdown file into ``(chapter, text)`` pairs.
+
+    Text before the first chapter marker is returned with an empty chapter
+    name."""
+    chapters: List[Tuple[str, str]] = []
+    chapter = ""
+    lines: List[str] = []
+    with open(combined_md, encoding="utf-8") as f:
+        for line in f:
+            match = CHAPTER_MARKER_RE.match(line.rstrip("\r\n"))
+            if match:
+                if chapter or "".join(lines).strip():
+                    chapters.append((chapter, "".join(lines)))
+                chapter = match.group(1)
+                lines = []
+            else:
+                lines.append(line)
+    if chapter or "".join(lines).strip():
+        chapters.append((chapter, "".join(lines)))
+    return chapters
+
+
+def readability_report(
+    md_files, cache_dir: str | None = None, max_workers: int | None = None
+):
+    """Compute readability scores for each markdown file.
+
+    Returns ``(file, flesch_reading_ease, flesch_kincaid_grade)`` tuples for
+    the prose of each file; see ``readability.readability_scores``."""
+    scores = readability_scores(md_files, cache_dir=cache_dir, max_workers=max_workers)
+    return [(md, result["fre"], result["fk"]) for md, result in scores.items()]
 
 
 def wrap_wide_tables(
@@ -241,12 +425,16 @@ def validate_table_columns(md_file: str) -> List[str]:
     return errors
 
 
-def download_remote_images(md_file: str, out_dir: str) -> int:
+def download_remote_images(
+    md_file: str, out_dir: str, cache_dir: str | None = None
+) -> int:
     """Download remote images referenced in ``md_file``.
 
     Remote images (``http`` or ``https`` URLs) are downloaded into
     ``out_dir`` and the markdown file is updated to reference the local
-    copy. Returns the number of images successfully downloaded."""
+    copy. With a ``cache_dir`` images are stored there under a name derived
+    from their URL instead and reused by later runs and other builds.
+    Returns the number of images successfully downloaded or reused."""
 
     pattern = re.compile(r"(!\[[^\]]*\]\()\s*(https?://[^\s)]+)(\))")
 
@@ -262,9 +450,22 @@ def download_remote_images(md_file: str, out_dir: str) -> int:
         nonlocal count
         url = match.group(2)
         try:
-            os.makedirs(out_dir, exist_ok=True)
             name = os.path.basename(url.split("?")[0]) or f"img_{count}"
             base, ext = os.path.splitext(name)
+            if cache_dir:
+                dest = os.path.join(cache_dir, f"{hash_text(url)[:16]}_{name}")
+                if not os.path.isfile(dest):
+                    response = requests.get(url, timeout=10)
+                    response.raise_for_status()
+                    os.makedirs(cache_dir, exist_ok=True)
+                    tmp_path = f"{dest}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as wf:
+                        wf.write(response.content)
+                    os.replace(tmp_path, dest)
+                    logging.info("Downloaded image %s -> %s", url, dest)
+                count += 1
+                return f"{match.group(1)}{dest}{match.group(3)}"
+            os.makedirs(out_dir, exist_ok=True)
             dest = os.path.join(out_dir, name)
             suffix = 1
             while os.path.exists(dest):
@@ -293,6 +494,48 @@ def download_remote_images(md_file: str, out_dir: str) -> int:
     return count
 
 
+def _write_font_setup(
+    hf,
+    pdf_engine: str,
+    emoji_font: str,
+    sans_font: str,
+    mono_font: str,
+    main_font: str,
+    write_mainfont: bool,
+) -> None:
+    """Write the ``fontspec`` setup for ``lualatex`` or ``xelatex``."""
+    hf.write("\\usepackage{fontspec}\n")
+    hf.write(f"\\setsansfont{{{sans_font}}}\n")
+    hf.write(f"\\setmonofont{{{mono_font}}}\n")
+    if write_mainfont:
+        hf.write(f"\\setmainfont{{{main_font}}}\n")
+    if not emoji_font:
+        return
+    if pdf_engine != "lualatex":
+        # Range and font fallbacks are luaotfload features.
+        family = f"\\newfontfamily\\EmojiOne{{{emoji_font}}}"
+        if emoji_font == "Segoe UI Emoji":
+            family = f"\\IfFontExistsTF{{{emoji_font}}}{{{family}}}{{}}"
+        hf.write(family + "\n")
+    elif emoji_font.startswith("OpenMoji"):
+        hf.write(
+            f"\\newfontfamily\\EmojiOne{{{emoji_font}}}[Range={{{EMOJI_RANGES}}}]\n"
+        )
+    elif emoji_font == "Segoe UI Emoji":
+        hf.write("\\IfFontExistsTF{Segoe UI Emoji}{\n")
+        hf.write(
+            f"  \\newfontfamily\\EmojiOne{{Segoe UI Emoji}}[Renderer=Harfbuzz,Range={{{EMOJI_RANGES}}}]\n"
+        )
+        hf.write(
+            '  \\directlua{luaotfload.add_fallback("mainfont", "Segoe UI Emoji:mode=harf")}\n'
+        )
+        hf.write("}{}\n")
+    else:
+        hf.write(
+            f"\\newfontfamily\\EmojiOne{{{emoji_font}}}[Range={{{EMOJI_RANGES}}}]\n"
+        )
+
+
 def _write_pandoc_header(
     temp_dir: str,
     emoji_font: str,
@@ -304,6 +547,8 @@ def _write_pandoc_header(
     md_file: str,
     write_mainfont: bool = True,
     disable_longtable: bool = False,
+    precompile_marker: bool = False,
+    pdf_engine: str = "lualatex",
 ) -> str:
     """Create a temporary pandoc header file.
 
@@ -314,34 +559,21 @@ def _write_pandoc_header(
     to the header. This is useful for pandoc ``>= 3.1.12`` where the main font
     can be supplied via ``-V mainfont=...``.
 
+    Package setup is written before the font setup. With
+    ``precompile_marker`` an ``endofdump`` marker separates the two, so the
+    packages can be dumped into a precompiled format (see ``latex_format``)
+    while fonts are still loaded at run time.
+
+    The font setup depends on ``pdf_engine``: ``lualatex`` gets the emoji
+    font as a luaotfload fallback, ``xelatex`` only defines the fonts with
+    ``fontspec`` (``\\EmojiOne`` must be used explicitly) and ``pdflatex``
+    keeps the template's default fonts.
+
     Returns the path to the created header file."""
 
     header_file = os.path.join(temp_dir, "pandoc_header.tex")
     try:
         with open(header_file, "w", encoding="utf-8") as hf:
-            hf.write("\\usepackage{fontspec}\n")
-            hf.write(f"\\setsansfont{{{sans_font}}}\n")
-            hf.write(f"\\setmonofont{{{mono_font}}}\n")
-            if write_mainfont:
-                hf.write(f"\\setmainfont{{{main_font}}}\n")
-            if emoji_font:
-                if emoji_font.startswith("OpenMoji"):
-                    hf.write(
-                        f"\\newfontfamily\\EmojiOne{{{emoji_font}}}[Range={{{EMOJI_RANGES}}}]\n"
-                    )
-                elif emoji_font == "Segoe UI Emoji":
-                    hf.write("\\IfFontExistsTF{Segoe UI Emoji}{\n")
-                    hf.write(
-                        f"  \\newfontfamily\\EmojiOne{{Segoe UI Emoji}}[Renderer=Harfbuzz,Range={{{EMOJI_RANGES}}}]\n"
-                    )
-                    hf.write(
-                        '  \\directlua{luaotfload.add_fallback("mainfont", "Segoe UI Emoji:mode=harf")}\n'
-                    )
-                    hf.write("}{}\n")
-                else:
-                    hf.write(
-                        f"\\newfontfamily\\EmojiOne{{{emoji_font}}}[Range={{{EMOJI_RANGES}}}]\n"
-                    )
             if wrap_tables:
                 logging.info("Wrapping wide tables in landscape environment...")
                 wrap_wide_tables(md_file, threshold=threshold, use_raw_latex=False)
@@ -360,6 +592,20 @@ def _write_pandoc_header(
                 hf.write("}{%\n")
                 hf.write("  \\end{tabular}%\n")
                 hf.write("}\n")
+            if precompile_marker:
+                hf.write(PRECOMPILE_MARKER + "\n")
+            if pdf_engine == "pdflatex":
+                logging.info("pdflatex uses the template fonts; font options ignored")
+            else:
+                _write_font_setup(
+                    hf,
+                    pdf_engine,
+                    emoji_font,
+                    sans_font,
+                    mono_font,
+                    main_font,
+                    write_mainfont,
+                )
     except Exception as e:
         logging.error("Failed to write pandoc header tex file: %s", e)
         raise
@@ -381,33 +627,153 @@ EMOJI_BLOCKS = [
 ]
 
 
-def emoji_report(md_file: str) -> tuple[dict, str]:
-    """Return emoji usage counts and a markdown table for ``md_file``."""
+# Code points ``emoji_report`` ignores: ASCII and Latin letters
+_REPORT_SKIP = ((0x0000, 0x007F), (0x00A0, 0x024F))
+_NON_LATIN_RE = re.compile(r"[^\u0000-\u007F\u00A0-\u024F]+")
+
+
+def _emoji_segments() -> Tuple[List[int], List[int], List[str]]:
+    """Split the code point space into segments with one block each.
+
+    ``EMOJI_BLOCKS`` overlap (flags lie inside the enclosed alphanumerics);
+    like a linear scan, the first listed block wins. Returns the sorted
+    segment starts, the block index of every segment (``-1`` for unknown)
+    and the label of every block index, ``"Unknown"`` last."""
+    bounds = sorted(
+        {b for _, start, end in EMOJI_BLOCKS for b in (start, end + 1)} | {0}
+    )
+    labels = []
+    for seg_start in bounds:
+        label = -1
+        for i, (_, start, end) in enumerate(EMOJI_BLOCKS):
+            if start <= seg_start <= end:
+                label = i
+                break
+        labels.append(label)
+    names = [name for name, _, _ in EMOJI_BLOCKS] + ["Unknown"]
+    return bounds, labels, names
+
+
+_SEGMENT_STARTS, _SEGMENT_LABELS, _BLOCK_NAMES = _emoji_segments()
+
+
+def _classify_chunk(text: str) -> List[int]:
+    """Return per-block counts (indexed like ``_BLOCK_NAMES``) for ``text``."""
+    n_blocks = len(_BLOCK_NAMES)
+    if np is not None:
+        cps = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+        keep = np.ones(len(cps), dtype=bool)
+        for low, high in _REPORT_SKIP:
+            keep &= (cps < low) | (cps > high)
+        cps = cps[keep]
+        seg = np.searchsorted(np.asarray(_SEGMENT_STARTS), cps, side="right") - 1
+        labels = np.asarray(_SEGMENT_LABELS)[seg]
+        labels[labels < 0] = n_blocks - 1
+        return np.bincount(labels, minlength=n_blocks).tolist()
+    # Without NumPy count distinct characters at C speed first and classify
+    # only those.
+    counts = [0] * n_blocks
+    chars = Counter("".join(_NON_LATIN_RE.findall(text)))
+    for char, count in chars.items():
+        label = _SEGMENT_LABELS[bisect.bisect_right(_SEGMENT_STARTS, ord(char)) - 1]
+        counts[label if label >= 0 else n_blocks - 1] += count
+    return counts
+
+
+def _emoji_chapter_counts(
+    md_file: str, chunk_size: int = 1 << 20
+) -> List[Tuple[str, List[int]]]:
+    """Return ``(chapter, block_counts)`` pairs for ``md_file``.
+
+    The file is read in chunks of about ``chunk_size`` characters and split
+    at ``CHAPTER_MARKER`` lines; text before the first marker is reported
+    as chapter ``""``."""
+    chapters: List[Tuple[str, List[int]]] = []
+    current = ["", [0] * len(_BLOCK_NAMES)]
+    buffer: List[str] = []
+    size = 0
+
+    def flush():
+        nonlocal size
+        if buffer:
+            for i, count in enumerate(_classify_chunk("".join(buffer))):
+                current[1][i] += count
+            buffer.clear()
+            size = 0
 
     try:
         with open(md_file, encoding="utf-8") as file:
-            text = file.read()
+            for line in file:
+                marker = CHAPTER_MARKER_RE.match(line.rstrip("\n"))
+                if marker:
+                    flush()
+                    if current[0] or any(current[1]):
+                        chapters.append((current[0], current[1]))
+                    current = [marker.group(1), [0] * len(_BLOCK_NAMES)]
+                    continue
+                buffer.append(line)
+                size += len(line)
+                if size >= chunk_size:
+                    flush()
     except Exception as e:  # pragma: no cover - unlikely
         logging.error("Failed to read %s: %s", md_file, e)
         raise
+    flush()
+    if current[0] or any(current[1]):
+        chapters.append((current[0], current[1]))
+    return chapters
 
-    emoji_pattern = re.compile(r"[^\u0000-\u007F\u00A0-\u024F]+")
-    emojis = [c for group in emoji_pattern.findall(text) for c in group]
 
-    counts: dict[str, int] = defaultdict(int)
-    for char in emojis:
-        cp = ord(char)
-        block = "Unknown"
-        for name, start, end in EMOJI_BLOCKS:
-            if start <= cp <= end:
-                block = name
-                break
-        counts[block] += 1
+def _counts_dict(block_counts: List[int]) -> dict[str, int]:
+    return {
+        name: count for name, count in zip(_BLOCK_NAMES, block_counts) if count
+    }
+
 
+def _counts_table(counts: dict[str, int]) -> str:
     rows = sorted(counts.items(), key=lambda x: (-x[1], x[0]))
     lines = ["| Unicode Block | Count |", "| --- | --- |"]
     for name, count in rows:
         lines.append(f"| {name} | {count} |")
-    table_md = "\n".join(lines)
-
-    return dict(counts), table_md
+    return "\n".join(lines)
+
+
+def emoji_report(
+    md_file: str, chapters: List[Tuple[str, List[int]]] | None = None
+) -> tuple[dict, str]:
+    """Return emoji usage counts and a markdown table for ``md_file``.
+
+    Every character outside ASCII and the Latin blocks is counted per
+    ``EMOJI_BLOCKS`` entry (``"Unknown"`` for the rest). The file is
+    classified in chunks, vectorized with NumPy when it is installed.
+    ``chapters`` are counts from ``_emoji_chapter_counts`` to reuse instead
+    of reading the file again."""
+    if chapters is None:
+        chapters = _emoji_chapter_counts(md_file)
+    totals = [0] * len(_BLOCK_NAMES)
+    for _, block_counts in chapters:
+        totals = [a + b for a, b in zip(totals, block_counts)]
+    counts = _counts_dict(totals)
+    return counts, _counts_table(counts)
+
+
+def emoji_chapter_report(
+    md_file: str, chapters: List[Tuple[str, List[int]]] | None = None
+) -> tuple[dict, str]:
+    """Return emoji counts per chapter and a markdown table for ``md_file``.
+
+    Chapters are taken from the ``CHAPTER_MARKER`` lines of a combined
+    markdown file. Only chapters containing counted characters appear.
+    ``chapters`` works as for ``emoji_report``."""
+    if chapters is None:
+        chapters = _emoji_chapter_counts(md_file)
+    per_chapter = {
+        chapter: _counts_dict(block_counts)
+        for chapter, block_counts in chapters
+        if any(block_counts)
+    }
+    lines = ["| Chapter | Unicode Block | Count |", "| --- | --- | --- |"]
+    for chapter, counts in per_chapter.items():
+        for name, count in sorted(counts.items(), key=lambda x: (-x[1], x[0])):
+            lines.append(f"| {chapter or '-'} | {name} | {count} |")
+    return per_chapter, "\n".join(lines)
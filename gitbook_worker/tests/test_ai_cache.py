@@ -0,0 +1,74 @@
+import time
+
+from gitbook_worker.src.gitbook_worker import ai_tools
+from gitbook_worker.src.gitbook_worker.ai_cache import AIResponseCache, ai_cache_key
+
+
+def test_ai_cache_expiry_and_refresh(tmp_path, monkeypatch):
+    path = str(tmp_path / "ai.json")
+    cache = AIResponseCache(path)
+    key = ai_cache_key("genai", "gemini", "prompt", "1. Quelle")
+    cache.put(key, {"success": True, "validation_date": "2024-01-01"})
+    cache.save()
+
+    assert AIResponseCache(path).get(key)["validation_date"] == "2024-01-01"
+    assert AIResponseCache(path, refresh=True).get(key) is None
+    assert key != ai_cache_key("genai", "gemini", "other prompt", "1. Quelle")
+
+    later = time.time() + 31 * 86400
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert AIResponseCache(path).get(key) is None
+    assert AIResponseCache(path, max_age_days=60).get(key) is not None
+
+
+VALID_ANSWER = {
+    "success": True,
+    "org": "1. Quelle",
+    "new": None,
+    "validation_date": "2024-01-01",
+    "type": "external reference",
+}
+
+
+def test_ai_cache_drops_answers_violating_schema(tmp_path):
+    path = str(tmp_path / "ai.json")
+    cache = AIResponseCache(path)
+    cache.put("alt", {"success": "ja", "validation_date": "2024-01-01"})
+    cache.put("gut", VALID_ANSWER)
+    assert cache.get("alt", ai_tools.REFERENCE_SCHEMA) is None
+    assert cache.get("gut", ai_tools.REFERENCE_SCHEMA) == VALID_ANSWER
+    cache.save()
+    assert AIResponseCache(path).get("alt") is None
+
+
+def test_reference_check_uses_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_ask(prompt, ai_url, ai_api_key, ai_provider, schema=None):
+        calls.append(prompt)
+        if "kaputt" in prompt:
+            return False, "[GenAI] Fehler: timeout"
+        return True, VALID_ANSWER
+
+    monkeypatch.setattr(ai_tools, "ask_ai", fake_ask)
+    path = str(tmp_path / "ai.json")
+
+    def check(line, prompt="Prüfe", refresh=False):
+        cache = AIResponseCache(path, refresh=refresh)
+        result = ai_tools.proof_and_repair_external_reference(
+            line, 1, prompt, "https://x/models/m:generate", "", "genai", cache=cache
+        )
+        cache.save()
+        return result
+
+    assert check("1. Quelle")[0]
+    success, result = check("1. Quelle")
+    assert success and result["validation_date"] == "2024-01-01"
+    assert len(calls) == 1
+    check("1. Quelle", prompt="Anders")
+    check("1. Quelle", refresh=True)
+    assert len(calls) == 3
+    # Failed requests are not cached.
+    check("2. kaputt")
+    check("2. kaputt")
+    assert len(calls) == 5
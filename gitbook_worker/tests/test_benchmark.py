@@ -0,0 +1,84 @@
+import os
+import shutil
+import pytest
+from gitbook_worker.src.gitbook_worker import benchmark
+
+
+def test_write_wide_table_book(tmp_path):
+    md = tmp_path / "book.md"
+    benchmark.write_wide_table_book(str(md), tables=3, cols=8, rows=2)
+    text = md.read_text(encoding="utf-8")
+    assert text.count("::: {.landscape cols=8}") == 3
+    assert text.count("|" + "---|" * 8 + "\n") == 3
+
+
+def test_format_results():
+    table = benchmark.format_results(
+        [{"tables": 10, "filter": "landscape.lua", "seconds": 1.234}],
+        ["tables", "filter", "seconds"],
+    )
+    assert table.splitlines()[0] == "| tables | filter | seconds |"
+    assert "| 10 | landscape.lua | 1.23 |" in table
+
+
+@pytest.mark.skipif(shutil.which("pandoc") is None, reason="pandoc not installed")
+def test_benchmark_landscape_filter_runs(tmp_path):
+    results = benchmark.benchmark_landscape_filter((2,), work_dir=str(tmp_path))
+    assert [r["filter"] for r in results] == ["(none)", "landscape.lua"]
+    assert all(r["seconds"] > 0 for r in results)
+
+
+def test_benchmark_pdf_engines(tmp_path, monkeypatch):
+    book = tmp_path / "book"
+    book.mkdir()
+    (book / "SUMMARY.md").write_text("* [Intro](intro.md)\n", encoding="utf-8")
+    (book / "intro.md").write_text("# Intro\n\nText.\n", encoding="utf-8")
+    commands = []
+
+    def fake_run(cmd, capture_output=False):
+        commands.append(cmd)
+        if "--pdf-engine=xelatex" in cmd:
+            return "", "xelatex error", 1
+        return "", "", 0
+
+    monkeypatch.setattr(
+        benchmark.shutil, "which", lambda name: None if name == "pdflatex" else name
+    )
+    monkeypatch.setattr(benchmark, "run", fake_run)
+    results = benchmark.benchmark_pdf_engines(str(book), work_dir=str(tmp_path))
+    status = {r["engine"]: r["status"] for r in results}
+    assert status == {
+        "lualatex": "ok",
+        "xelatex": "failed (1)",
+        "pdflatex": "not installed",
+    }
+    assert results[0]["seconds"] >= 0
+    assert len(commands) == 2
+    assert commands[0][1].endswith("book.md")
+
+
+def test_benchmark_clone_strategies(tmp_path, monkeypatch):
+    def fake_clone(url, clone_dir, branch, force=False, strategy="full"):
+        if strategy == "sparse":
+            raise SystemExit(128)
+        os.makedirs(clone_dir)
+        return {
+            "strategy": strategy,
+            "seconds": 1.5,
+            "git_bytes": 2e6,
+            "worktree_bytes": 1e6,
+        }
+
+    monkeypatch.setattr(benchmark, "clone_or_update_repo", fake_clone)
+    results = benchmark.benchmark_clone_strategies(
+        "url", "main", ["shallow", "sparse"], work_dir=str(tmp_path)
+    )
+    assert results[0] == {
+        "strategy": "shallow",
+        "status": "ok",
+        "seconds": 1.5,
+        "git_mb": 2.0,
+        "worktree_mb": 1.0,
+    }
+    assert results[1] == {"strategy": "sparse", "status": "failed (128)"}
+    assert list(tmp_path.iterdir()) == []
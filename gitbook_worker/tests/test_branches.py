@@ -0,0 +1,77 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from gitbook_worker.src.gitbook_worker import branches, repo
+
+
+def test_strip_options():
+    argv = [
+        "url",
+        "--branches",
+        "main,dev",
+        "--branch-jobs=2",
+        "--mirror",
+        "--out-dir",
+        "out",
+        "--pdf",
+        "--clone-strategy",
+        "shallow",
+    ]
+    assert branches.strip_options(argv) == ["url", "--pdf"]
+
+
+def test_branch_command(tmp_path):
+    cmd = branches.branch_command(
+        ["url", "--pdf", "--branches", "main,feature/x", "-t", "x"],
+        "feature/x",
+        "/wt",
+        "/temp",
+        "/out",
+        "/cache",
+    )
+    assert cmd[:2] == [sys.executable, "-m"]
+    assert cmd[2].endswith("gitbook_worker")
+    args = cmd[3:]
+    assert args[:4] == ["url", "--pdf", "-t", "x"]
+    assert args[args.index("--branch") + 1] == "feature/x"
+    assert "--use-existing-clone" in args
+    assert args[args.index("--clone-dir") + 1] == "/wt"
+    assert args[args.index("--temp-dir") + 1] == os.path.join("/temp", "feature_x")
+    assert args[args.index("--out-dir") + 1] == os.path.join("/out", "feature_x")
+    assert args[args.index("--cache-dir") + 1] == "/cache"
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_ensure_worktree(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "SUMMARY.md").write_text("main\n", encoding="utf-8")
+
+    def git(*args):
+        subprocess.run(["git", "-C", str(src), *args], check=True, capture_output=True)
+
+    def commit():
+        git("add", ".")
+        git("-c", "user.name=t", "-c", "user.email=t@example.com", "commit", "-m", "c")
+
+    git("init", "-b", "main")
+    commit()
+    git("checkout", "-b", "dev")
+    (src / "SUMMARY.md").write_text("dev\n", encoding="utf-8")
+    commit()
+
+    clone_dir = tmp_path / "clone"
+    repo.clone_or_update_repo(src.as_uri(), str(clone_dir), branch_name="main")
+    path = branches.ensure_worktree(str(clone_dir), "dev")
+    assert path == branches.worktree_path(str(clone_dir), "dev")
+    assert open(os.path.join(path, "SUMMARY.md")).read() == "dev\n"
+    assert (clone_dir / "SUMMARY.md").read_text() == "main\n"
+
+    (src / "SUMMARY.md").write_text("dev 2\n", encoding="utf-8")
+    commit()
+    assert branches.ensure_worktree(str(clone_dir), "dev") == path
+    assert open(os.path.join(path, "SUMMARY.md")).read() == "dev 2\n"
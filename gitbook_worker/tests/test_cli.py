@@ -46,3 +46,33 @@ def test_mycli_passes_arguments(monkeypatch, tmp_path):
 
     assert '--some' in calls['cmd']
     assert 'arg' in calls['cmd']
+
+
+def test_mycli_docker_pool(monkeypatch, tmp_path):
+    calls = {}
+
+    class FakeContainer:
+        def __init__(self, image, run_args, idle_timeout=900, image_id=None):
+            calls["image"] = image
+
+        def ensure(self):
+            calls["ensured"] = True
+            return self
+
+        def exec_cmd(self, cmd, workdir=None):
+            return ["docker", "exec", "warm"] + cmd
+
+    def fake_run(cmd, check=False):
+        calls['cmd'] = cmd
+        return types.SimpleNamespace(returncode=0)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(docker_cli, 'ensure_docker_desktop', lambda: None)
+    monkeypatch.setattr(docker_cli, 'ensure_docker_image', lambda name, path: None)
+    monkeypatch.setattr(docker_cli, 'WorkerContainer', FakeContainer)
+    monkeypatch.setattr(docker_cli.subprocess, 'run', fake_run)
+
+    mycli.main(['--docker-pool', '--help'])
+
+    assert calls['ensured']
+    assert calls['cmd'] == ['docker', 'exec', 'warm', 'gitbook-worker', '--help']
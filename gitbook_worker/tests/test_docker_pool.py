@@ -0,0 +1,116 @@
+import os
+import shutil
+import subprocess
+import time
+import types
+import uuid
+
+import pytest
+
+from gitbook_worker.src.gitbook_worker import docker_pool
+
+
+@pytest.fixture(autouse=True)
+def image_id(monkeypatch):
+    monkeypatch.setattr(docker_pool, "get_image_id", lambda image: "sha256:1")
+
+
+def test_container_name_depends_on_mounts():
+    a = docker_pool.WorkerContainer("erda-pandoc", ["-v", "/a:/data"])
+    b = docker_pool.WorkerContainer("erda-pandoc", ["-v", "/a:/data"])
+    c = docker_pool.WorkerContainer("erda-pandoc", ["-v", "/b:/data"])
+    assert a.name == b.name
+    assert a.name != c.name
+    assert a.name.startswith("gitbook-worker-erda-pandoc-")
+
+
+def test_container_name_depends_on_image_id():
+    a = docker_pool.WorkerContainer("erda-pandoc", [])
+    b = docker_pool.WorkerContainer("erda-pandoc", [], image_id="sha256:2")
+    assert a.name != b.name
+    assert a.name == docker_pool.WorkerContainer("erda-pandoc", [], image_id="sha256:1").name
+
+
+def test_exec_cmd_wraps_command():
+    container = docker_pool.WorkerContainer("erda-pandoc", [])
+    cmd = container.exec_cmd(["pandoc", "in.md"], workdir="/data")
+    assert cmd[:4] == ["docker", "exec", "-w", "/data"]
+    assert container.name in cmd
+    assert cmd[-2:] == ["pandoc", "in.md"]
+    assert container.exec_cmd(["pandoc"]) != container.exec_cmd(["pandoc"])
+
+
+def test_stop_dispatched_kills_command_in_container(monkeypatch):
+    calls = []
+    monkeypatch.setattr(docker_pool, "_docker", lambda args: calls.append(args))
+    container = docker_pool.WorkerContainer("erda-pandoc", [])
+    cmd = container.exec_cmd(["pandoc", "in.md"], workdir="/data")
+    token = cmd[cmd.index(docker_pool.EXEC_WRAPPER) + 2]
+
+    docker_pool.stop_dispatched(cmd)
+    assert calls == [
+        [
+            "exec",
+            container.name,
+            "sh",
+            "-c",
+            docker_pool.KILL_SCRIPT,
+            "sh",
+            f"{docker_pool.BUSY_PREFIX}{token}",
+        ]
+    ]
+    docker_pool.stop_dispatched(["pandoc", "in.md"])
+    assert len(calls) == 1
+
+
+def test_stop_dispatched_kills_named_run_container(monkeypatch):
+    calls = []
+    monkeypatch.setattr(docker_pool, "_docker", lambda args: calls.append(args))
+    name = docker_pool.run_name()
+    assert name != docker_pool.run_name()
+
+    docker_pool.stop_dispatched(["docker", "run", "--rm", "--init", "--name", name, "img"])
+    assert calls == [["kill", name]]
+    docker_pool.stop_dispatched(["docker", "run", "--rm", "img"])
+    assert len(calls) == 1
+
+
+def test_start_runs_watchdog_when_unhealthy(monkeypatch):
+    calls = []
+    healthy = {"value": False}
+
+    def fake_docker(args):
+        calls.append(args)
+        if args[:1] == ["exec"]:
+            return types.SimpleNamespace(returncode=0 if healthy["value"] else 1, stderr="")
+        if args[:1] == ["run"]:
+            healthy["value"] = True
+        return types.SimpleNamespace(returncode=0, stderr="")
+
+    monkeypatch.setattr(docker_pool, "_docker", fake_docker)
+    container = docker_pool.WorkerContainer("erda-pandoc", ["-v", "/a:/data"], idle_timeout=60)
+    container.ensure()
+    run = [c for c in calls if c[:1] == ["run"]]
+    assert len(run) == 1
+    assert run[0][-1] == "60"
+    assert ["rm", "-f", container.name] in calls
+
+    calls.clear()
+    container.ensure()
+    assert not any(c[:1] == ["run"] for c in calls)
+
+
+@pytest.mark.skipif(shutil.which("setsid") is None, reason="setsid not installed")
+def test_kill_script_stops_wrapped_command():
+    token = uuid.uuid4().hex[:12]
+    busy = f"{docker_pool.BUSY_PREFIX}{token}"
+    proc = subprocess.Popen(
+        ["sh", "-c", docker_pool.EXEC_WRAPPER, "sh", token, "sleep", "60"]
+    )
+    for _ in range(50):
+        if os.path.isfile(busy) and open(busy).read().strip():
+            break
+        time.sleep(0.1)
+    subprocess.run(["sh", "-c", docker_pool.KILL_SCRIPT, "sh", busy], check=True)
+    assert proc.wait(timeout=10) != 0
+    assert not os.path.exists(busy)
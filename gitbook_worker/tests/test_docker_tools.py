@@ -44,3 +44,50 @@ def test_ensure_docker_desktop_starts(monkeypatch):
     docker_tools.ensure_docker_desktop()
     assert popen_called.get("called")
     assert runs["count"] >= 2
+
+
+def make_fake_docker(calls, volume_exists=False, volumes=""):
+    def fake_docker(args):
+        calls.append(args)
+        if args[:2] == ["image", "inspect"]:
+            return types.SimpleNamespace(returncode=0, stdout="sha256:abcdef1234567890\n", stderr="")
+        if args[:2] == ["volume", "inspect"]:
+            return types.SimpleNamespace(returncode=0 if volume_exists else 1, stdout="", stderr="")
+        if args[:2] == ["volume", "ls"]:
+            return types.SimpleNamespace(returncode=0, stdout=volumes, stderr="")
+        return types.SimpleNamespace(returncode=0, stdout="", stderr="")
+
+    return fake_docker
+
+
+def test_ensure_tex_cache_creates_volume_per_image(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        docker_tools,
+        "_docker",
+        make_fake_docker(calls, volumes="gitbook-worker-texcache-abcdef123456\ngitbook-worker-texcache-old\n"),
+    )
+    source = docker_tools.ensure_tex_cache("erda-pandoc")
+    assert source == "gitbook-worker-texcache-abcdef123456"
+    assert any(c[:2] == ["volume", "create"] for c in calls)
+    assert ["volume", "rm", "gitbook-worker-texcache-old"] in calls
+    assert ["volume", "rm", source] not in calls
+    warm = [c for c in calls if c[:1] == ["run"]]
+    assert warm and "luaotfload-tool" in warm[0]
+    assert f"TEXMFVAR={docker_tools.TEX_CACHE_DIR}" in warm[0]
+
+
+def test_ensure_tex_cache_reuses_existing_volume(monkeypatch):
+    calls = []
+    monkeypatch.setattr(docker_tools, "_docker", make_fake_docker(calls, volume_exists=True))
+    docker_tools.ensure_tex_cache("erda-pandoc")
+    assert not any(c[:2] == ["volume", "create"] for c in calls)
+    assert not any(c[:1] == ["run"] for c in calls)
+
+
+def test_ensure_tex_cache_host_dir(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(docker_tools, "_docker", make_fake_docker(calls))
+    source = docker_tools.ensure_tex_cache("erda-pandoc", str(tmp_path), warm=False)
+    assert source == str(tmp_path / "abcdef123456")
+    assert (tmp_path / "abcdef123456").is_dir()
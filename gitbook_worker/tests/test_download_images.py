@@ -50,3 +50,23 @@ def test_download_remote_images_name_conflict(tmp_path, monkeypatch):
     assert len(files) == 1 and files[0].startswith("a_") and files[0].endswith(".png")
     text = md.read_text()
     assert os.path.join(str(dest), files[0]) in text
+
+
+def test_download_remote_images_cache(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    calls = []
+
+    def fake_get(url, timeout=10):
+        calls.append(url)
+        return DummyResponse(b"data")
+
+    monkeypatch.setattr("gitbook_worker.utils.requests.get", fake_get)
+    for name in ("one.md", "two.md"):
+        md = tmp_path / name
+        md.write_text("![](http://ex.com/a.png)")
+        count = download_remote_images(str(md), str(tmp_path / "imgs"), str(cache))
+        assert count == 1
+    assert calls == ["http://ex.com/a.png"]
+    (cached,) = cache.iterdir()
+    assert cached.name.endswith("_a.png") and cached.read_bytes() == b"data"
+    assert str(cached) in (tmp_path / "two.md").read_text()
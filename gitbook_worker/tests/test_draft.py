@@ -0,0 +1,54 @@
+import pytest
+
+from gitbook_worker.src.gitbook_worker import draft
+from gitbook_worker.src.gitbook_worker.utils import combine_markdown
+
+
+def test_write_proxy_markdown_downscales_chapter_images(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    chapter_dir = tmp_path / "book" / "kapitel"
+    chapter_dir.mkdir(parents=True)
+    Image.new("RGB", (2000, 1000), "red").save(chapter_dir / "gross.png")
+    Image.new("RGB", (100, 50), "blue").save(chapter_dir / "klein.png")
+    chapter = chapter_dir / "intro.md"
+    chapter.write_text(
+        "![Gross](gross.png \"Titel\")\n\n![Klein](klein.png)\n\n![Web](https://x.org/a.png)\n",
+        encoding="utf-8",
+    )
+    combined = tmp_path / "combined.md"
+    combine_markdown([str(chapter)], str(combined), str(tmp_path / "book"))
+    draft_md = tmp_path / "draft.md"
+    proxy_dir = tmp_path / "proxies"
+
+    count = draft.write_proxy_markdown(
+        str(combined), str(draft_md), str(tmp_path / "book"), str(proxy_dir)
+    )
+
+    assert count == 1
+    text = draft_md.read_text(encoding="utf-8")
+    proxies = list(proxy_dir.iterdir())
+    assert len(proxies) == 1
+    assert f"![Gross]({proxies[0]} \"Titel\")" in text
+    assert "![Klein](klein.png)" in text
+    assert "![Web](https://x.org/a.png)" in text
+    assert "<!--" not in text
+    with Image.open(proxies[0]) as img:
+        assert max(img.size) == draft.PROXY_MAX_SIZE
+
+
+def test_split_engine_opts():
+    pandoc_args, engine_opts = draft.split_engine_opts(
+        ["-V", "tables=true", "--pdf-engine-opt=-fmt=/cache/preamble.fmt"]
+    )
+    assert pandoc_args == ["-V", "tables=true"]
+    assert engine_opts == ["-fmt=/cache/preamble.fmt"]
+
+
+def test_compare_with_full_build(tmp_path):
+    message = draft.compare_with_full_build(str(tmp_path), "draft pdf", 2.0)
+    assert "no full build recorded" in message
+    draft.record_build_time(str(tmp_path), "full", 30.0)
+    message = draft.compare_with_full_build(str(tmp_path), "draft pdf", 3.0)
+    assert "30.0s" in message
+    assert "10.0x faster" in message
+    assert draft.last_build_time(str(tmp_path), "draft pdf") == 3.0
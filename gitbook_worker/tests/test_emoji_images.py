@@ -0,0 +1,75 @@
+import pytest
+
+from gitbook_worker.src.gitbook_worker import emoji_images
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def fake_renderer(calls):
+    def render(text, font_path, size):
+        calls.append(text)
+        if text == "⭐":
+            return None  # glyph missing in the font
+        return Image.new("RGBA", (size, size), "yellow")
+
+    return render
+
+
+def test_emoji_re_matches_sequences():
+    text = "Hi \U0001F44B\U0001F3FD, \U0001F468‍\U0001F4BB and \U0001F1E9\U0001F1EA ❤️!"
+    found = emoji_images.EMOJI_RE.findall(text)
+    assert found == [
+        "\U0001F44B\U0001F3FD",
+        "\U0001F468‍\U0001F4BB",
+        "\U0001F1E9\U0001F1EA",
+        "❤️",
+    ]
+
+
+def test_write_emoji_image_markdown(tmp_path):
+    font = tmp_path / "emoji.ttf"
+    font.write_bytes(b"font")
+    md = tmp_path / "combined.md"
+    md.write_text(
+        "Party \U0001F389 and `code \U0001F389` and ⭐\n"
+        "```\n\U0001F389 in a block\n```\n"
+        "Again \U0001F389\n",
+        encoding="utf-8",
+    )
+    calls = []
+    images = emoji_images.EmojiImageCache(
+        str(font), str(tmp_path / "cache"), renderer=fake_renderer(calls)
+    )
+    out = tmp_path / "emoji.md"
+    count, missing = emoji_images.write_emoji_image_markdown(
+        str(md), str(out), images, str(tmp_path / "link"), container_dir="/temp/emoji"
+    )
+
+    assert count == 2
+    assert missing == 1
+    assert calls == ["\U0001F389", "⭐"]
+    text = out.read_text(encoding="utf-8").splitlines()
+    image = "`\\raisebox{-0.15em}{\\includegraphics[height=1em]{/temp/emoji/1f389_72.png}}`{=latex}"
+    assert text[0] == f"Party {image} and `code \U0001F389` and ⭐"
+    assert text[2] == "\U0001F389 in a block"
+    assert text[4] == f"Again {image}"
+    assert (tmp_path / "link" / "1f389_72.png").is_file()
+
+
+def test_emoji_image_cache_shared_between_runs(tmp_path):
+    font = tmp_path / "emoji.ttf"
+    font.write_bytes(b"font")
+    calls = []
+    first = emoji_images.EmojiImageCache(
+        str(font), str(tmp_path), renderer=fake_renderer(calls)
+    )
+    path = first.image_for("❤️")
+    assert path.endswith("2764_72.png")
+    assert first.image_for("⭐") is None
+
+    second = emoji_images.EmojiImageCache(
+        str(font), str(tmp_path), renderer=fake_renderer(calls)
+    )
+    assert second.image_for("❤️") == path
+    assert second.image_for("⭐") is None
+    assert calls == ["❤️", "⭐"]
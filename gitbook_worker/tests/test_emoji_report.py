@@ -1,5 +1,8 @@
 import os
-from gitbook_worker.src.gitbook_worker import emoji_report
+
+import pytest
+
+from gitbook_worker.src.gitbook_worker import emoji_report, utils
 
 
 def test_emoji_report_counts(tmp_path):
@@ -10,3 +13,60 @@ def test_emoji_report_counts(tmp_path):
     assert counts.get("Transport and Map Symbols") == 1
     assert "| Unicode Block |" in table
     assert "Transport and Map Symbols" in table
+
+
+def naive_counts(text):
+    from gitbook_worker.src.gitbook_worker.utils import EMOJI_BLOCKS
+
+    counts = {}
+    for char in text:
+        cp = ord(char)
+        if cp <= 0x7F or 0xA0 <= cp <= 0x24F:
+            continue
+        block = next((n for n, s, e in EMOJI_BLOCKS if s <= cp <= e), "Unknown")
+        counts[block] = counts.get(block, 0) + 1
+    return counts
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_emoji_report_matches_linear_scan(tmp_path, monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(utils, "np", None)
+    text = "Grüße 漢字テキスト 😊🚀 🇩🇪 🅰 ☀✂ 🧪 Привет\n" * 50
+    md = tmp_path / "file.md"
+    md.write_text(text, encoding="utf-8")
+    counts, _ = emoji_report(str(md))
+    assert counts == naive_counts(text)
+    assert counts["Flags"] == 100
+    assert counts["Enclosed Alphanumeric Supplement"] == 50
+
+
+def test_emoji_chapter_report(tmp_path, monkeypatch):
+    a = tmp_path / "a.md"
+    a.write_text("Eins 😊😊\n", encoding="utf-8")
+    b = tmp_path / "b.md"
+    b.write_text("Zwei 🚀\n" * 10, encoding="utf-8")
+    c = tmp_path / "c.md"
+    c.write_text("Nur Latein\n", encoding="utf-8")
+    combined = tmp_path / "combined.md"
+    utils.combine_markdown([str(a), str(b), str(c)], str(combined))
+
+    per_chapter, table = utils.emoji_chapter_report(str(combined))
+    assert per_chapter == {
+        "a.md": {"Emoticons": 2},
+        "b.md": {"Transport and Map Symbols": 10},
+    }
+    assert "| b.md | Transport and Map Symbols | 10 |" in table
+
+    # Chunked reading gives the same totals as one pass.
+    chunked = utils._emoji_chapter_counts(str(combined), chunk_size=8)
+    assert [c for c, _ in chunked] == ["a.md", "b.md", "c.md"]
+    counts, _ = emoji_report(str(combined))
+    assert counts == {"Emoticons": 2, "Transport and Map Symbols": 10}
+
+    # Precomputed chapter counts are reused without reading the file again.
+    combined.unlink()
+    assert emoji_report(str(combined), chunked)[0] == counts
+    assert utils.emoji_chapter_report(str(combined), chunked)[0] == per_chapter
@@ -1,3 +1,7 @@
+import json
+import threading
+import time
+
 from gitbook_worker.src.gitbook_worker import ai_tools, source_extract
 
 
@@ -25,7 +29,7 @@ def test_proof_and_repair_replaces_content(tmp_path, monkeypatch):
             ]
         }
 
-    def fake_ask(prompt, ai_url, ai_api_key, ai_provider):
+    def fake_ask(prompt, ai_url, ai_api_key, ai_provider, schema=None):
         return True, {
             "success": True,
             "new": "1. Example NEW",
@@ -45,3 +49,91 @@ def test_proof_and_repair_replaces_content(tmp_path, monkeypatch):
     content = md.read_text().splitlines()
     assert content.count("1. Example NEW") == 1
     assert "1. Example https://example.com" not in content
+
+
+def test_external_references_concurrent_in_order(tmp_path, monkeypatch):
+    files = []
+    for name in ("a.md", "b.md"):
+        md = tmp_path / name
+        md.write_text("".join(f"{i}. {name} ref {i}\n" for i in range(1, 5)))
+        files.append(str(md))
+
+    def fake_extract(file):
+        lines = open(file).read().splitlines()
+        return {
+            file: [
+                {f"ref{i}": {"lineno": i, "line": line, "numbering": f"{i}."}}
+                for i, line in enumerate(lines, 1)
+            ]
+        }
+
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def fake_ask(prompt, ai_url, ai_api_key, ai_provider, schema=None):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        # Earlier references answer last.
+        time.sleep(0.05 - 0.01 * int(prompt.split("Quelle [")[1][0]))
+        with lock:
+            in_flight -= 1
+        return True, {"success": True, "new": None}
+
+    monkeypatch.setattr(ai_tools, "extract_sources_of_a_md_file_to_dict", fake_extract)
+    monkeypatch.setattr(ai_tools, "ask_ai", fake_ask)
+
+    report = ai_tools.proof_and_repair_external_references(
+        files, "", "", "", "", max_concurrency=3
+    )
+
+    assert peak == 3
+    assert [(e["file"], e["lineno"]) for e in report] == [
+        (f, i) for f in files for i in range(1, 5)
+    ]
+    assert all(e["action"] == "link_check_succeeded" for e in report)
+
+
+def test_external_reference_batch_matches_ids_and_retries(monkeypatch):
+    prompts = []
+
+    def fake_ask(prompt, ai_url, ai_api_key, ai_provider, schema=None):
+        prompts.append(prompt)
+        if "Quellen:" not in prompt:
+            return True, {"success": True, "new": "single"}
+        items = json.loads(prompt.split("Quellen:\n")[1].split("\n\n\n\n")[0])
+        # Answer out of order and without the second reference.
+        answer = [
+            {"id": item["id"], "success": True, "new": item["reference"].upper()}
+            for item in reversed(items)
+            if item["index"] != 2
+        ]
+        return True, json.dumps({"results": answer})
+
+    monkeypatch.setattr(ai_tools, "ask_ai", fake_ask)
+    results = ai_tools.proof_and_repair_external_reference_batch(
+        [(1, "a"), (2, "b"), (3, "c")], "", "", "", "openai"
+    )
+
+    assert [result["new"] for _, result in results] == ["A", "single", "C"]
+    assert len(prompts) == 2
+
+
+def test_external_reference_batch_unparsable_answer(monkeypatch):
+    calls = []
+
+    def fake_ask(prompt, ai_url, ai_api_key, ai_provider, schema=None):
+        calls.append(prompt)
+        if "Quellen:" in prompt:
+            return True, "keine JSON-Antwort"
+        return True, {"success": True, "new": None}
+
+    monkeypatch.setattr(ai_tools, "ask_ai", fake_ask)
+    results = ai_tools.proof_and_repair_external_reference_batch(
+        [(1, "a"), (2, "b")], "", "", "", "openai"
+    )
+
+    assert all(success for success, _ in results)
+    assert len(calls) == 3
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from gitbook_worker.src.gitbook_worker import font_coverage
+from gitbook_worker.src.gitbook_worker.font_coverage import FontCoverage
+
+def test_font_coverage_ranges():
+    cov = FontCoverage.from_codepoints([0x41, 0x42, 0x43, 0xE9, 0x2014])
+    assert cov.ranges == [(0x41, 0x43), (0xE9, 0xE9), (0x2014, 0x2014)]
+    assert 0x42 in cov and 0xE9 in cov and 0x2014 in cov
+    assert 0x44 not in cov and 0x20 not in cov
+    assert len(cov) == 5
+
+
+def test_parse_fc_charset():
+    assert font_coverage._parse_fc_charset("20-7e a0-17f\n2014") == [
+        (0x20, 0x7E),
+        (0xA0, 0x17F),
+        (0x2014, 0x2014),
+    ]
+
+
+def test_scan_characters_locations(tmp_path):
+    md = tmp_path / "combined.md"
+    md.write_text(
+        "<!-- chapter: a.md -->\n\n"
+        "Plain ascii\n"
+        "Café ☃\n"
+        "```\n"
+        "x → y\n"
+        "```\n"
+        "<!-- chapter: b.md -->\n\n"
+        "Use `é` and ❤️‍ here\n",
+        encoding="utf-8",
+    )
+    found = font_coverage.scan_characters(str(md))
+    assert found[("é", False)] == [("a.md", 2)]
+    assert found[("☃", False)] == [("a.md", 2)]
+    assert found[("→", True)] == [("a.md", 4)]
+    assert found[("é", True)] == [("b.md", 1)]
+    assert ("❤", False) in found
+    assert ("️", False) not in found and ("‍", False) not in found
+
+
+def test_check_font_coverage(tmp_path, monkeypatch):
+    md = tmp_path / "combined.md"
+    md.write_text(
+        "<!-- chapter: a.md -->\n\nCafé ☃ \U0001F600\n`→`\n", encoding="utf-8"
+    )
+    coverages = {
+        "Main": FontCoverage.from_codepoints(map(ord, "é☃→")),
+        "Sans": FontCoverage.from_codepoints(map(ord, "é")),
+        "Mono": FontCoverage.from_codepoints(map(ord, "é")),
+        "Emoji": FontCoverage.from_codepoints([0x1F600]),
+    }
+    monkeypatch.setattr(
+        font_coverage, "resolve_font", lambda f: None if f == "Gone" else f
+    )
+    monkeypatch.setattr(
+        font_coverage, "font_coverage", lambda path, cache_dir=None: coverages[path]
+    )
+    issues, missing = font_coverage.check_font_coverage(
+        str(md), ["Main", "Sans"], ["Mono"], ["Emoji", "Gone"]
+    )
+    assert missing == ["Gone"]
+    summary = [(i["char"], i["fonts"], i["locations"]) for i in issues]
+    assert summary == [("→", "Mono", [("a.md", 2)]), ("☃", "Sans", [("a.md", 1)])]
+    report = font_coverage.format_coverage_report(issues, missing)
+    assert "U+2603" in report and "SNOWMAN" in report and "Gone" in report
+
+
+def make_font(path, chars):
+    fb = pytest.importorskip("fontTools.fontBuilder")
+    pen_mod = pytest.importorskip("fontTools.pens.ttGlyphPen")
+    glyphs = [".notdef"] + [f"g{ord(c):x}" for c in chars]
+    builder = fb.FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyphs)
+    builder.setupCharacterMap({ord(c): f"g{ord(c):x}" for c in chars})
+    empty = pen_mod.TTGlyphPen(None).glyph()
+    builder.setupGlyf({name: empty for name in glyphs})
+    builder.setupHorizontalMetrics({name: (500, 0) for name in glyphs})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({"familyName": "Test", "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(str(path))
+
+
+def test_font_coverage_cached(tmp_path, monkeypatch):
+    font = tmp_path / "test.ttf"
+    make_font(font, "ABCé")
+    cache_dir = tmp_path / "cache"
+    cov = font_coverage.font_coverage(str(font), str(cache_dir))
+    assert cov.ranges == [(0x41, 0x43), (0xE9, 0xE9)]
+    assert len(os.listdir(cache_dir)) == 1
+
+    def fail(path):
+        raise AssertionError("cmap read again")
+
+    monkeypatch.setattr(font_coverage, "_probe_coverage", fail)
+    assert font_coverage.font_coverage(str(font), str(cache_dir)).ranges == cov.ranges
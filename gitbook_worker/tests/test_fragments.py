@@ -0,0 +1,118 @@
+import os
+
+from gitbook_worker.src.gitbook_worker import fragments
+from gitbook_worker.src.gitbook_worker.utils import (
+    combine_markdown,
+    split_combined_markdown,
+    strip_chapter_markers,
+)
+
+
+def test_combine_and_split_roundtrip(tmp_path):
+    a = tmp_path / "a.md"
+    b = tmp_path / "b.md"
+    a.write_text("# A\n\ntext a\n")
+    b.write_text("# B\n")
+    combined = tmp_path / "combined.md"
+    written = combine_markdown([str(a), str(tmp_path / "missing.md"), str(b)], str(combined))
+    assert written == [str(a), str(b)]
+    chapters = split_combined_markdown(str(combined))
+    assert [c for c, _ in chapters] == ["a.md", "b.md"]
+    assert "text a" in chapters[0][1]
+    assert "# B" in chapters[1][1]
+
+
+def test_chapter_markers_are_relative_and_strippable(tmp_path):
+    book = tmp_path / "book"
+    (book / "teil").mkdir(parents=True)
+    (book / "README.md").write_text("# Start\n")
+    (book / "teil" / "kapitel.md").write_text("# Kapitel\n")
+    combined = tmp_path / "combined.md"
+    combine_markdown(
+        [str(book / "README.md"), str(book / "teil" / "kapitel.md")],
+        str(combined),
+        str(book),
+    )
+    text = combined.read_text()
+    assert "<!-- chapter: teil/kapitel.md -->" in text
+    assert str(tmp_path) not in text
+
+    stripped = strip_chapter_markers(str(combined), str(tmp_path / "out.md"))
+    text = open(stripped).read()
+    assert "<!--" not in text
+    assert "# Start" in text and "# Kapitel" in text
+
+
+def test_build_chapter_fragments_reuses_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run(cmd, cwd=None, capture_output=False, input_text=None):
+        calls.append(input_text)
+        out = cmd[cmd.index("-o") + 1]
+        with open(out, "w", encoding="utf-8") as f:
+            f.write("\\section{x}\n")
+        return "", "", 0
+
+    monkeypatch.setattr(fragments, "run", fake_run)
+    chapters = [("a.md", "# A\n"), ("b.md", "# B\n")]
+    paths, errors = fragments.build_chapter_fragments(chapters, str(tmp_path), ".")
+    assert errors == []
+    assert len(calls) == 2
+    assert all(p.endswith(".tex") for p in paths)
+
+    chapters[1] = ("b.md", "# B changed\n")
+    new_paths, _ = fragments.build_chapter_fragments(chapters, str(tmp_path), ".")
+    assert calls[2:] == ["# B changed\n"]
+    assert new_paths[0] == paths[0]
+    assert new_paths[1] != paths[1]
+
+
+def test_identical_chapters_share_one_fragment(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run(cmd, cwd=None, capture_output=False, input_text=None):
+        calls.append(input_text)
+        with open(cmd[cmd.index("-o") + 1], "w", encoding="utf-8") as f:
+            f.write("\\section{x}\n")
+        return "", "", 0
+
+    monkeypatch.setattr(fragments, "run", fake_run)
+    chapters = [("a.md", "# Stub\n"), ("b.md", "# Stub\n"), ("c.md", "# C\n")]
+    paths, errors = fragments.build_chapter_fragments(chapters, str(tmp_path), ".")
+    assert errors == []
+    assert len(calls) == 2
+    assert paths[0] == paths[1] and os.path.isfile(paths[0])
+    # No temp files are left behind.
+    assert sorted(os.listdir(tmp_path / "fragments")) == sorted(
+        os.path.basename(p) for p in set(paths)
+    )
+
+
+def test_write_highlighting_macros_leaves_no_temp_files(tmp_path, monkeypatch):
+    def fake_run(cmd, cwd=None, capture_output=False, input_text=None):
+        with open(cmd[cmd.index("-o") + 1], "w", encoding="utf-8") as f:
+            f.write("\\newcommand{\\KeywordTok}[1]{#1}\n")
+        return "", "", 0
+
+    monkeypatch.setattr(fragments, "run", fake_run)
+    header = fragments.write_highlighting_macros(str(tmp_path), (3, 1))
+    assert os.listdir(tmp_path) == [os.path.basename(header)]
+    assert "KeywordTok" in open(header, encoding="utf-8").read()
+
+
+def test_build_chapter_fragments_reports_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        fragments,
+        "run",
+        lambda cmd, cwd=None, capture_output=False, input_text=None: ("", "boom", 1),
+    )
+    paths, errors = fragments.build_chapter_fragments([("a.md", "x")], str(tmp_path), ".")
+    assert errors and "a.md" in errors[0] and "boom" in errors[0]
+
+
+def test_write_master_markdown(tmp_path):
+    frag = tmp_path / "frag.tex"
+    master = fragments.write_master_markdown([str(frag)], str(tmp_path / "master.md"))
+    text = open(master, encoding="utf-8").read()
+    assert "```{=latex}" in text
+    assert f"\\input{{{frag.as_posix()}}}" in text
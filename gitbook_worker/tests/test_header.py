@@ -109,3 +109,69 @@ def test_write_pandoc_header_disable_longtable(tmp_path):
     )
     content = open(header, encoding="utf-8").read()
     assert "\\renewenvironment{longtable}" in content
+
+
+def test_write_pandoc_header_precompile_marker(tmp_path, monkeypatch):
+    from gitbook_worker.src.gitbook_worker.utils import PRECOMPILE_MARKER
+
+    md = tmp_path / "file.md"
+    md.write_text("x")
+    monkeypatch.setattr("gitbook_worker.utils.wrap_wide_tables", lambda *a, **k: None)
+    header = _write_pandoc_header(
+        str(tmp_path),
+        "OpenMoji Black",
+        "Sans",
+        "Mono",
+        "Main",
+        True,
+        6,
+        str(md),
+        precompile_marker=True,
+    )
+    content = open(header, encoding="utf-8").read()
+    marker = content.index(PRECOMPILE_MARKER)
+    assert content.index("\\usepackage{ltablex}") < marker
+    assert marker < content.index("\\usepackage{fontspec}")
+    assert marker < content.index("\\newfontfamily\\EmojiOne")
+
+
+def test_write_pandoc_header_xelatex_without_lua_features(tmp_path):
+    md = tmp_path / "combined.md"
+    md.write_text("text")
+    header = _write_pandoc_header(
+        str(tmp_path),
+        "Segoe UI Emoji",
+        "Sans",
+        "Mono",
+        "Main",
+        False,
+        6,
+        str(md),
+        pdf_engine="xelatex",
+    )
+    content = open(header, encoding="utf-8").read()
+    assert "\\usepackage{fontspec}" in content
+    assert "\\newfontfamily\\EmojiOne{Segoe UI Emoji}" in content
+    assert "Range=" not in content
+    assert "\\directlua" not in content
+
+
+def test_write_pandoc_header_pdflatex_keeps_template_fonts(tmp_path):
+    md = tmp_path / "combined.md"
+    md.write_text("text")
+    header = _write_pandoc_header(
+        str(tmp_path),
+        "OpenMoji Color",
+        "Sans",
+        "Mono",
+        "Main",
+        False,
+        6,
+        str(md),
+        disable_longtable=True,
+        pdf_engine="pdflatex",
+    )
+    content = open(header, encoding="utf-8").read()
+    assert "fontspec" not in content
+    assert "EmojiOne" not in content
+    assert "\\renewenvironment{longtable}" in content
@@ -0,0 +1,122 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from gitbook_worker.src.gitbook_worker import latex_format
+from gitbook_worker.src.gitbook_worker.utils import PRECOMPILE_MARKER
+
+
+def make_fake_run(calls, fail_engine=False, inputs=None):
+    def fake_run(cmd, cwd=None, capture_output=False, input_text=None):
+        calls.append(cmd)
+        if "pandoc" in cmd:
+            if inputs is not None:
+                inputs.append(input_text)
+            return f"\\documentclass{{article}}\n{PRECOMPILE_MARKER}\n", "", 0
+        if fail_engine:
+            return "! Error", "", 1
+        if "-ini" in cmd:
+            name = [c for c in cmd if c.startswith("-jobname=")][0].split("=", 1)[1]
+            open(os.path.join(cwd, f"{name}.fmt"), "w").close()
+        return "", "", 0
+
+    return fake_run
+
+
+def test_ensure_latex_format_builds_and_reuses(tmp_path, monkeypatch):
+    header = tmp_path / "header.tex"
+    header.write_text(PRECOMPILE_MARKER + "\n")
+    calls = []
+    monkeypatch.setattr(latex_format, "run", make_fake_run(calls))
+
+    fmt = latex_format.ensure_latex_format(str(header), str(tmp_path / "cache"))
+    assert fmt and fmt.endswith(".fmt") and os.path.isfile(fmt)
+    assert any("mylatexformat.ltx" in c for c in calls)
+
+    calls.clear()
+    assert latex_format.ensure_latex_format(str(header), str(tmp_path / "cache")) == fmt
+    assert all("pandoc" in c for c in calls)
+
+
+def test_format_preamble_rendered_with_code_block(tmp_path, monkeypatch):
+    header = tmp_path / "header.tex"
+    header.write_text(PRECOMPILE_MARKER + "\n")
+    inputs = []
+    monkeypatch.setattr(latex_format, "run", make_fake_run([], inputs=inputs))
+    fmt = latex_format.ensure_latex_format(str(header), str(tmp_path / "cache"))
+    # Pandoc only emits the highlighting macros for documents with code.
+    assert inputs == [latex_format.SAMPLE_DOCUMENT] and "```" in inputs[0]
+    # The header copy is private to the build and removed afterwards.
+    assert not [f for f in os.listdir(os.path.dirname(fmt)) if f.startswith("tmp")]
+
+
+@pytest.mark.skipif(
+    not (shutil.which("pandoc") and shutil.which("lualatex")),
+    reason="pandoc and lualatex not installed",
+)
+def test_format_compiles_document_with_code_block(tmp_path):
+    header = tmp_path / "header.tex"
+    header.write_text(PRECOMPILE_MARKER + "\n")
+    fmt = latex_format.ensure_latex_format(
+        str(header), str(tmp_path / "cache"), extra_args=latex_format.FORMAT_VARIABLES
+    )
+    assert fmt
+    book = tmp_path / "book.md"
+    book.write_text("# Code\n\n```python\nprint('x')\n```\n", encoding="utf-8")
+    tex = tmp_path / "book.tex"
+    subprocess.run(
+        ["pandoc", str(book), "-s", "-o", str(tex), "-H", str(header)]
+        + latex_format.FORMAT_VARIABLES,
+        check=True,
+    )
+    result = subprocess.run(
+        [
+            "lualatex",
+            f"-fmt={os.path.splitext(fmt)[0]}",
+            "-interaction=nonstopmode",
+            "-halt-on-error",
+            tex.name,
+        ],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout[-2000:]
+
+
+def test_ensure_latex_format_remembers_failures(tmp_path, monkeypatch):
+    header = tmp_path / "header.tex"
+    header.write_text(PRECOMPILE_MARKER + "\n")
+    calls = []
+    monkeypatch.setattr(latex_format, "run", make_fake_run(calls, fail_engine=True))
+    assert latex_format.ensure_latex_format(str(header), str(tmp_path)) is None
+    calls.clear()
+    assert latex_format.ensure_latex_format(str(header), str(tmp_path)) is None
+    assert all("pandoc" in c for c in calls)
+
+
+def test_format_is_rebuilt_for_new_tex_binary(tmp_path, monkeypatch):
+    header = tmp_path / "header.tex"
+    header.write_text(PRECOMPILE_MARKER + "\n")
+    monkeypatch.setattr(latex_format, "run", make_fake_run([]))
+    monkeypatch.setattr(latex_format.toolchain, "binary_key", lambda name: "tex:1")
+    old = latex_format.ensure_latex_format(str(header), str(tmp_path))
+    monkeypatch.setattr(latex_format.toolchain, "binary_key", lambda name: "tex:2")
+    assert latex_format.ensure_latex_format(str(header), str(tmp_path)) != old
+
+    monkeypatch.setattr(latex_format.docker_tools, "get_image_id", lambda i: "sha:1")
+    key = latex_format.engine_key("lualatex", "erda-pandoc")
+    monkeypatch.setattr(latex_format.docker_tools, "get_image_id", lambda i: "sha:2")
+    assert latex_format.engine_key("lualatex", "erda-pandoc") != key
+
+
+def test_format_commands_in_docker(tmp_path):
+    cmd = latex_format._command(["lualatex", "-ini", "x.tex"], str(tmp_path), "erda-pandoc")
+    assert cmd[:3] == ["docker", "run", "--rm"]
+    assert cmd[cmd.index("--entrypoint") + 1] == "lualatex"
+    assert cmd[-2:] == ["-ini", "x.tex"]
+    assert latex_format.format_engine_opt(str(tmp_path / "p.fmt"), docker=True) == (
+        f"--pdf-engine-opt=-fmt={latex_format.DOCKER_FORMAT_DIR}/p.fmt"
+    )
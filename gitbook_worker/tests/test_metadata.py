@@ -0,0 +1,46 @@
+import pytest
+
+from gitbook_worker.src.gitbook_worker import metadata, validate_metadata
+
+yaml = pytest.importorskip("yaml")
+
+
+def test_read_frontmatter_stops_at_delimiter(tmp_path):
+    md = tmp_path / "ch.md"
+    md.write_text("---\ntitle: T\n---\nBody\n\n---\n\nmore: text\n", encoding="utf-8")
+    assert metadata.read_frontmatter(str(md)) == "\ntitle: T\n"
+    plain = tmp_path / "plain.md"
+    plain.write_text("# No frontmatter\n---\n", encoding="utf-8")
+    assert metadata.read_frontmatter(str(plain)) is None
+
+
+def test_chapter_metadata_is_parsed_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(metadata, "_cache", {})
+    calls = []
+    parse = metadata.parse_frontmatter
+    monkeypatch.setattr(
+        metadata, "parse_frontmatter", lambda text: calls.append(text) or parse(text)
+    )
+    md = tmp_path / "ch.md"
+    md.write_text("---\ntitle: T\nauthor: A\n---\n", encoding="utf-8")
+    files = [str(md), str(tmp_path / "missing.md")]
+    loaded = metadata.load_metadata(files)
+    assert loaded[str(md)] == ({"title": "T", "author": "A"}, None)
+    assert loaded[files[1]][0] is None and loaded[files[1]][1]
+    assert validate_metadata([str(md)]) == [(str(md), "Missing metadata field: date")]
+    assert len(calls) == 1
+
+    md.write_text("---\ntitle: T2\n---\n", encoding="utf-8")
+    assert metadata.chapter_metadata(str(md))[0] == {"title": "T2"}
+    assert len(calls) == 2
+
+
+def test_validate_metadata_reports_yaml_errors(tmp_path):
+    broken = tmp_path / "broken.md"
+    broken.write_text("---\ntitle: [unclosed\n---\n", encoding="utf-8")
+    empty = tmp_path / "empty.md"
+    empty.write_text("---\n---\nText\n", encoding="utf-8")
+    issues = validate_metadata([str(broken), str(empty)])
+    assert issues[0][0] == str(broken)
+    assert issues[0][1].startswith("Metadata parse error:")
+    assert (str(empty), "Missing metadata field: title") in issues
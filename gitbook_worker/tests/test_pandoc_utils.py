@@ -1,9 +1,15 @@
 from gitbook_worker.src.gitbook_worker.pandoc_utils import (
+    LatexProgress,
     build_docker_pandoc_cmd,
     build_pandoc_cmd,
+    output_path_for_format,
+    pandoc_ast_path,
+    select_pdf_engine,
 )
 from pathlib import Path
 
+import pytest
+
 
 def test_build_docker_pandoc_cmd_includes_filter(tmp_path):
     cmd = build_docker_pandoc_cmd(
@@ -39,3 +45,118 @@ def test_landscape_lua_trailing_newline():
     path = Path(__import__("gitbook_worker").__file__).with_name("landscape.lua")
     data = path.read_bytes()
     assert data.endswith(b"\n")
+
+
+def test_build_pandoc_cmd_from_cached_ast():
+    cmd = build_pandoc_cmd(
+        combined_md="pandoc_ast_0123.json",
+        pdf_output="book.html",
+        resource_path=".",
+        header_file="header.tex",
+        filter_paths=None,
+        output_format="html",
+    )
+    assert cmd[cmd.index("-f") + 1] == "json"
+    assert cmd[cmd.index("-t") + 1] == "html5"
+    assert "header.tex" not in cmd
+    assert "--pdf-engine=lualatex" not in cmd
+
+
+def test_build_docker_pandoc_cmd_ast_output_in_temp(tmp_path):
+    temp = tmp_path / "temp"
+    out = tmp_path / "out"
+    cmd = build_docker_pandoc_cmd(
+        out_dir=str(out),
+        temp_dir=str(temp),
+        clone_dir=str(tmp_path),
+        combined_md=str(temp / "combined.md"),
+        pdf_output=str(temp / "pandoc_ast_0123.json"),
+        header_file=str(temp / "header.tex"),
+        filter_paths=None,
+        output_format="json",
+    )
+    assert cmd[cmd.index("-o") + 1] == "/temp/pandoc_ast_0123.json"
+    assert cmd[cmd.index("-t") + 1] == "json"
+
+
+def test_pandoc_ast_path_keyed_by_content(tmp_path):
+    md = tmp_path / "combined.md"
+    md.write_text("# One")
+    first = pandoc_ast_path(str(md), str(tmp_path))
+    assert first == pandoc_ast_path(str(md), str(tmp_path))
+    md.write_text("# Two")
+    assert pandoc_ast_path(str(md), str(tmp_path)) != first
+    assert first.endswith(".json")
+
+    lua = tmp_path / "filter.lua"
+    lua.write_text("return {}")
+    filtered = pandoc_ast_path(str(md), str(tmp_path), filter_paths=[str(lua)])
+    assert filtered != pandoc_ast_path(str(md), str(tmp_path))
+    lua.write_text("return {{}}")
+    assert pandoc_ast_path(str(md), str(tmp_path), filter_paths=[str(lua)]) != filtered
+
+
+def test_output_path_for_format():
+    assert output_path_for_format("book_1.pdf", "epub") == "book_1.epub"
+
+
+def test_build_docker_pandoc_cmd_tex_cache(tmp_path):
+    cmd = build_docker_pandoc_cmd(
+        out_dir=str(tmp_path),
+        temp_dir=str(tmp_path),
+        clone_dir=str(tmp_path),
+        combined_md=str(tmp_path / "file.md"),
+        pdf_output=str(tmp_path / "out.pdf"),
+        header_file=str(tmp_path / "header.tex"),
+        filter_paths=None,
+        tex_cache="texcache-vol",
+    )
+    assert "texcache-vol:/texcache" in cmd
+    assert cmd.index("texcache-vol:/texcache") < cmd.index("erda-pandoc")
+    assert "TEXMFVAR=/texcache" in cmd
+    assert cmd[:4] == ["docker", "run", "--rm", "--init"]
+    assert cmd[cmd.index("--name") + 1].startswith("gitbook-worker-run-")
+
+
+def test_latex_progress_tracks_runs_and_pages():
+    progress = LatexProgress("pandoc pdf", every=10)
+    progress("stderr", "[makePDF] Run #1\n")
+    progress("stderr", "[1{/usr/share/texmf/pdftex.map}] [2] [3\n")
+    progress("stderr", "] [4] Overfull \\hbox [12pt]\n")
+    assert progress.runs == 1
+    assert progress.pages == 4
+    progress("stderr", "[makePDF] Run #2\n")
+    assert progress.runs == 2
+    assert progress.pages == 0
+
+
+def test_select_pdf_engine_auto(tmp_path):
+    plain = tmp_path / "plain.md"
+    plain.write_text("Grüße – „Zitat“ … 5 €\n", encoding="utf-8")
+    emoji = tmp_path / "emoji.md"
+    emoji.write_text("Party \U0001F389\n", encoding="utf-8")
+    assert select_pdf_engine("auto", str(plain)) == "pdflatex"
+    assert select_pdf_engine("auto", str(emoji)) == "lualatex"
+    # Latin Extended-B and zero-width spaces are not covered by utf8/T1.
+    for text in ("Ƀ\n", "Wort\u200bgrenze\n"):
+        other = tmp_path / "other.md"
+        other.write_text(text, encoding="utf-8")
+        assert select_pdf_engine("auto", str(other)) == "lualatex"
+    assert select_pdf_engine("xelatex", str(emoji)) == "xelatex"
+    with pytest.raises(ValueError):
+        select_pdf_engine("context", str(plain))
+
+
+def test_build_pandoc_cmd_pdf_engine():
+    cmd = build_pandoc_cmd(
+        "in.md", "out.pdf", "res", "header.tex", None, pdf_engine="xelatex"
+    )
+    assert "--pdf-engine=xelatex" in cmd
+    assert "--pdf-engine=lualatex" not in cmd
+
+
+def test_build_pandoc_cmd_without_toc():
+    assert "--toc" in build_pandoc_cmd("in.md", "out.pdf", "res", "h.tex", None)
+    cmd = build_pandoc_cmd("in.md", "out.html", "res", "h.tex", None, output_format="html", toc=False)
+    assert "--toc" not in cmd
+    assert "--standalone" in cmd
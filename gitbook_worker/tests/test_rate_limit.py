@@ -0,0 +1,94 @@
+import requests
+
+from gitbook_worker.src.gitbook_worker import ai_tools, rate_limit
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}", response=self)
+
+    def json(self):
+        return self.data
+
+
+def test_token_bucket_waits_for_refill(monkeypatch):
+    now = [0.0]
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+
+    bucket = rate_limit.TokenBucket(60)
+    assert bucket.acquire(60) == 0
+    assert bucket.acquire(1) == 1.0
+    now[0] = 10.0
+    assert bucket.acquire(5) == 0
+    # More than the capacity is limited to one minute's worth.
+    assert bucket.acquire(1000) == 56.0
+    assert sleeps == [1.0, 56.0]
+    assert rate_limit.TokenBucket(0).acquire(10**6) == 0
+
+
+def test_retry_delay():
+    assert rate_limit.retry_after_seconds("7") == 7.0
+    assert rate_limit.retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert rate_limit.retry_after_seconds("bald") is None
+    assert rate_limit.retry_delay(3, retry_after=7.0) == 7.0
+    assert rate_limit.retry_delay(10, retry_after=1000) == rate_limit.MAX_RETRY_DELAY
+    for attempt in range(8):
+        delay = rate_limit.retry_delay(attempt)
+        assert 0 <= delay <= min(2**attempt, rate_limit.MAX_RETRY_DELAY)
+
+
+def test_ask_ai_retries_transient_errors(monkeypatch):
+    answer = {"choices": [{"message": {"content": " ok "}}]}
+    responses = [
+        FakeResponse(429, headers={"Retry-After": "2"}),
+        requests.exceptions.ConnectionError("reset"),
+        FakeResponse(503),
+        FakeResponse(200, answer),
+    ]
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    sleeps = []
+    monkeypatch.setattr(ai_tools.requests, "post", fake_post)
+    monkeypatch.setattr(ai_tools.time, "sleep", sleeps.append)
+    limiter = rate_limit.configure_rate_limit("openai")
+
+    assert ai_tools.ask_ai("p", "url", "key", "openai") == (True, "ok")
+    assert sleeps[0] == 2.0 and len(sleeps) == 3
+    assert limiter.stats.calls == 1 and limiter.stats.retries == 3
+
+
+def test_ask_ai_gives_up(monkeypatch):
+    calls = []
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        # The Gemini key is sent as a header, not in the logged URL.
+        assert url == "url" and headers["x-goog-api-key"] == "key"
+        calls.append(url)
+        return FakeResponse(429 if len(calls) < 5 else 400)
+
+    monkeypatch.setattr(ai_tools.requests, "post", fake_post)
+    monkeypatch.setattr(ai_tools.time, "sleep", lambda s: None)
+    rate_limit.configure_rate_limit("genai")
+
+    success, error = ai_tools.ask_ai("p", "url", "key", "genai", max_retries=2)
+    assert not success and error.startswith("[GenAI] Fehler: 429")
+    assert len(calls) == 3
+
+    calls.clear()
+    calls.extend([None] * 4)
+    success, _ = ai_tools.ask_ai("p", "url", "key", "genai")
+    # A client error is not retried.
+    assert not success and len(calls) == 5
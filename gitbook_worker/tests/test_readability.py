@@ -0,0 +1,83 @@
+import pytest
+
+from gitbook_worker.src.gitbook_worker import readability
+
+BOOK = """---
+title: Test
+---
+
+# Intro
+
+Short words are read fast. See [the docs](https://example.com/docs).
+
+```python
+def not_prose(): return "x" * 100
+```
+
+| a | b |
+| - | - |
+| 1 | 2 |
+
+## Details
+
+- first item
+- second item with `code`
+
+<!-- hidden
+comment -->
+Visit https://example.com now. ![img](pic.png)
+"""
+
+
+def test_split_prose_sections():
+    sections = readability.split_prose_sections(BOOK)
+    assert [(h, line) for h, line, _ in sections] == [("Intro", 5), ("Details", 17)]
+    prose = readability.strip_to_prose(BOOK)
+    assert "Short words are read fast. See the docs." in prose
+    assert "first item." in prose and "second item with." in prose
+    assert "Visit  now." in prose
+    for dropped in ("not_prose", "| a |", "https", "hidden", "pic.png", "title"):
+        assert dropped not in prose
+
+
+def fake_scores(calls):
+    def scores(prose):
+        calls.append(prose)
+        words = len(prose.split())
+        return {"fre": float(words), "fk": 1.0, "words": words}
+
+    return scores
+
+
+def test_readability_scores_cached(tmp_path, monkeypatch):
+    pytest.importorskip("textstat")
+    calls = []
+    monkeypatch.setattr(readability, "_scores", fake_scores(calls))
+    one = tmp_path / "one.md"
+    one.write_text(BOOK, encoding="utf-8")
+    two = tmp_path / "two.md"
+    two.write_text("Just one sentence here.\n", encoding="utf-8")
+    files = [str(one), str(two)]
+    cache_dir = str(tmp_path / "cache")
+
+    scores = readability.readability_scores(
+        files, cache_dir=cache_dir, sections=True, max_workers=1
+    )
+    assert scores[str(two)]["words"] == 4
+    assert [s["heading"] for s in scores[str(one)]["sections"]] == ["Intro", "Details"]
+    first_calls = len(calls)
+
+    again = readability.readability_scores(
+        files, cache_dir=cache_dir, sections=True, max_workers=1
+    )
+    assert again == scores
+    assert len(calls) == first_calls
+
+    two.write_text("Now two sentences. Both are short.\n", encoding="utf-8")
+    again = readability.readability_scores(
+        files, cache_dir=cache_dir, sections=True, max_workers=1
+    )
+    assert again[str(two)]["words"] == 6
+    assert len(calls) == first_calls + 2  # whole file and its single section
+    cache = readability.load_json(f"{cache_dir}/{readability.CACHE_FILE}")
+    assert len(cache) == 2
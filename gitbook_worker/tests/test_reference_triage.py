@@ -0,0 +1,86 @@
+import pytest
+
+from gitbook_worker.src.gitbook_worker import ai_tools
+from gitbook_worker.src.gitbook_worker.reference_triage import (
+    classify_reference,
+    isbn_valid,
+    triage_reference,
+)
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("1. https://example.com/a.", ("url", "https://example.com/a")),
+        ("2. [Python](https://docs.python.org)", ("url", "https://docs.python.org")),
+        ("3. DOI: 10.1000/xyz123", ("doi", "10.1000/xyz123")),
+        ("4. <https://doi.org/10.1038/nphys1170>", ("doi", "10.1038/nphys1170")),
+        ("- ISBN-10: 0-306-40615-2", ("isbn", "0-306-40615-2")),
+        ("5. Smith, J. (2020). Titel. https://doi.org/10.1/x", ("citation", None)),
+        ("6. Beispiel https://example.com", ("citation", None)),
+        ("7. https://a.org https://b.org", ("citation", None)),
+        ("8. [Kapitel](../kapitel.md)", ("citation", None)),
+    ],
+)
+def test_classify_reference(line, expected):
+    assert classify_reference(line) == expected
+
+
+def test_isbn_valid():
+    assert isbn_valid("978-3-16-148410-0")
+    assert isbn_valid("0-306-40615-2")
+    assert isbn_valid("080442957X")
+    assert not isbn_valid("978-3-16-148410-1")
+    assert not isbn_valid("12345")
+
+
+def test_triage_reference():
+    checked = []
+
+    def check_link(url):
+        checked.append(url)
+        return url.endswith("ok")
+
+    status = {"https://bekannt.org": False}
+    result = triage_reference("1. ISBN 978-3-16-148410-0", status, check_link)
+    assert result["success"] and result["type"] == "external reference"
+    assert triage_reference("1. ISBN 978-3-16-148410-1", status, check_link) is None
+    assert triage_reference("2. https://x.org/ok", status, check_link)["success"]
+    assert triage_reference("3. https://bekannt.org", status, check_link) is None
+    assert triage_reference("4. Müller: Buch, 2019", status, check_link) is None
+    assert checked == ["https://x.org/ok"]
+
+
+def test_external_references_send_only_suspicious(tmp_path, monkeypatch):
+    md = tmp_path / "a.md"
+    md.write_text(
+        "## Quellen\n"
+        "1. DOI: 10.1000/abc\n"
+        "2. [Doku](https://example.com/ok)\n"
+        "3. Müller, A. (2019). Ein Buch. Verlag.\n"
+        "4. https://example.com/kaputt\n"
+    )
+    prompts = []
+
+    def fake_ask(prompt, ai_url, ai_api_key, ai_provider, schema=None):
+        prompts.append(prompt)
+        return True, {"success": True, "new": None}
+
+    monkeypatch.setattr(ai_tools, "ask_ai", fake_ask)
+    report = ai_tools.proof_and_repair_external_references(
+        [str(md)],
+        "",
+        "",
+        "",
+        "genai",
+        triage=True,
+        link_status={
+            "https://example.com/ok": True,
+            "https://example.com/kaputt": False,
+        },
+    )
+
+    assert [e["checked_by"] for e in report] == ["local", "local", "ai", "ai"]
+    assert all(e["action"] == "link_check_succeeded" for e in report)
+    assert len(prompts) == 2
+    assert "Müller" in prompts[0] or "Müller" in prompts[1]
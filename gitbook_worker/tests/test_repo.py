@@ -1,3 +1,9 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
 from gitbook_worker.src.gitbook_worker import repo
 
 
@@ -48,3 +54,146 @@ def test_clone_force_reclones_nonrepo(tmp_path, monkeypatch):
 
     assert removed == [str(clone_dir)]
     assert any(cmd[:2] == ["git", "clone"] for cmd in calls)
+
+
+def test_clone_strategy_args(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run(cmd, cwd=None, capture_output=False, input_text=None):
+        calls.append(cmd)
+        return ("", "", 0) if capture_output else None
+
+    monkeypatch.setattr(repo, "run", fake_run)
+    for strategy in ("shallow", "partial"):
+        stats = repo.clone_or_update_repo(
+            "url", str(tmp_path / strategy), branch_name="main", strategy=strategy
+        )
+        assert stats["strategy"] == strategy
+    assert [cmd[2:-2] for cmd in calls if cmd[:2] == ["git", "clone"]] == [
+        ["--depth", "1", "--branch", "main"],
+        ["--filter=blob:none", "--branch", "main"],
+    ]
+
+
+def test_sparse_patterns(tmp_path):
+    (tmp_path / "kapitel").mkdir()
+    (tmp_path / "SUMMARY.md").write_text(
+        "* [Eins](kapitel/eins.md)\n* [Zwei](zwei.md)\n", encoding="utf-8"
+    )
+    (tmp_path / "kapitel" / "eins.md").write_text(
+        "![a](../bilder/a.png) ![b](https://example.com/b.png)\n"
+        '<img src="/.gitbook/assets/c.png">\n',
+        encoding="utf-8",
+    )
+    patterns = repo.sparse_patterns(str(tmp_path))
+    assert patterns == repo.SPARSE_BASE_PATTERNS + [
+        "/kapitel/eins.md",
+        "/bilder/",
+        "/zwei.md",
+    ]
+
+
+def make_source_repo(src):
+    (src / "kapitel").mkdir(parents=True)
+    (src / "bilder").mkdir()
+    (src / "alt").mkdir()
+    (src / "SUMMARY.md").write_text("* [Eins](kapitel/eins.md)\n", encoding="utf-8")
+    (src / "kapitel" / "eins.md").write_text("![a](../bilder/a.png)\n", encoding="utf-8")
+    (src / "bilder" / "a.png").write_bytes(b"png")
+    (src / "alt" / "gross.bin").write_bytes(b"x" * 1000)
+
+    def git(*args):
+        subprocess.run(["git", "-C", str(src), *args], check=True, capture_output=True)
+
+    git("init", "-b", "main")
+    git("add", ".")
+    git("-c", "user.name=t", "-c", "user.email=t@example.com", "commit", "-m", "init")
+    git("config", "uploadpack.allowFilter", "true")
+    return src.as_uri()
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_sparse_clone_checks_out_book_only(tmp_path):
+    url = make_source_repo(tmp_path / "src")
+    clone_dir = tmp_path / "clone"
+    stats = repo.clone_or_update_repo(
+        url, str(clone_dir), branch_name="main", strategy="sparse"
+    )
+    assert (clone_dir / "kapitel" / "eins.md").is_file()
+    assert (clone_dir / "bilder" / "a.png").is_file()
+    assert not (clone_dir / "alt").exists()
+    assert stats["worktree_bytes"] < 1000 and stats["git_bytes"] > 0
+
+
+def test_mirror_path():
+    path = repo.mirror_path("https://github.com/user/mein-buch.git", "/m")
+    assert path.startswith(os.path.join("/m", "mein-buch-")) and path.endswith(".git")
+    assert path != repo.mirror_path("https://gitlab.com/user/mein-buch.git", "/m")
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_clones_borrow_objects_from_mirror(tmp_path):
+    url = make_source_repo(tmp_path / "src")
+    mirror_dir = str(tmp_path / "mirrors")
+    for name in ("a", "b"):
+        repo.clone_or_update_repo(
+            url, str(tmp_path / name), branch_name="main", mirror_dir=mirror_dir
+        )
+        counts = subprocess.run(
+            ["git", "-C", str(tmp_path / name), "count-objects", "-v"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        assert "in-pack: 0" in counts and "count: 0" in counts
+        assert (tmp_path / name / "SUMMARY.md").is_file()
+    assert len(os.listdir(mirror_dir)) == 1
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_update_skipped_when_remote_has_not_moved(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    url = make_source_repo(src)
+    clone_dir = tmp_path / "clone"
+    first = repo.clone_or_update_repo(url, str(clone_dir), branch_name="main")
+    assert first["changed"] and first["head"]
+    (clone_dir / "build.log").write_text("artifact", encoding="utf-8")
+
+    calls = []
+    real_run = repo.run
+
+    def spy_run(cmd, *args, **kwargs):
+        calls.append(cmd[3] if cmd[:2] == ["git", "-C"] else cmd[1])
+        return real_run(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(repo, "run", spy_run)
+    second = repo.clone_or_update_repo(
+        url, str(clone_dir), branch_name="main", force=True
+    )
+    assert second["head"] == first["head"] and not second["changed"]
+    assert not {"fetch", "reset", "clean"} & set(calls)
+    assert (clone_dir / "build.log").is_file()
+
+    (src / "SUMMARY.md").write_text("* [Neu](kapitel/eins.md)\n", encoding="utf-8")
+    subprocess.run(
+        ["git", "-C", str(src), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+        + ["commit", "-qam", "update"],
+        check=True,
+    )
+    third = repo.clone_or_update_repo(
+        url, str(clone_dir), branch_name="main", force=True
+    )
+    assert third["changed"] and third["head"] != first["head"]
+    assert "fetch" in calls
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_has_local_changes(tmp_path):
+    src = tmp_path / "src"
+    make_source_repo(src)
+    assert not repo.has_local_changes(str(src))
+    (src / "neu.md").write_text("# Neu\n", encoding="utf-8")
+    assert repo.has_local_changes(str(src))
+    assert not repo.has_local_changes(str(src), untracked=False)
+    (src / "kapitel" / "eins.md").write_text("geändert\n", encoding="utf-8")
+    assert repo.has_local_changes(str(src), untracked=False)
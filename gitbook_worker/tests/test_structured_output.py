@@ -0,0 +1,91 @@
+import json
+
+from gitbook_worker.src.gitbook_worker import ai_tools, rate_limit
+from gitbook_worker.src.gitbook_worker.structured_output import (
+    gemini_schema,
+    openai_response_format,
+    parse_json_answer,
+    validate_json,
+)
+
+VALID = {
+    "success": True,
+    "org": "1. Quelle",
+    "new": None,
+    "validation_date": "2024-01-01",
+    "type": "external url",
+}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"candidates": [{"content": {"parts": [{"text": self.text}]}}]}
+
+
+def test_validate_json():
+    schema = ai_tools.REFERENCE_SCHEMA
+    assert validate_json(VALID, schema) == []
+    assert validate_json({**VALID, "new": 3}, schema) == [
+        "$.new: expected string or null, got int"
+    ]
+    assert validate_json({**VALID, "type": "buch"}, schema)
+    assert validate_json({k: v for k, v in VALID.items() if k != "org"}, schema) == [
+        "$: missing 'org'"
+    ]
+    batch = {"results": [{**VALID, "id": "ref-1"}, VALID]}
+    assert validate_json(batch, ai_tools.REFERENCE_BATCH_SCHEMA) == [
+        "$.results[1]: missing 'id'"
+    ]
+    assert parse_json_answer('```json\n{"a": 1}\n```') == (True, {"a": 1})
+
+
+def test_provider_schemas():
+    schema = gemini_schema(ai_tools.REFERENCE_SCHEMA)
+    assert schema["type"] == "OBJECT"
+    assert schema["properties"]["new"] == {
+        "type": "STRING",
+        "nullable": True,
+        "description": ai_tools.REFERENCE_SCHEMA["properties"]["new"]["description"],
+    }
+    assert schema["properties"]["type"]["enum"][-1] == "?"
+    assert openai_response_format("gpt-4o-mini", {}, "r")["type"] == "json_schema"
+    assert openai_response_format("gpt-4-turbo", {}, "r") == {"type": "json_object"}
+    assert openai_response_format("gpt-4", {}, "r") is None
+    assert openai_response_format(ai_tools.OPENAI_MODEL, {}, "r")["type"] == "json_schema"
+
+
+def test_ask_ai_structured_output(monkeypatch):
+    payloads = []
+    answers = ['{"success": "ja"}', json.dumps(VALID)]
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        payloads.append(json)
+        return FakeResponse(answers.pop(0))
+
+    monkeypatch.setattr(ai_tools.requests, "post", fake_post)
+    rate_limit.configure_rate_limit("genai")
+
+    success, result = ai_tools.ask_ai(
+        "p", "url", "key", "genai", schema=ai_tools.REFERENCE_SCHEMA
+    )
+    assert success and result == VALID
+    config = payloads[0]["generationConfig"]
+    assert config["responseMimeType"] == "application/json"
+    assert config["responseSchema"]["required"][0] == "success"
+    # The invalid first answer was asked for once more.
+    assert len(payloads) == 2
+
+    answers.extend(["kein JSON", "auch kein JSON", json.dumps(VALID)])
+    success, error = ai_tools.ask_ai(
+        "p", "url", "key", "genai", schema=ai_tools.REFERENCE_SCHEMA
+    )
+    assert not success and error.startswith("[GenAI] Ungültige Antwort")
+    assert len(payloads) == 4
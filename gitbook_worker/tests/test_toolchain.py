@@ -0,0 +1,105 @@
+import types
+
+import pytest
+
+from gitbook_worker.src.gitbook_worker import docker_tools, toolchain, utils
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    cache_file = tmp_path / "toolchain.json"
+    monkeypatch.setenv("GITBOOK_WORKER_TOOLCHAIN_CACHE", str(cache_file))
+    monkeypatch.setattr(toolchain, "_memory", {})
+    return cache_file
+
+
+def test_pandoc_version_cached_until_binary_changes(monkeypatch):
+    probes = []
+    key = {"value": "/usr/bin/pandoc:1"}
+    monkeypatch.setattr(toolchain, "binary_key", lambda name: key["value"])
+    monkeypatch.setattr(
+        toolchain, "_probe_pandoc_version", lambda: probes.append(1) or (3, 1, 12)
+    )
+    assert toolchain.pandoc_version() == (3, 1, 12)
+    toolchain._memory.clear()
+    assert toolchain.pandoc_version() == (3, 1, 12)
+    assert len(probes) == 1
+
+    key["value"] = "/usr/bin/pandoc:2"
+    toolchain.pandoc_version()
+    assert len(probes) == 2
+
+
+def test_font_families_cached_until_fontconfig_changes(monkeypatch):
+    probes = []
+    stamp = {"value": "1"}
+    monkeypatch.setattr(toolchain, "binary_key", lambda name: "/usr/bin/fc-list:1")
+    monkeypatch.setattr(toolchain, "fontconfig_stamp", lambda: stamp["value"])
+    monkeypatch.setattr(
+        toolchain,
+        "_probe_font_families",
+        lambda: probes.append(1) or frozenset({"dejavu sans", "openmoji color"}),
+    )
+    assert "dejavu sans" in toolchain.font_families()
+    toolchain._memory.clear()
+    toolchain.font_families()
+    assert len(probes) == 1
+
+    stamp["value"] = "2"
+    toolchain.font_families()
+    assert len(probes) == 2
+
+
+def test_font_available_uses_family_index(monkeypatch):
+    monkeypatch.setattr(utils.sys, "platform", "linux")
+    monkeypatch.setattr(
+        toolchain, "font_families", lambda: frozenset({"dejavu sans", "openmoji color"})
+    )
+    assert utils.font_available("DejaVu Sans")
+    assert utils.font_available("OpenMoji")
+    assert not utils.font_available("Segoe UI Emoji")
+
+
+def test_font_families_without_fontconfig(monkeypatch):
+    monkeypatch.setattr(toolchain, "binary_key", lambda name: None)
+    assert toolchain.font_families() == frozenset()
+
+
+def fake_image_docker(image):
+    def fake_docker(args):
+        value = image["label"] if "Labels" in args[3] else image["id"]
+        return types.SimpleNamespace(returncode=0, stdout=value + "\n", stderr="")
+
+    return fake_docker
+
+
+def test_ensure_docker_image_rebuilds_on_dockerfile_change(tmp_path, monkeypatch):
+    dockerfile = tmp_path / "Dockerfile"
+    dockerfile.write_text("FROM alpine\n")
+    image = {"id": "sha256:old", "label": "<no value>"}
+    builds = []
+
+    def fake_run(cmd, **kwargs):
+        builds.append(cmd)
+        image["id"] = f"sha256:new{len(builds)}"
+        image["label"] = cmd[cmd.index("--label") + 1].split("=", 1)[1]
+        return types.SimpleNamespace(returncode=0, stdout="", stderr="")
+
+    monkeypatch.setattr(docker_tools, "_docker", fake_image_docker(image))
+    monkeypatch.setattr(docker_tools.subprocess, "run", fake_run)
+
+    # An image without the Dockerfile label is rebuilt once and then reused.
+    assert docker_tools.ensure_docker_image("erda-pandoc", str(dockerfile)) == "sha256:new1"
+    assert docker_tools.ensure_docker_image("erda-pandoc", str(dockerfile)) == "sha256:new1"
+    assert len(builds) == 1
+
+    # A labelled image is reused without any local record, e.g. on a fresh
+    # cache or when it was built elsewhere.
+    image["id"] = "sha256:elsewhere"
+    monkeypatch.setenv("GITBOOK_WORKER_TOOLCHAIN_CACHE", str(tmp_path / "new.json"))
+    assert docker_tools.ensure_docker_image("erda-pandoc", str(dockerfile)) == "sha256:elsewhere"
+    assert len(builds) == 1
+
+    dockerfile.write_text("FROM alpine:3\n")
+    assert docker_tools.ensure_docker_image("erda-pandoc", str(dockerfile)) == "sha256:new2"
+    assert builds[-1][:2] == ["docker", "build"]
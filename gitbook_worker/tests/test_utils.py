@@ -1,6 +1,13 @@
 import shutil
+import sys
+import time
 import pytest
-from gitbook_worker.src.gitbook_worker.utils import get_pandoc_version, font_available
+from gitbook_worker.src.gitbook_worker.utils import (
+    TIMEOUT_EXIT_CODE,
+    font_available,
+    get_pandoc_version,
+    run_streaming,
+)
 
 
 @pytest.mark.skipif(shutil.which("pandoc") is None, reason="pandoc not installed")
@@ -12,3 +19,28 @@ def test_get_pandoc_version_format():
 
 def test_font_available_false():
     assert font_available("DefinitelyMissingFontXYZ") is False
+
+
+def test_run_streaming_keeps_tail():
+    lines = []
+    script = "import sys\nfor i in range(1000): print('line', i)\nprint('oops', file=sys.stderr)"
+    out, err, code = run_streaming(
+        [sys.executable, "-c", script],
+        tail_bytes=200,
+        on_line=lambda stream, line: lines.append((stream, line)),
+    )
+    assert code == 0
+    assert len(lines) == 1001
+    assert out.startswith("[... output truncated ...]")
+    assert out.endswith("line 999\n")
+    assert len(out) < 300
+    assert err == "oops\n"
+
+
+def test_run_streaming_timeout_kills_process_group():
+    start = time.monotonic()
+    script = "import subprocess, sys, time\nsubprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\ntime.sleep(30)"
+    _, err, code = run_streaming([sys.executable, "-c", script], timeout=1)
+    assert code == TIMEOUT_EXIT_CODE
+    assert "Timed out" in err
+    assert time.monotonic() - start < 15
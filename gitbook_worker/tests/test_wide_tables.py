@@ -91,3 +91,24 @@ def test_landscape_longtable(tmp_path):
     text = out_tex.read_text()
     assert "\\begin{ltablex}{\\linewidth}" in text
     assert "{XXXXXX}" in text
+
+
+@pytest.mark.skipif(shutil.which("pandoc") is None, reason="pandoc not installed")
+def test_landscape_renders_cells_inline(tmp_path):
+    md = tmp_path / "cells.md"
+    md.write_text(
+        "::: {.landscape cols=7}\n"
+        "|A|B|C|D|E|F|G|\n|--|--|--|--|--|--|--|\n|*x*|2|3|4|5|6|7|\n"
+        ":::\n"
+    )
+    filter_path = Path(__import__("gitbook_worker").__file__).with_name("landscape.lua")
+    out_tex = tmp_path / "out.tex"
+    cmd = ["pandoc", str(md), "-f", "gfm+fenced_divs", "-t", "latex",
+           "--lua-filter", str(filter_path), "-o", str(out_tex)]
+    _, _, code = run(cmd, capture_output=True)
+    assert code == 0
+    text = out_tex.read_text()
+    assert "\\begin{ltablex}{\\linewidth}{XXXXXXX}" in text
+    assert "\\emph{x} & 2 & 3" in text
+    assert "\\endhead" in text
+    assert "longtable" not in text